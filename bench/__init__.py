@@ -0,0 +1,6 @@
+"""
+オフラインのベンチマーク（GAS・LLM・埋め込み・ベクトルストアをローカルの代替に置き換えて全フローを計測する）
+
+    python -m bench.run                      # 全フローを計測して bench/baseline.json と比較
+    python -m bench.run --save-baseline      # 結果を基準値として保存
+"""
@@ -0,0 +1,138 @@
+"""
+GASのWebアプリ（gas/gas.js の doGet / doPost バッチモード）のローカル代替
+
+- GET ?type=yoin|anken|yoin_format|anken_format: start_date / end_date / limit / offset / id に対応し、
+  count_matched・next_offset を返す（新しい順。max_bytes による打ち切りはしない）
+- POST ?type=yoin|anken（{"records": [...]}）: 構造化済みレコードを yoin_format / anken_format に追加する。
+  同じIDの行は置き換える（GASの重複削除に相当）
+- latency 秒の応答遅延を入れられる（GASの実行時間の模擬）
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+from urllib.parse import parse_qs, urlparse
+
+# POSTされた構造化レコードのキー → シートの列名
+_STRUCT_COLUMNS = {
+    "yoin": [("id", "ID"), ("date", "受信日時"), ("name", "氏名"), ("age", "年齢"), ("skill", "スキル"),
+             ("station", "最寄駅"), ("work_style", "勤務形態（希望）"), ("price", "単価（希望）"), ("etc", "備考"),
+             ("subject", "メールタイトル"), ("raw_input", "本文")],
+    "anken": [("id", "ID"), ("date", "受信日時"), ("name", "案件名"), ("skill", "スキル"), ("station", "最寄駅"),
+              ("work_style", "勤務形態"), ("schedule", "期間"), ("price", "単価"), ("etc", "備考"),
+              ("subject", "メールタイトル"), ("raw_input", "本文")],
+}
+
+
+def _ymd(value: str) -> str:
+    return str(value or "").replace("-", "").replace("/", "")[:8]
+
+
+class FakeGasServer:
+    """127.0.0.1 の空きポートで起動するGASの代替（url をそのまま GAS_URL に使う）"""
+
+    def __init__(self, sheets: Dict[str, List[Dict[str, Any]]], latency: float = 0.0):
+        self.sheets = sheets
+        self.latency = latency
+        self.requests = {"GET": 0, "POST": 0}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-gas", daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/exec"
+
+    def start(self) -> "FakeGasServer":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def get(self, type_: str, query: Dict[str, str]) -> Dict[str, Any]:
+        with self._lock:
+            # doGet と同じく、未知の type は「gmail要員情報」を返す
+            rows = list(reversed(self.sheets.get(type_ if type_ in self.sheets else "yoin", [])))
+        if query.get("id"):
+            ids = {i.strip() for i in query["id"].split(",") if i.strip()}
+            records = [row for row in rows if str(row.get("ID")) in ids]
+            return {"type": type_, "count": len(records), "records": records}
+        start, end = query.get("start_date"), query.get("end_date")
+        matched = [row for row in rows
+                   if (not start or _ymd(row.get("受信日時")) >= start) and (not end or _ymd(row.get("受信日時")) <= end)]
+        limit = max(1, int(query.get("limit") or 100))
+        offset = max(0, int(query.get("offset") or 0))
+        records = matched[offset:offset + limit]
+        return {
+            "type": type_,
+            "count": len(records),
+            "count_matched": len(matched),
+            "truncated": False,
+            "next_offset": offset + len(records),
+            "records": records,
+        }
+
+    def post(self, type_: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        kind = "anken" if type_ == "anken" else "yoin"
+        columns = _STRUCT_COLUMNS[kind]
+        rows = [{column: record.get(key, "") or "" for key, column in columns}
+                for record in payload.get("records") or [] if isinstance(record, dict)]
+        ids = {row["ID"] for row in rows if row["ID"]}
+        with self._lock:
+            sheet = self.sheets.setdefault(f"{kind}_format", [])
+            before = len(sheet)
+            sheet[:] = [row for row in sheet if row.get("ID") not in ids] + rows
+            deleted = before + len(rows) - len(sheet)
+            count = len(sheet)
+        return {
+            "status": "success",
+            "type": f"{kind}_struct",
+            "received": len(rows),
+            "appended": len(rows),
+            "deletedDuplicates": {"sheet": deleted, "batch": 0, "pinecone": 0},
+            "recordCount": count,
+        }
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive（requests.Session の接続再利用を実環境と揃える）
+
+            def _query(self) -> Dict[str, str]:
+                return {key: values[-1] for key, values in parse_qs(urlparse(self.path).query).items()}
+
+            def _reply(self, body: Dict[str, Any]):
+                data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                query = self._query()
+                with server._lock:
+                    server.requests["GET"] += 1
+                time.sleep(server.latency)
+                self._reply(server.get(query.get("type", "yoin"), query))
+
+            def do_POST(self):
+                query = self._query()
+                length = int(self.headers.get("Content-Length") or 0)
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                with server._lock:
+                    server.requests["POST"] += 1
+                time.sleep(server.latency)
+                self._reply(server.post(query.get("type") or payload.get("type", "yoin"), payload))
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,177 @@
+"""
+ベンチマーク用のLLM・埋め込みの代替
+
+- FakeChatModel: プロンプトの種類（要員・案件の構造化、マッチング、グループ採点）を見て妥当なJSONを返す。
+  最初のトークンまでの遅延（latency）と出力の速さ（tokens_per_sec）を指定でき、ストリーミングにも対応する
+- FakeEmbeddings: テキストのハッシュから決まるベクトル（DeterministicFakeEmbedding）に呼び出しごとの遅延を足したもの
+"""
+
+import asyncio
+import hashlib
+import json
+import re
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+# 出力1トークンあたりの文字数（日本語を含むJSONの目安）
+CHARS_PER_TOKEN = 2
+# ストリーミングでチャンクを送る間隔（秒）。tokens_per_sec に応じて1回に送るトークン数を決める
+_TICK = 0.02
+
+
+def _field(text: str, key: str) -> str:
+    match = re.search(rf"^{re.escape(key)}[:：]\s*(.*)$", text, re.MULTILINE)
+    return match.group(1).strip() if match else ""
+
+
+def _tag(text: str, key: str) -> str:
+    match = re.search(rf"【{re.escape(key)}】\s*(.*)", text)
+    return match.group(1).strip() if match else ""
+
+
+def _score(*parts: str) -> int:
+    digest = hashlib.sha256("|".join(parts).encode("utf-8")).digest()
+    return 50 + digest[0] % 50
+
+
+def _candidates(prompt: str) -> List[Dict[str, str]]:
+    """build_matches_text の各ブロック（■ 要員ID: ... ）から要員の項目を取り出す"""
+    result = []
+    for block in re.split(r"(?=■ 要員ID:)", prompt):
+        match = re.match(r"■ 要員ID:\s*(\S+)", block)
+        if match:
+            result.append({"id": match.group(1), "block": block})
+    return result
+
+
+def fake_response(prompt: str) -> str:
+    """プロンプトに対するそれらしいJSON応答"""
+    if "「要員情報」を整理する" in prompt:
+        skill = _field(prompt, "スキル")
+        return json.dumps({
+            "id": _field(prompt, "ID"), "date": _field(prompt, "受信日時"), "name": _field(prompt, "氏名"),
+            "age": _field(prompt, "年齢"), "skill": "\n".join(f"- {s.strip(' -')}" for s in skill.split("/") if s.strip(" -")),
+            "station": _field(prompt, "最寄駅"), "work_style": _field(prompt, "勤務形態"),
+            "price": _field(prompt, "単価"), "etc": _field(prompt, "備考"), "subject": _field(prompt, "件名"),
+        }, ensure_ascii=False)
+    if "「案件情報」を整理する" in prompt:
+        return json.dumps({
+            "id": _field(prompt, "ID"), "date": _field(prompt, "受信日時"), "name": _field(prompt, "案件名"),
+            "skill": "\n".join(f"- {s}" for s in _field(prompt, "スキル").split("、") if s),
+            "station": _field(prompt, "最寄駅"), "work_style": _field(prompt, "勤務形態"),
+            "schedule": _field(prompt, "期間"), "price": _field(prompt, "単価"), "etc": _field(prompt, "備考"),
+            "subject": _field(prompt, "件名"),
+        }, ensure_ascii=False)
+    candidates = _candidates(prompt)
+    if '"scores"' in prompt:
+        return json.dumps({"scores": [{
+            "要員ID": c["id"], "マッチ度": _score(prompt[:200], c["id"]), "スキルのマッチ度": "⚪",
+            "勤務形態のマッチ度": "◎", "単価のマッチ度": "△", "理由コメント": "スキル・勤務形態が概ね一致",
+            "推奨アクション": "単価の調整可否を確認",
+        } for c in candidates]}, ensure_ascii=False)
+    ranked = sorted(candidates, key=lambda c: -_score(prompt[:200], c["id"]))[:5]
+    return json.dumps({
+        "candidates": [{
+            "要員ID": c["id"],
+            "受信日時": _tag(c["block"], "受信日時"),
+            "要員情報": {
+                "氏名": _tag(c["block"], "氏名"), "年齢": _tag(c["block"], "年齢"), "スキル": _tag(c["block"], "スキル"),
+                "希望単価": _tag(c["block"], "単価（希望）"), "最寄駅": _tag(c["block"], "最寄駅"), "都道府県": "東京都",
+                "希望勤務形態": _tag(c["block"], "勤務形態（希望）"), "備考": _tag(c["block"], "備考"),
+            },
+            "マッチ度": _score(prompt[:200], c["id"]),
+            "理由コメント": "重点キーワードの経験があり、勤務形態も一致",
+        } for c in ranked],
+        "比較チャート": [{_tag(c["block"], "氏名") or c["id"]: {
+            "スキルのマッチ度": "⚪", "勤務形態のマッチ度": "◎", "単価のマッチ度": "△"}} for c in ranked],
+        "推奨アクション": [f"{_tag(c['block'], '氏名') or c['id']}は単価の調整可否を確認" for c in ranked],
+    }, ensure_ascii=False)
+
+
+class FakeChatModel(BaseChatModel):
+    """遅延と出力速度を指定できるチャットモデルの代替（API呼び出しなし）"""
+
+    latency: float = 0.5
+    """最初のトークンまでの秒数"""
+    tokens_per_sec: float = 80.0
+    """出力の速さ（トークン/秒）"""
+
+    @property
+    def _llm_type(self) -> str:
+        return "bench-fake"
+
+    def _reply(self, messages: List[BaseMessage]):
+        prompt = "\n".join(str(message.content) for message in messages)
+        text = fake_response(prompt)
+        usage = {
+            "input_tokens": max(1, len(prompt) // CHARS_PER_TOKEN),
+            "output_tokens": max(1, len(text) // CHARS_PER_TOKEN),
+        }
+        usage["total_tokens"] = usage["input_tokens"] + usage["output_tokens"]
+        return text, usage
+
+    def _duration(self, text: str) -> float:
+        return self.latency + len(text) / CHARS_PER_TOKEN / max(self.tokens_per_sec, 1e-6)
+
+    def _pieces(self, text: str) -> Iterator[str]:
+        size = max(1, round(self.tokens_per_sec * _TICK)) * CHARS_PER_TOKEN
+        for start in range(0, len(text), size):
+            yield text[start:start + size]
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        text, usage = self._reply(messages)
+        time.sleep(self._duration(text))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text, usage_metadata=usage))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        text, usage = self._reply(messages)
+        await asyncio.sleep(self._duration(text))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text, usage_metadata=usage))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        text, usage = self._reply(messages)
+        time.sleep(self.latency)
+        for piece in self._pieces(text):
+            if run_manager:
+                run_manager.on_llm_new_token(piece)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+            time.sleep(_TICK)
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=usage))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any):
+        text, usage = self._reply(messages)
+        await asyncio.sleep(self.latency)
+        for piece in self._pieces(text):
+            if run_manager:
+                await run_manager.on_llm_new_token(piece)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+            await asyncio.sleep(_TICK)
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=usage))
+
+
+class FakeEmbeddings(DeterministicFakeEmbedding):
+    """同じテキストには常に同じベクトルを返す埋め込み（latency は1回の呼び出しごとの秒数）"""
+
+    latency: float = 0.0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self.latency)
+        return super().embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(self.latency)
+        return super().embed_query(text)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        await asyncio.sleep(self.latency)
+        return super().embed_query(text)
@@ -0,0 +1,128 @@
+"""
+ベンチマーク用のシートデータ（乱数のシードが同じなら毎回同じ内容）
+
+- yoin / anken: GASの「gmail要員情報」「gmail案件情報」に相当するメール（ID・受信日時・件名・本文）
+- yoin_format: 「最新要員情報」に相当する構造化済みの要員（index_yoin_flow の入力）
+- matching_queries: matching_yoin_flow に渡す案件JSON
+"""
+
+import random
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+from index_checkpoint import JST
+
+SKILLS = ["Java", "Spring Boot", "Python", "Django", "React", "TypeScript", "AWS", "Go", "PHP", "Laravel",
+          "C#", ".NET", "Vue.js", "Kubernetes", "Terraform", "SQL", "Oracle", "Swift", "Kotlin", "PM"]
+STATIONS = ["渋谷駅", "新宿駅", "品川駅", "横浜駅", "大宮駅", "千葉駅", "大阪駅", "京都駅", "名古屋駅", "博多駅"]
+WORK_STYLES = ["フルリモート", "リモート併用", "常駐"]
+SURNAMES = "ASKTNHMYRW"
+
+YOIN_FORMAT_HEADERS = ["ID", "受信日時", "氏名", "年齢", "スキル", "最寄駅", "勤務形態（希望）", "単価（希望）", "備考",
+                       "メールタイトル", "本文"]
+
+
+# 受信日時の基準日。実行日によらず毎回同じ内容になり、カセットの記録をいつでもそのまま再生できる
+# （matching の受信日時フィルタは bench/run.py で MATCH_RECENCY_DAYS=0 にして外す）
+REFERENCE_DATE = datetime(2026, 1, 9, tzinfo=JST)
+
+
+def _received_at(rng: random.Random, now: datetime) -> str:
+    return (now - timedelta(minutes=rng.randint(0, 14 * 24 * 60))).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _yoin(rng: random.Random, index: int, now: datetime) -> Dict[str, Any]:
+    skills = rng.sample(SKILLS, rng.randint(2, 5))
+    return {
+        "ID": f"Y{index:06d}",
+        "受信日時": _received_at(rng, now),
+        "氏名": f"{rng.choice(SURNAMES)}.{rng.choice(SURNAMES)}",
+        "年齢": str(rng.randint(24, 58)),
+        "スキル": "\n".join(f"- {skill} {rng.randint(1, 10)}年" for skill in skills),
+        "最寄駅": rng.choice(STATIONS),
+        "勤務形態（希望）": rng.choice(WORK_STYLES),
+        "単価（希望）": f"{rng.randint(45, 95)}万円",
+        "備考": rng.choice(["即日可", "来月から稼働可", "面談調整可", "週4日希望", ""]),
+    }
+
+
+def yoin_mail(yoin: Dict[str, Any]) -> Dict[str, Any]:
+    """要員のメール（構造化前）"""
+    body = "\n".join([
+        "お世話になっております。下記要員のご紹介です。",
+        f"氏名: {yoin['氏名']}",
+        f"年齢: {yoin['年齢']}",
+        f"スキル: {yoin['スキル'].replace(chr(10), ' / ')}",
+        f"最寄駅: {yoin['最寄駅']}",
+        f"勤務形態: {yoin['勤務形態（希望）']}",
+        f"単価: {yoin['単価（希望）']}",
+        f"備考: {yoin['備考']}",
+        "ご検討のほどよろしくお願いいたします。" * 4,
+    ])
+    subject = f"【要員】{yoin['スキル'].splitlines()[0][2:]} {yoin['氏名']}"
+    return {"ID": yoin["ID"], "受信日時": yoin["受信日時"], "件名": subject, "本文": body}
+
+
+def yoin_format_row(yoin: Dict[str, Any]) -> Dict[str, Any]:
+    """構造化済みの要員（「最新要員情報」の1行）"""
+    mail = yoin_mail(yoin)
+    return {**{key: yoin.get(key, "") for key in YOIN_FORMAT_HEADERS}, "メールタイトル": mail["件名"], "本文": mail["本文"]}
+
+
+def _anken(rng: random.Random, index: int, now: datetime) -> Dict[str, Any]:
+    skills = rng.sample(SKILLS, rng.randint(2, 4))
+    return {
+        "ID": f"A{index:06d}",
+        "受信日時": _received_at(rng, now),
+        "案件名": f"{skills[0]}を用いた業務システム開発",
+        "必須スキル": "、".join(skills),
+        "重点キーワード": skills[0],
+        "作業場所": rng.choice(STATIONS),
+        "勤務形態": rng.choice(WORK_STYLES),
+        "単価": f"{rng.randint(55, 100)}万円",
+        "期間": "即日〜長期",
+        "備考": rng.choice(["外国籍不可", "面談1回", "リーダー経験歓迎", ""]),
+    }
+
+
+def anken_mail(anken: Dict[str, Any]) -> Dict[str, Any]:
+    """案件のメール（構造化前）"""
+    body = "\n".join([
+        "お世話になっております。下記案件のご紹介です。",
+        f"案件名: {anken['案件名']}",
+        f"スキル: {anken['必須スキル']}",
+        f"最寄駅: {anken['作業場所']}",
+        f"勤務形態: {anken['勤務形態']}",
+        f"期間: {anken['期間']}",
+        f"単価: {anken['単価']}",
+        f"備考: {anken['備考']}",
+        "ご提案お待ちしております。" * 4,
+    ])
+    return {"ID": anken["ID"], "受信日時": anken["受信日時"], "件名": f"【案件】{anken['案件名']}", "本文": body}
+
+
+def build_sheets(yoin_count: int, anken_count: int, seed: int = 0) -> Dict[str, List[Dict[str, Any]]]:
+    """GASのシート名（type）→ 行のリスト（古い順。GASと同じく取得時は新しい順に返す）"""
+    rng = random.Random(seed)
+    now = REFERENCE_DATE
+    yoins = [_yoin(rng, i, now) for i in range(yoin_count)]
+    ankens = [_anken(rng, i, now) for i in range(anken_count)]
+    yoins.sort(key=lambda row: row["受信日時"])
+    ankens.sort(key=lambda row: row["受信日時"])
+    return {
+        "yoin": [yoin_mail(yoin) for yoin in yoins],
+        "anken": [anken_mail(anken) for anken in ankens],
+        "yoin_format": [yoin_format_row(yoin) for yoin in yoins],
+        "anken_format": [],
+    }
+
+
+def matching_queries(count: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """matching_yoin_flow に渡す案件（案件の構造化結果と同じキー）"""
+    rng = random.Random(seed + 1)
+    now = REFERENCE_DATE
+    queries = []
+    for i in range(count):
+        anken = _anken(rng, i, now)
+        queries.append({key: anken[key] for key in ("案件名", "必須スキル", "重点キーワード", "作業場所", "勤務形態", "単価", "備考")})
+    return queries
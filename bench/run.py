@@ -0,0 +1,329 @@
+"""
+オフラインのベンチマークを実行して基準値（bench/baseline.json）と比較する
+
+フローごとに子プロセス（python -m bench.run --child FLOW）で実行するため、ピークRSSはフロー単位の値になる。
+子プロセスでは ChatOpenAI / OpenAIEmbeddings を bench.fakes の代替に差し替え、
+VECTOR_BACKEND=local と作業ディレクトリ内のキャッシュ・インデックスを使う（APIキー・ネットワーク不要）
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from typing import Any, Dict, List
+
+FLOWS = ["format_yoin", "format_anken", "index_yoin", "matching_yoin", "matching_yoin_stream"]
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# 比較する指標 → 大きいほど良いか
+METRICS = {
+    "records_per_sec": True,
+    "p50_ms": False,
+    "p95_ms": False,
+    "ttfe_ms": False,
+    "ttft_ms": False,
+    "peak_rss_mb": False,
+}
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+    return round(ordered[index], 1)
+
+
+def peak_rss_mb() -> float:
+    # Linux の ru_maxrss はKB単位
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+# ---- 子プロセス（1フローを実行して結果をJSONで書き出す） ----
+
+def install_fakes(args):
+    """ChatOpenAI / OpenAIEmbeddings を代替に差し替える（コールバック・レート制限・キャッシュは本番と同じ経路を通る）"""
+    import job_matching_flow as jm
+    from bench.fakes import FakeChatModel, FakeEmbeddings
+
+    def chat_model(**kwargs):
+        return FakeChatModel(
+            latency=args.llm_latency, tokens_per_sec=args.tokens_per_sec,
+            callbacks=kwargs.get("callbacks"), rate_limiter=kwargs.get("rate_limiter"),
+        )
+
+    jm.ChatOpenAI = chat_model
+    jm.OpenAIEmbeddings = lambda **kwargs: FakeEmbeddings(size=1536, latency=args.embed_latency)
+    return jm
+
+
+def span_collector(names):
+    import timing
+    samples = []
+    timing.add_observer(lambda name, ms: samples.append(ms) if name in names else None)
+    return samples
+
+
+def run_format(jm, flow: str, args) -> Dict[str, Any]:
+    samples = span_collector({"llm_structuring"})
+    params = {"limit": args.anken if flow == "format_anken" else args.yoin,
+              "concurrency": args.concurrency, "no_cache": "true"}
+    started = time.perf_counter()
+    stats = (jm.format_anken_flow if flow == "format_anken" else jm.format_yoin_flow)(params)
+    return {"records": stats.get("processed", 0), "failed": stats.get("failed", 0),
+            "elapsed": time.perf_counter() - started, "latencies": samples}
+
+
+def run_index(jm, args) -> Dict[str, Any]:
+    samples = span_collector({"index_batch"})
+    started = time.perf_counter()
+    stats = jm.index_yoin_flow({"limit": args.yoin})
+    return {"records": stats.get("indexed", 0), "failed": stats.get("failed", 0),
+            "elapsed": time.perf_counter() - started, "latencies": samples}
+
+
+async def run_matching(jm, args) -> Dict[str, Any]:
+    from bench.fixtures import matching_queries
+    queries = [json.dumps(q, ensure_ascii=False) for q in matching_queries(args.matching_requests, args.seed)]
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies, failed = [], 0
+
+    async def one(query: str):
+        nonlocal failed
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await jm.amatching_yoin_flow(query)
+                latencies.append((time.perf_counter() - started) * 1000)
+            except Exception as e:
+                failed += 1
+                print(f"matching failed: {e}")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(q) for q in queries))
+    return {"records": len(latencies), "failed": failed, "elapsed": time.perf_counter() - started,
+            "latencies": latencies}
+
+
+async def run_matching_stream(jm, args) -> Dict[str, Any]:
+    from bench.fixtures import matching_queries
+    queries = [json.dumps(q, ensure_ascii=False) for q in matching_queries(args.matching_requests, args.seed)]
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies, first_events, first_tokens, failed = [], [], [], 0
+
+    async def one(query: str):
+        nonlocal failed
+        async with semaphore:
+            started = time.perf_counter()
+            first_event = first_token = None
+            error = None
+            async for event in jm.matching_yoin_flow_stream(query):
+                elapsed = (time.perf_counter() - started) * 1000
+                # 進捗表示（status）ではなく、結果を含む最初のイベントまでの時間
+                if event.get("type") not in ("status", "llm_chunk") and first_event is None:
+                    first_event = elapsed
+                if event.get("type") == "llm_chunk" and first_token is None:
+                    first_token = elapsed
+                if event.get("type") == "error":
+                    error = event.get("message")
+            if error:
+                failed += 1
+                print(f"matching stream failed: {error}")
+                return
+            latencies.append((time.perf_counter() - started) * 1000)
+            first_events.append(first_event)
+            if first_token is not None:
+                first_tokens.append(first_token)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(q) for q in queries))
+    return {"records": len(latencies), "failed": failed, "elapsed": time.perf_counter() - started,
+            "latencies": latencies, "first_events": first_events, "first_tokens": first_tokens}
+
+
+def run_child(args):
+    with open(args.log, "a", encoding="utf-8") as log, redirect_stdout(log):
+        jm = install_fakes(args)
+        if args.child in ("format_yoin", "format_anken"):
+            raw = run_format(jm, args.child, args)
+        elif args.child == "index_yoin":
+            raw = run_index(jm, args)
+        elif args.child == "matching_yoin":
+            raw = asyncio.run(run_matching(jm, args))
+        else:
+            raw = asyncio.run(run_matching_stream(jm, args))
+    elapsed = raw["elapsed"]
+    result = {
+        "records": raw["records"],
+        "failed": raw["failed"],
+        "elapsed_sec": round(elapsed, 2),
+        "records_per_sec": round(raw["records"] / elapsed, 2) if elapsed > 0 else 0.0,
+        "p50_ms": percentile(raw["latencies"], 0.5),
+        "p95_ms": percentile(raw["latencies"], 0.95),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    if "first_events" in raw:
+        result["ttfe_ms"] = percentile(raw["first_events"], 0.5)
+        result["ttft_ms"] = percentile(raw["first_tokens"], 0.5)
+    with open(args.result, "w", encoding="utf-8") as f:
+        json.dump(result, f)
+
+
+# ---- 親プロセス ----
+
+def child_env(args, gas_url: str, workdir: str) -> Dict[str, str]:
+    cache = lambda name: os.path.join(workdir, name)
+    env = dict(os.environ)
+    env.update({
+        "GAS_URL": gas_url,
+        "VECTOR_BACKEND": "local",
+        "LOCAL_VECTOR_DIR": cache("vectors"),
+        "EMBEDDING_CACHE_PATH": cache("embeddings.sqlite3"),
+        "LLM_CACHE_PATH": cache("llm_responses.sqlite3"),
+        "LEXICAL_INDEX_DIR": cache("lexical"),
+        "INDEX_CHECKPOINT_PATH": cache("index_yoin_checkpoint.json"),
+        "JOB_DB_PATH": cache("jobs.sqlite3"),
+        "OPENAI_API_KEY": "bench",
+        "LLM_PROVIDER": "openai",
+        "LLM_MODEL": "gpt4o_mini",
+        "LLM_ROUTING": "false",
+        "LLM_HEDGE": "false",
+        "STREAM_STAGE_DELAY": "0",
+        # フィクスチャの受信日時は固定の基準日から決まるので、実行日からの期間では絞らない
+        "MATCH_RECENCY_DAYS": "0",
+    })
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [root, env.get("PYTHONPATH")]))
+    return env
+
+
+def spawn(flow: str, args, env: Dict[str, str], workdir: str) -> Dict[str, Any]:
+    result_path = os.path.join(workdir, f"{flow}.json")
+    command = [
+        sys.executable, "-m", "bench.run", "--child", flow, "--result", result_path,
+        "--log", os.path.join(workdir, "flows.log"),
+        "--yoin", str(args.yoin), "--anken", str(args.anken), "--seed", str(args.seed),
+        "--llm-latency", str(args.llm_latency), "--tokens-per-sec", str(args.tokens_per_sec),
+        "--embed-latency", str(args.embed_latency), "--matching-requests", str(args.matching_requests),
+        "--concurrency", str(args.concurrency),
+    ]
+    subprocess.run(command, env=env, check=True)
+    with open(result_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def workload(args) -> Dict[str, Any]:
+    """基準値と一緒に保存する負荷のパラメータ（異なるパラメータの基準値とは比較しても意味がない）"""
+    return {key: getattr(args, key) for key in (
+        "yoin", "anken", "seed", "llm_latency", "tokens_per_sec", "embed_latency", "gas_latency",
+        "matching_requests", "concurrency")}
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]], tolerance: float) -> List[str]:
+    """結果の表を出力し、基準値より tolerance 以上悪化した指標を返す"""
+    regressions = []
+    print(f"{'flow':<22}{'metric':<17}{'value':>11}{'baseline':>11}{'delta':>9}")
+    for flow, result in results.items():
+        base = baseline.get(flow, {})
+        for metric, higher_is_better in METRICS.items():
+            if metric not in result:
+                continue
+            value, reference = result[metric], base.get(metric)
+            line = f"{flow:<22}{metric:<17}{value:>11}"
+            if reference:
+                delta = (value - reference) / reference
+                worse = -delta if higher_is_better else delta
+                line += f"{reference:>11}{delta:>+9.1%}"
+                if worse > tolerance:
+                    line += "  REGRESSION"
+                    regressions.append(f"{flow}.{metric}")
+            print(line)
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmark for all flows")
+    parser.add_argument("--flows", default=",".join(FLOWS), help="comma-separated flows to run")
+    parser.add_argument("--yoin", type=int, default=200, help="number of yoin records")
+    parser.add_argument("--anken", type=int, default=100, help="number of anken records")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="seconds to the first token")
+    parser.add_argument("--tokens-per-sec", type=float, default=200.0, help="LLM output rate")
+    parser.add_argument("--embed-latency", type=float, default=0.02, help="seconds per embedding call")
+    parser.add_argument("--gas-latency", type=float, default=0.05, help="seconds per GAS request")
+    parser.add_argument("--matching-requests", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="save the results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed regression ratio")
+    parser.add_argument("--fail-on-regression", action="store_true", help="exit 1 if any metric regressed")
+    parser.add_argument("--workdir", help="directory for caches and indexes (default: a temporary directory)")
+    parser.add_argument("--child", choices=FLOWS, help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    parser.add_argument("--log", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.child:
+        return run_child(args)
+
+    from bench.fake_gas import FakeGasServer
+    from bench.fixtures import build_sheets
+
+    flows = [flow.strip() for flow in args.flows.split(",") if flow.strip()]
+    unknown = [flow for flow in flows if flow not in FLOWS]
+    if unknown:
+        sys.exit(f"Unknown flows: {', '.join(unknown)}")
+
+    gas = FakeGasServer(build_sheets(args.yoin, args.anken, args.seed), latency=args.gas_latency).start()
+    tmp = None if args.workdir else tempfile.TemporaryDirectory(prefix="bench-")
+    workdir = args.workdir or tmp.name
+    os.makedirs(workdir, exist_ok=True)
+    env = child_env(args, gas.url, workdir)
+    results = {}
+    try:
+        # マッチングだけを計測する場合も、先に要員を登録しておく（計測には含めない）
+        if "index_yoin" not in flows and any(flow.startswith("matching") for flow in flows):
+            print("Setup: index_yoin")
+            spawn("index_yoin", args, env, workdir)
+        for flow in sorted(flows, key=FLOWS.index):
+            print(f"Running {flow}...")
+            results[flow] = spawn(flow, args, env, workdir)
+            print(f"  {results[flow]}")
+    finally:
+        gas.stop()
+        print(f"Fake GAS requests: {gas.requests}")
+        if tmp is not None:
+            tmp.cleanup()
+        else:
+            print(f"Flow logs: {os.path.join(workdir, 'flows.log')}")
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    params = workload(args)
+    if baseline.get("_params", params) != params:
+        print(f"Warning: the baseline was recorded with {baseline['_params']}; this run used {params}")
+    regressions = compare(results, baseline, args.tolerance)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({**baseline, **results, "_params": params}, f, ensure_ascii=False, indent=2)
+        print(f"Baseline saved: {args.baseline}")
+    elif regressions:
+        print(f"Regressions (>{args.tolerance:.0%}): {', '.join(regressions)}")
+        if args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+"""
+LLM・埋め込みの呼び出しの記録と再生（カセット）
+
+- record: 実際に呼び出し、リクエストのハッシュ → 応答（ストリームはチャンクごとの経過時間も）を追記する
+- replay: 記録済みの応答を返す（APIを呼ばない。未記録のリクエストは CassetteMissError）
+- auto: 記録があれば再生し、なければ呼び出して記録する
+
+カセットはgzip圧縮のJSON Lines（1行1件、同じキーは後の行が優先）。埋め込みはテキスト単位に float32 で保存し、
+バッチの切り方が変わっても再生できる。再生時は記録時の待ち時間を speed 倍速で再現する（0 で待たない）。
+"""
+
+import asyncio
+import base64
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from array import array
+from typing import Any, Dict, Iterator, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+MODES = ("off", "record", "replay", "auto")
+
+
+class CassetteMissError(LookupError):
+    """replay モードで記録のないリクエストを受けた"""
+
+
+class Cassette:
+    """キー → 記録（dict）のカセット（複数スレッドから利用できる）"""
+
+    def __init__(self, path: str, mode: str = "replay", speed: float = 1.0):
+        if mode not in MODES:
+            raise ValueError(f"Unsupported cassette mode '{mode}'")
+        self.path = path
+        self.mode = mode
+        self.speed = max(0.0, float(speed))
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries[entry["key"]] = entry
+
+    @property
+    def recording(self) -> bool:
+        return self.mode in ("record", "auto")
+
+    def lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        """再生する記録（record モード、または auto で未記録の場合は None）"""
+        entry = None if self.mode == "record" else self._entries.get(key)
+        with self._lock:
+            if entry is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if entry is None and self.mode == "replay":
+            raise CassetteMissError(f"No recording for request {key[:12]} in {self.path}")
+        return entry
+
+    def record(self, entry: Dict[str, Any]):
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n"
+        with self._lock:
+            self._entries[entry["key"]] = entry
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            # gzipはメンバーを連結したファイルもそのまま読める → 1件ずつ追記する
+            with gzip.open(self.path, "at", encoding="utf-8") as f:
+                f.write(line)
+            self.recorded += 1
+
+    def delay(self, elapsed_ms: float) -> float:
+        """記録時の経過時間（ミリ秒）→ 再生時に待つ秒数"""
+        return elapsed_ms / 1000 / self.speed if self.speed > 0 else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {"name": "cassette", "mode": self.mode, "entries": len(self._entries), "hits": self.hits,
+                    "misses": self.misses, "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+                    "recorded": self.recorded}
+
+
+def request_key(*parts: Any) -> str:
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 1)
+
+
+def _message_content(entry: Dict[str, Any]) -> str:
+    if entry.get("chunks") is not None:
+        return "".join(text for _, text in entry["chunks"])
+    return entry.get("content", "")
+
+
+class CassetteChatModel(BaseChatModel):
+    """チャットモデルの呼び出しを記録・再生するラッパー
+
+    記録時は underlying の invoke / stream をそのまま使う（コールバック・レート制限は underlying 側で動く）。
+    同期・非同期、ストリーム・非ストリームのどの呼び出し方で記録したものも、どの呼び出し方でも再生できる
+    """
+
+    underlying: BaseChatModel
+    cassette: Cassette
+    identity: Dict[str, Any]
+
+    @property
+    def _llm_type(self) -> str:
+        return f"cassette-{self.underlying._llm_type}"
+
+    @property
+    def root_async_client(self):
+        # LLM_WARMUP_CONNECT の接続確立（再生のみの場合は接続しない）
+        return getattr(self.underlying, "root_async_client", None) if self.cassette.recording else None
+
+    def _key(self, messages: List[BaseMessage], stop: Optional[List[str]], kwargs: Dict[str, Any]) -> str:
+        return request_key(self.identity, [[m.type, m.content] for m in messages], stop, kwargs)
+
+    def _entry(self, key: str, messages: List[BaseMessage], **fields) -> Dict[str, Any]:
+        return {"key": key, "kind": "chat", "model": f"{self.identity.get('provider')}:{self.identity.get('model')}",
+                "prompt": str(messages[-1].content)[:120] if messages else "", **fields}
+
+    def _replay_result(self, entry: Dict[str, Any]) -> ChatResult:
+        message = AIMessage(content=_message_content(entry), usage_metadata=entry.get("usage"))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _replay_chunks(self, entry: Dict[str, Any]):
+        """(再生開始からの秒数, チャンク) の列（非ストリームの記録は1チャンクにまとめる）"""
+        chunks = entry.get("chunks")
+        if chunks is None:
+            chunks = [[entry.get("elapsed_ms", 0), entry.get("content", "")]]
+        for index, (offset_ms, text) in enumerate(chunks):
+            last = index == len(chunks) - 1
+            usage = entry.get("usage") if last else None
+            yield self.cassette.delay(offset_ms), ChatGenerationChunk(
+                message=AIMessageChunk(content=text, usage_metadata=usage))
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        key = self._key(messages, stop, kwargs)
+        entry = self.cassette.lookup(key)
+        if entry is not None:
+            time.sleep(self.cassette.delay(entry.get("elapsed_ms", 0)))
+            return self._replay_result(entry)
+        started = time.perf_counter()
+        message = self.underlying.invoke(messages, stop=stop, **kwargs)
+        self.cassette.record(self._entry(key, messages, content=message.content, usage=message.usage_metadata,
+                                         elapsed_ms=_elapsed_ms(started)))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        key = self._key(messages, stop, kwargs)
+        entry = self.cassette.lookup(key)
+        if entry is not None:
+            await asyncio.sleep(self.cassette.delay(entry.get("elapsed_ms", 0)))
+            return self._replay_result(entry)
+        started = time.perf_counter()
+        message = await self.underlying.ainvoke(messages, stop=stop, **kwargs)
+        self.cassette.record(self._entry(key, messages, content=message.content, usage=message.usage_metadata,
+                                         elapsed_ms=_elapsed_ms(started)))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        key = self._key(messages, stop, kwargs)
+        entry = self.cassette.lookup(key)
+        started = time.perf_counter()
+        if entry is not None:
+            for offset, chunk in self._replay_chunks(entry):
+                time.sleep(max(0.0, offset - (time.perf_counter() - started)))
+                if run_manager and chunk.text:
+                    run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+            return
+        chunks, usage = [], None
+        for message in self.underlying.stream(messages, stop=stop, **kwargs):
+            chunks.append([_elapsed_ms(started), message.content])
+            usage = message.usage_metadata or usage
+            chunk = ChatGenerationChunk(message=message)
+            if run_manager and chunk.text:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+        self.cassette.record(self._entry(key, messages, chunks=chunks, usage=usage, elapsed_ms=_elapsed_ms(started)))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any):
+        key = self._key(messages, stop, kwargs)
+        entry = self.cassette.lookup(key)
+        started = time.perf_counter()
+        if entry is not None:
+            for offset, chunk in self._replay_chunks(entry):
+                await asyncio.sleep(max(0.0, offset - (time.perf_counter() - started)))
+                if run_manager and chunk.text:
+                    await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+            return
+        chunks, usage = [], None
+        async for message in self.underlying.astream(messages, stop=stop, **kwargs):
+            chunks.append([_elapsed_ms(started), message.content])
+            usage = message.usage_metadata or usage
+            chunk = ChatGenerationChunk(message=message)
+            if run_manager and chunk.text:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+        # 途中でキャンセルされたストリーム（ヘッジの敗者など）は記録しない
+        self.cassette.record(self._entry(key, messages, chunks=chunks, usage=usage, elapsed_ms=_elapsed_ms(started)))
+
+
+def _pack(vector: List[float]) -> str:
+    return base64.b64encode(array("f", vector).tobytes()).decode("ascii")
+
+
+def _unpack(data: str) -> List[float]:
+    return array("f", base64.b64decode(data)).tolist()
+
+
+class CassetteEmbeddings(Embeddings):
+    """埋め込みの呼び出しをテキスト単位で記録・再生するラッパー"""
+
+    def __init__(self, underlying: Embeddings, model_name: str, cassette: Cassette):
+        self.underlying = underlying
+        self.model_name = model_name
+        self.cassette = cassette
+
+    def _key(self, text: str) -> str:
+        return request_key("embedding", self.model_name, text)
+
+    def _lookup(self, texts: List[str]):
+        keys = [self._key(text) for text in texts]
+        return keys, [self.cassette.lookup(key) for key in keys]
+
+    def _record(self, keys: List[str], texts: List[str], vectors: List[List[float]], elapsed_ms: float):
+        # 呼び出しの所要時間はテキストに均等に割り振る
+        share = round(elapsed_ms / max(1, len(texts)), 1)
+        for key, text, vector in zip(keys, texts, vectors):
+            self.cassette.record({"key": key, "kind": "embedding", "model": self.model_name, "prompt": text[:120],
+                                  "vector": _pack(vector), "elapsed_ms": share})
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, entries = self._lookup(texts)
+        missing = [i for i, entry in enumerate(entries) if entry is None]
+        time.sleep(self.cassette.delay(sum(e.get("elapsed_ms", 0) for e in entries if e is not None)))
+        vectors = [_unpack(entry["vector"]) if entry is not None else None for entry in entries]
+        if missing:
+            started = time.perf_counter()
+            fresh = self.underlying.embed_documents([texts[i] for i in missing])
+            self._record([keys[i] for i in missing], [texts[i] for i in missing], fresh, _elapsed_ms(started))
+            for i, vector in zip(missing, fresh):
+                vectors[i] = vector
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        (key,), (entry,) = self._lookup([text])
+        if entry is not None:
+            time.sleep(self.cassette.delay(entry.get("elapsed_ms", 0)))
+            return _unpack(entry["vector"])
+        started = time.perf_counter()
+        vector = self.underlying.embed_query(text)
+        self._record([key], [text], [vector], _elapsed_ms(started))
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        (key,), (entry,) = self._lookup([text])
+        if entry is not None:
+            await asyncio.sleep(self.cassette.delay(entry.get("elapsed_ms", 0)))
+            return _unpack(entry["vector"])
+        started = time.perf_counter()
+        vector = await self.underlying.aembed_query(text)
+        self._record([key], [text], [vector], _elapsed_ms(started))
+        return vector
@@ -0,0 +1,60 @@
+"""
+文書埋め込みのキャッシュ
+正規化した文書テキストと埋め込みモデル名のハッシュをキーに、DiskLRUCache に float32 で保存する
+"""
+
+import hashlib
+from array import array
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+
+from disk_cache import DiskLRUCache
+
+
+def normalize_document_text(text: str) -> str:
+    """キャッシュキー用の正規化（行頭のインデント・連続空白・改行の差を無視する）"""
+    return " ".join(text.split())
+
+
+class CachedEmbeddings(Embeddings):
+    """embed_documents の前段に置く埋め込みキャッシュ
+
+    同じテキスト（正規化後）・同じモデルの埋め込みは再計算しない。
+    embed_query はキャッシュせずそのまま委譲する（検索クエリは別途メモリ上でキャッシュする）。
+    """
+
+    def __init__(self, underlying: Embeddings, model_name: str, cache: DiskLRUCache):
+        self.underlying = underlying
+        self.model_name = model_name
+        self.cache = cache
+
+    def cache_key(self, text: str) -> str:
+        payload = f"{self.model_name}\n{normalize_document_text(text)}"
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self.cache_key(t) for t in texts]
+        found = self.cache.get_many(keys)
+
+        # 未キャッシュ分だけをまとめて埋め込む（同一バッチ内の重複は1回だけ）
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        if missing:
+            vectors = self.underlying.embed_documents(list(missing.values()))
+            encoded = {key: array("f", vec).tobytes() for key, vec in zip(missing, vectors)}
+            self.cache.put_many(encoded)
+            found.update(encoded)
+
+        return [array("f", found[key]).tolist() for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.underlying.embed_query(text)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self.underlying.aembed_query(text)
+
+    def cache_stats(self):
+        return self.cache.stats()
@@ -251,6 +251,9 @@ function getSheetData(sheetName, options) {
   let bytes = 0;
   const commaBytes = Utilities.newBlob(",").getBytes().length;
   let skipped = 0;
+  let truncated = false; // maxBytes で打ち切った場合 true（続きは next_offset から取得）
+  let matched = 0;       // 日付条件に一致する行数（offset・limit に関係なく全行を数える。進捗の合計件数用）
+  let done = false;
 
   for (const row of allValues) {
     if (!row.some(v => v !== "" && v != null)) continue;
@@ -264,6 +267,8 @@ function getSheetData(sheetName, options) {
       if (startTime && t < startTime) continue;
       if (endTime && t > endTime) continue;
     }
+    matched++;
+    if (done) continue;
 
   
     // --- offset ---
@@ -284,18 +289,26 @@ function getSheetData(sheetName, options) {
 
     const piece = JSON.stringify(obj);
     const addBytes = (out.length ? commaBytes : 0) + Utilities.newBlob(piece).getBytes().length;
-    if (bytes + addBytes > maxBytes) break;
+    // 1件目は必ず返す（maxBytes を超える1件でページングが止まらないように）
+    if (out.length && bytes + addBytes > maxBytes) {
+      truncated = true;
+      done = true;
+      continue;
+    }
 
     out.push(obj);
     bytes += addBytes;
 
-    if (out.length >= limit) break;
+    if (out.length >= limit) done = true;
   }
 
   return {
     type: sheetName,
     count_total: lastRow - 1,
     count_returned: out.length,
+    count_matched: matched,
+    truncated: truncated,
+    next_offset: offset + out.length,
     records: out
   };
 }
@@ -369,6 +382,9 @@ function doGet(e) {
       },
     type: type,
     count: data.count_returned,
+    count_matched: data.count_matched,
+    truncated: !!data.truncated,
+    next_offset: (data.next_offset != null) ? data.next_offset : offset + (data.count_returned || 0),
     records: data.records
   });
 
@@ -632,6 +648,104 @@ function removeDuplicates(data, type) {
   };
 }
 
+/**
+ * 重複判定キーの一致判定（removeDuplicates と同じ条件）
+ * @param {Object} a - ヘッダ名に寄せた重複判定キー
+ * @param {Object} b - ヘッダ名に寄せた重複判定キー
+ * @param {'yoin_struct'|'anken_struct'} type
+ * @return {boolean}
+ */
+function dupKeyMatches(a, b, type) {
+  if (type === "anken_struct") {
+    return normalizeValue(a["案件名"]) === normalizeValue(b["案件名"]) &&
+      normalizeValue(a["必須スキル"]) === normalizeValue(b["必須スキル"]) &&
+      normalizeValue(a["作業場所"]) === normalizeValue(b["作業場所"]) &&
+      normalizeValue(a["勤務形態"]) === normalizeValue(b["勤務形態"]);
+  }
+  return normalizeValue(a["氏名"]) === normalizeValue(b["氏名"]) &&
+    ageMatches(a["年齢"], b["年齢"]) &&
+    normalizeValue(a["最寄駅"]) === normalizeValue(b["最寄駅"]);
+}
+
+/**
+ * 重複判定キーのバケット（年齢以外の完全一致部分）
+ * yoin は年齢が±1の幅で一致するため、バケット内で dupKeyMatches を再判定する
+ */
+function dupBucketKey(key, type) {
+  if (type === "anken_struct") {
+    return [key["案件名"], key["必須スキル"], key["作業場所"], key["勤務形態"]].map(normalizeValue).join("\u0000");
+  }
+  return [key["氏名"], key["最寄駅"]].map(normalizeValue).join("\u0000");
+}
+
+/**
+ * 重複除去（バッチ版）+ Pinecone同期削除
+ * シートは1回だけ読み込み、削除は連続行をまとめた deleteRows で行う
+ * @param {Object[]} keys - ヘッダ名に寄せた重複判定キーの配列
+ * @param {'yoin_struct'|'anken_struct'} type
+ * @param {string[]} extraPineconeIds - 追加で削除するベクターID（バッチ内で置き換えられたレコード）
+ * @return {Object} 削除結果 {sheetDeletedCount, pineconeResult}
+ */
+function removeDuplicatesBatch(keys, type, extraPineconeIds) {
+  const sheetName = SHEETS[type];
+  const sheet = SpreadsheetApp.getActiveSpreadsheet().getSheetByName(sheetName);
+  const deletePineconeIds = (type === "yoin_struct") ? (extraPineconeIds || []).slice() : [];
+  const deleteRows = [];
+
+  if (sheet && keys.length > 0) {
+    const values = sheet.getDataRange().getValues();
+    const headers = values[0] || [];
+
+    // バッチ内のキーをバケットにまとめる（行ごとの比較をバケット内に限定する）
+    const buckets = {};
+    keys.forEach(k => {
+      const bk = dupBucketKey(k, type);
+      (buckets[bk] = buckets[bk] || []).push(k);
+    });
+
+    for (let r = 1; r < values.length; r++) {
+      const rowObj = {};
+      headers.forEach((h, i) => rowObj[h] = normalizeValue(values[r][i]));
+
+      const candidates = buckets[dupBucketKey(rowObj, type)];
+      if (!candidates || !candidates.some(k => dupKeyMatches(rowObj, k, type))) continue;
+
+      deleteRows.push(r + 1); // header + 1
+      if (type === "yoin_struct" && rowObj["ID"]) {
+        deletePineconeIds.push(rowObj["ID"]);
+      }
+      console.log(`重複が見つかりました: ${rowObj["件名"] || rowObj["氏名"] || "不明"} (ID: ${rowObj["ID"]})`);
+    }
+
+    // 連続する行をまとめ、下から deleteRows で削除（行番号のずれを防ぐ）
+    let i = deleteRows.length - 1;
+    while (i >= 0) {
+      let start = deleteRows[i];
+      let count = 1;
+      while (i - count >= 0 && deleteRows[i - count] === start - 1) {
+        start--;
+        count++;
+      }
+      sheet.deleteRows(start, count);
+      i -= count;
+    }
+    if (deleteRows.length > 0) {
+      console.log(`${deleteRows.length}行の重複をシートから削除しました`);
+    }
+  }
+
+  // Pineconeから削除（要員データのみ、1回の呼び出しにまとめる）
+  let pineconeResult = { success: true, deletedCount: 0, message: "要員データ以外またはPineconeIDなし" };
+  if (deletePineconeIds.length > 0) {
+    pineconeResult = deletePineconeVectors(Array.from(new Set(deletePineconeIds)));
+  }
+
+  return {
+    sheetDeletedCount: deleteRows.length,
+    pineconeResult: pineconeResult
+  };
+}
+
 /**
  * 手動実行用：全行の重複を除去
  * @param {'yoin'|'anken'} type
@@ -895,8 +1009,138 @@ function removeAllDuplicates_anken() {
 }
 
 
+/*****************************************************
+ * 構造化レコード → removeDuplicates 用の重複判定キー（ヘッダ名）
+ *****************************************************/
+function buildDupKey(record, type) {
+  return (type === "yoin_struct")
+    ? {
+        "氏名": record.name || "",
+        "年齢": record.age || "",
+        "最寄駅": record.station || ""
+        // "スキル": record.skill || ""  // 使うならここも追加
+      }
+    : {
+        "案件名": record.name || "",
+        "必須スキル": record.skill || "",
+        "作業場所": record.station || "",      // ← あなたの列設計に合わせてる
+        "勤務形態": record.work_style || ""
+        // "時期": record.schedule || "",
+        // "単価": record.price || ""
+      };
+}
+
+/*****************************************************
+ * 構造化レコード → シートの1行分の値
+ *****************************************************/
+function buildStructRow(record, type) {
+  if (type === "yoin_struct") {
+    return [
+      record.id || "",
+      record.date || "",
+      record.name || "",
+      record.age || "",
+      record.skill || "",
+      record.station || "",
+      record.work_style || "",
+      record.price || "",
+      record.etc || "",
+      record.subject || "",
+      record.raw_input || ""
+    ];
+  }
+  return [
+    record.id || "",
+    record.date || "",
+    record.name || "",
+    record.skill || "",
+    record.station || "",
+    record.work_style || "",
+    record.schedule || "",
+    record.price || "",
+    record.etc || "",
+    record.subject || "",
+    record.raw_input || ""
+  ];
+}
+
+/*****************************************************
+ * ✅ doPostBatch - 複数レコードをまとめて書き戻す
+ * { type: "yoin"|"anken", records: [...] }
+ * - シート読み込み1回で重複判定（バッチ内の重複は後勝ち）
+ * - 重複行は連続範囲ごとに deleteRows
+ * - 挿入は setValues 1回、Pinecone削除も1回
+ *****************************************************/
+function doPostBatch(data) {
+  const type = (data.type === "anken") ? "anken_struct" : "yoin_struct";
+  const sheetName = SHEETS[type];
+
+  const ss = SpreadsheetApp.getActiveSpreadsheet();
+  const sheet = ss.getSheetByName(sheetName);
+  if (!sheet) throw new Error(`シート「${sheetName}」が見つかりません`);
+
+  const records = data.records.filter(r => r && typeof r === "object");
+  const keys = records.map(r => buildDupKey(r, type));
+
+  // バッチ内の重複：後ろのレコードと重複する前のレコードは挿入しない（1件ずつ送った場合と同じ結果）
+  const keep = [];
+  const replacedIds = [];
+  records.forEach((record, i) => {
+    let replaced = false;
+    for (let j = i + 1; j < records.length; j++) {
+      if (dupKeyMatches(keys[i], keys[j], type)) { replaced = true; break; }
+    }
+    if (!replaced) {
+      keep.push(record);
+    } else if (record.id) {
+      replacedIds.push(normalizeValue(record.id));
+    }
+  });
+
+  // ★ 挿入前に重複削除（古い方が消える）
+  const deleteResult = removeDuplicatesBatch(keep.map(r => buildDupKey(r, type)), type, replacedIds);
+  const logMessage = `事前重複削除(バッチ${records.length}件): シート${deleteResult.sheetDeletedCount}行, バッチ内${records.length - keep.length}件, Pinecone${deleteResult.pineconeResult.deletedCount}件`;
+  Logger.log(logMessage);
+  if (!deleteResult.pineconeResult.success) {
+    Logger.log(`Pinecone削除エラー: ${deleteResult.pineconeResult.error}`);
+  }
+
+  const logSheet = ss.getSheetByName('logs');
+  if (logSheet) {
+    logSheet.appendRow([
+      new Date(),
+      logMessage,
+      `Pinecone: ${deleteResult.pineconeResult.success ? '成功' : '失敗'}`,
+      deleteResult.pineconeResult.error || '-'
+    ]);
+  }
+
+  // 挿入（setValues 1回）
+  if (keep.length > 0) {
+    const rows = keep.map(r => buildStructRow(r, type));
+    sheet.getRange(sheet.getLastRow() + 1, 1, rows.length, rows[0].length).setValues(rows);
+  }
+
+  return ContentService.createTextOutput(JSON.stringify({
+    status: "success",
+    type,
+    sheet: sheetName,
+    received: records.length,
+    appended: keep.length,
+    deletedDuplicates: {
+      sheet: deleteResult.sheetDeletedCount,
+      batch: records.length - keep.length,
+      pinecone: deleteResult.pineconeResult.deletedCount,
+      pineconeSuccess: deleteResult.pineconeResult.success,
+      pineconeError: deleteResult.pineconeResult.error || null
+    },
+    recordCount: sheet.getLastRow() - 1
+  })).setMimeType(ContentService.MimeType.JSON);
+}
+
 /*****************************************************
  * ✅ doPost - Difyから構造化データをシートに書き戻す
+ * records 配列を含む場合はバッチモード（doPostBatch）
  *****************************************************/
 
 function doPost(e) {
@@ -906,6 +1150,10 @@ function doPost(e) {
     const raw = e.postData.contents;
     const data = JSON.parse(raw);
 
+    if (Array.isArray(data.records)) {
+      return doPostBatch(data);
+    }
+
     const record = data.record?.record || data.record || data || {};
     Logger.log(record);
 
@@ -923,21 +1171,7 @@ function doPost(e) {
     // ----------------------------
     // ★ ここが肝：removeDuplicates 用にヘッダ名へ寄せる
     // ----------------------------
-    const dupKey = (type === "yoin_struct")
-      ? {
-          "氏名": record.name || "",
-          "年齢": record.age || "",
-          "最寄駅": record.station || ""
-          // "スキル": record.skill || ""  // 使うならここも追加
-        }
-      : {
-          "案件名": record.name || "",
-          "必須スキル": record.skill || "",
-          "作業場所": record.station || "",      // ← あなたの列設計に合わせてる
-          "勤務形態": record.work_style || ""
-          // "時期": record.schedule || "",
-          // "単価": record.price || ""
-        };
+    const dupKey = buildDupKey(record, type);
 
     // ★ 挿入前に重複削除（古い方が消える）
     const deleteResult = removeDuplicates(dupKey, type);
@@ -966,35 +1200,7 @@ function doPost(e) {
     // ----------------------------
     // 挿入
     // ----------------------------
-    if (type === "yoin_struct") {
-      sheet.appendRow([
-        record.id || "",
-        record.date || "",
-        record.name || "",
-        record.age || "",
-        record.skill || "",
-        record.station || "",
-        record.work_style || "",
-        record.price || "",
-        record.etc || "",
-        record.subject || "",
-        record.raw_input || ""
-      ]);
-    } else {
-      sheet.appendRow([
-        record.id || "",
-        record.date || "",
-        record.name || "",
-        record.skill || "",
-        record.station || "",
-        record.work_style || "",
-        record.schedule || "",
-        record.price || "",
-        record.etc || "",
-        record.subject || "",
-        record.raw_input || ""
-      ]);
-    }
+    sheet.appendRow(buildStructRow(record, type));
 
     return ContentService.createTextOutput(JSON.stringify({
       status: "success",
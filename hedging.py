@@ -0,0 +1,117 @@
+"""
+LLMストリームのヘッジ（最初のトークンが遅いときに、同じリクエストを別のモデルにも送る）
+
+    async for kind, value in hedged_astream(open_stream, primary, backup, delay):
+        ...
+
+- open_stream(route) はそのモデルのチャンクの非同期イテレータを返す
+- delay 秒以内に primary の最初のトークンが届かなければ（または primary が先に失敗すれば）backup にも送る
+- 先に最初のトークンを返した方を採用し、もう一方は取り消す
+- kind は "hedge"（backup に送った。value は理由）、"winner"（value は結果の dict）、"chunk"（採用した方のチャンク）
+- 取り消した方にも入力は送っているので、無駄になったトークンはその入力トークン数と、受け取っていた出力の概算の合計
+"""
+
+import asyncio
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Tuple
+
+from ratelimit import estimate_tokens
+
+Route = Tuple[str, str]
+
+_DONE = object()
+
+
+class _Attempt:
+    """1つのモデルへのストリーミング呼び出し（チャンクはキューに溜め、最初のトークンで ready になる）"""
+
+    def __init__(self, route: Route, stream: AsyncIterator):
+        self.route = route
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.ready = asyncio.Event()  # 最初のトークンが届いた、またはストリームが終わった
+        self.completion_tokens = 0  # 受け取った出力のトークン数（usage がなければ文字列から概算）
+        self.error: Optional[BaseException] = None
+        self.task = asyncio.ensure_future(self._pump(stream))
+
+    async def _pump(self, stream: AsyncIterator):
+        try:
+            async for chunk in stream:
+                if chunk.content:
+                    self.completion_tokens += estimate_tokens(chunk.content)
+                    self.ready.set()
+                usage = getattr(chunk, "usage_metadata", None)
+                if usage and usage.get("output_tokens"):
+                    self.completion_tokens = usage["output_tokens"]
+                self.queue.put_nowait(chunk)
+        except Exception as e:
+            self.error = e
+            self.queue.put_nowait(e)
+        else:
+            self.queue.put_nowait(_DONE)
+        self.ready.set()
+
+
+async def _wait_ready(attempts, timeout: Optional[float]):
+    waiters = [asyncio.ensure_future(attempt.ready.wait()) for attempt in attempts]
+    try:
+        await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for waiter in waiters:
+            waiter.cancel()
+
+
+async def hedged_astream(open_stream: Callable[[Route], AsyncIterator], primary: Route, backup: Route = None,
+                         delay: float = None, prompt_tokens: int = 0) -> AsyncIterator[Tuple[str, Any]]:
+    """primary（必要なら backup も）のストリームを流す。両方とも最初のトークンの前に失敗したら最後の例外を送出する
+
+    prompt_tokens: 1回の呼び出しの入力トークン数（取り消した方の無駄として数える）
+    "winner" の value: {"route", "hedged", "wasted_tokens", "wasted_prompt_tokens", "wasted_completion_tokens"}
+    （取り消した方の入力トークン数と受け取っていた出力トークン数。wasted_tokens はその合計）
+    """
+    attempts = [_Attempt(primary, open_stream(primary))]
+    hedged = False
+    winner = None
+    last_error = None
+    try:
+        while winner is None:
+            await _wait_ready(attempts, delay if backup and not hedged else None)
+            for attempt in list(attempts):
+                if not attempt.ready.is_set():
+                    continue
+                if attempt.error is None:
+                    winner = attempt
+                    break
+                attempts.remove(attempt)  # 最初のトークンの前に失敗
+                last_error = attempt.error
+            if winner is not None:
+                break
+            if backup is not None and not hedged:
+                hedged = True
+                yield "hedge", "error" if last_error is not None else "timeout"
+                attempts.append(_Attempt(backup, open_stream(backup)))
+            elif not attempts:
+                raise last_error
+
+        wasted_prompt = wasted_completion = 0
+        for attempt in attempts:
+            if attempt is not winner:
+                attempt.task.cancel()
+                wasted_prompt += prompt_tokens
+                wasted_completion += attempt.completion_tokens
+        result: Dict[str, Any] = {
+            "route": winner.route,
+            "hedged": hedged,
+            "wasted_tokens": wasted_prompt + wasted_completion,
+            "wasted_prompt_tokens": wasted_prompt,
+            "wasted_completion_tokens": wasted_completion,
+        }
+        yield "winner", result
+        while True:
+            item = await winner.queue.get()
+            if item is _DONE:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield "chunk", item
+    finally:
+        for attempt in attempts:
+            attempt.task.cancel()
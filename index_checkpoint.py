@@ -0,0 +1,168 @@
+"""
+インクリメンタルRAG登録のチェックポイント
+最後に登録した受信日時（high-water mark）と、その時刻で登録済みのIDをJSONファイルに保存する
+"""
+
+import json
+import os
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+JST = timezone(timedelta(hours=9))
+
+# GASのシート上の日時表記（タイムゾーンなしはJSTとみなす）
+_LOCAL_FORMATS = ("%Y/%m/%d %H:%M:%S", "%Y/%m/%d %H:%M", "%Y/%m/%d", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d")
+
+
+def parse_received_at(value: Any) -> Optional[datetime]:
+    """受信日時をタイムゾーン付きdatetimeに変換（解釈できない場合は None）
+
+    - Date型のセルはGASのJSON化で "2026-01-09T01:30:00.000Z" のようなUTCのISO文字列になる
+    - 文字列のセルは "2026/01/09 10:30" のようなJST表記
+    """
+    if value is None:
+        return None
+    text = str(value).strip()
+    if not text:
+        return None
+    if "T" in text:
+        try:
+            parsed = datetime.fromisoformat(re.sub(r"Z$", "+00:00", text))
+        except ValueError:
+            return None
+        return parsed if parsed.tzinfo else parsed.replace(tzinfo=JST)
+    for fmt in _LOCAL_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).replace(tzinfo=JST)
+        except ValueError:
+            continue
+    return None
+
+
+class IndexCheckpoint:
+    """RAG登録の進捗（high-water mark と実行中の登録済みID）
+
+    - high_water: 登録が完了した最新の受信日時
+    - ids_at_high_water: high_water と同時刻で登録済みのID（同時刻の取りこぼし・二重登録を防ぐ）
+    - run_done: high_water より新しい登録済みID（と受信日時）。途中で落ちた場合や再試行する失敗がある場合、
+      次回はここにあるIDを読み飛ばして再開する
+    - poison: 何度実行しても登録できないID（受信日時が読めない・ドキュメントを作れない）と理由。
+      high-water mark を止めない
+    バッチごとの進捗は <path>.run に1行ずつ追記し、JSON本体は実行の最後にだけ書き直す
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.journal_path = f"{path}.run"
+        self.high_water: Optional[datetime] = None
+        self.ids_at_high_water = set()
+        self.run_done: Dict[str, Optional[datetime]] = {}
+        self.poison: Dict[str, str] = {}
+        self._load()
+
+    def _load(self):
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            self.high_water = parse_received_at(data.get("high_water"))
+            self.ids_at_high_water = set(data.get("ids_at_high_water", []))
+            self.poison = dict(data.get("poison") or {})
+            run = data.get("run") or {}
+            self.run_done = {record_id: parse_received_at(ts) for record_id, ts in (run.get("done") or {}).items()}
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # 書き込み途中で落ちた最後の行
+                    self.run_done[entry["id"]] = parse_received_at(entry.get("received_at"))
+
+    def save(self):
+        data = {
+            "high_water": self.high_water.isoformat() if self.high_water else None,
+            "ids_at_high_water": sorted(self.ids_at_high_water),
+            "poison": dict(sorted(self.poison.items())),
+            "run": {
+                "done": {record_id: ts.isoformat() if ts else None for record_id, ts in sorted(self.run_done.items())},
+            } if self.run_done else None,
+        }
+        # 書き込み途中で落ちても壊れないよう、一時ファイルから置き換える
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+
+    @property
+    def resuming(self) -> bool:
+        return bool(self.run_done)
+
+    def start_date(self) -> Optional[str]:
+        """GASの start_date（YYYYMMDD、JST）。high-water mark の日から取得する"""
+        if self.high_water is None:
+            return None
+        return self.high_water.astimezone(JST).strftime("%Y%m%d")
+
+    def is_pending(self, record_id: str, received_at: Optional[datetime]) -> bool:
+        """未登録のレコードかどうか"""
+        if record_id in self.run_done:
+            return False
+        if self.high_water is None:
+            return True
+        if received_at < self.high_water:
+            return False
+        if received_at == self.high_water and record_id in self.ids_at_high_water:
+            return False
+        return True
+
+    def mark_done(self, items: Iterable[Tuple[str, datetime]]):
+        """登録が完了したIDを記録する（バッチごとに呼ぶ。<path>.run に追記するだけで本体は書き直さない）"""
+        lines = []
+        for record_id, received_at in items:
+            self.run_done[record_id] = received_at
+            self.poison.pop(record_id, None)
+            lines.append(json.dumps({"id": record_id, "received_at": received_at.isoformat()}, ensure_ascii=False))
+        if not lines:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.journal_path)), exist_ok=True)
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+    def mark_poison(self, record_id: str, reason: str):
+        """再試行しても登録できないIDを記録する（high-water mark は止めない）"""
+        if record_id:
+            self.poison[record_id] = reason
+
+    def advance(self, retry_from: Optional[datetime] = None):
+        """high-water mark を進めて保存する
+
+        retry_from: 再試行する失敗（upsert の失敗など）のうち最も古い受信日時。
+        あれば high-water mark はその直前の登録済みまでに留め、それ以降の登録済みIDは次回のために残す
+        """
+        done = [(ts, record_id) for record_id, ts in self.run_done.items()
+                if ts is not None and (retry_from is None or ts < retry_from)]
+        if done:
+            run_max = max(ts for ts, _ in done)
+            ids_at_max = {record_id for ts, record_id in done if ts == run_max}
+            if self.high_water is None or run_max > self.high_water:
+                self.high_water = run_max
+                self.ids_at_high_water = ids_at_max
+            elif run_max == self.high_water:
+                self.ids_at_high_water |= ids_at_max
+        if retry_from is None:
+            self.run_done = {}
+        else:
+            self.run_done = {record_id: ts for record_id, ts in self.run_done.items() if ts is None or ts >= retry_from}
+        self.save()
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "high_water": self.high_water.isoformat() if self.high_water else None,
+            "ids_at_high_water": len(self.ids_at_high_water),
+            "resumed_done_ids": len(self.run_done),
+            "poison_ids": len(self.poison),
+        }
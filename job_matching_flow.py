@@ -1,82 +1,538 @@
 import os
 import json
+import functools
 import requests
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from langchain_pinecone import PineconeVectorStore
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import JsonOutputParser
 from pydantic import BaseModel, Field
-from typing import List, Dict, Any
-from prompts import MATCHING_PROMPT
+from typing import List, Dict, Any, Tuple
+from prompts import MATCHING_PROMPT, GROUP_SCORING_PROMPT
+from ttl_cache import TTLCache
+import timing
+import metrics
+import jobs
+import ratelimit
 import re
+import threading
 
 # Load environment variables
 load_dotenv()
 
 # Constants
-GAS_URL = "https://script.google.com/macros/s/AKfycbz2_SYNhkbrBjp1Zv7zB2tQKesGNNtjQGgFBLsl7DmLd3PohCFBG0ZT9ojNReBXa2Zv/exec"
+# GASのWebアプリのURL（ベンチマーク・検証用の別環境を指す場合は GAS_URL で上書き）
+GAS_URL = os.getenv(
+    "GAS_URL",
+    "https://script.google.com/macros/s/AKfycbz2_SYNhkbrBjp1Zv7zB2tQKesGNNtjQGgFBLsl7DmLd3PohCFBG0ZT9ojNReBXa2Zv/exec"
+)
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 PINECONE_INDEX_HOST = os.getenv("PINECONE_INDEX_HOST")
+# PineconeVectorStore の本文を入れるメタデータのキーと名前空間（write_vectors の直接 upsert も同じ値を使う）
+PINECONE_TEXT_KEY = "text"
+PINECONE_NAMESPACE = None  # 既定の名前空間
 
 # LLM設定 - 速度改善のためのマルチプロバイダー対応
 LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")  # openai, ai_studio, bedrock
 LLM_MODEL = os.getenv("LLM_MODEL")  # モデル名（省略時はデフォルト）
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")  # Google AI Studio Gemini API Key
 AWS_REGION = os.getenv("AWS_REGION", "ap-northeast-1")
+# APIの起動時にクライアントを作成しておくモデル（既定のモデルに追加、"provider:model" のカンマ区切り）
+LLM_WARMUP_MODELS = os.getenv("LLM_WARMUP_MODELS", "")
+# 起動時にOpenAIへの接続（TLS）も確立しておくか
+LLM_WARMUP_CONNECT = os.getenv("LLM_WARMUP_CONNECT", "true").lower() == "true"
+
+# マッチングのモデル自動選択（リクエストで provider / model を指定しない場合）。実測のレイテンシ・エラー率で順位を付け、
+# 品質（llm_config の quality）が LLM_ROUTING_MIN_QUALITY 以上のモデルから選ぶ。失敗時は次の順位のモデルで再試行
+LLM_ROUTING = os.getenv("LLM_ROUTING", "false").lower() == "true"
+LLM_ROUTING_MIN_QUALITY = int(os.getenv("LLM_ROUTING_MIN_QUALITY", "2"))
+# 候補（"provider:model" のカンマ区切り）。省略時は認証情報が設定されているプロバイダーの全モデル
+LLM_ROUTING_CANDIDATES = os.getenv("LLM_ROUTING_CANDIDATES", "")
+LLM_ROUTING_MAX_ATTEMPTS = int(os.getenv("LLM_ROUTING_MAX_ATTEMPTS", "3"))
+# サーキットブレーカー：連続失敗回数と、遮断してから再び試すまでの秒数
+LLM_ROUTING_FAILURE_THRESHOLD = int(os.getenv("LLM_ROUTING_FAILURE_THRESHOLD", "3"))
+LLM_ROUTING_COOLDOWN = float(os.getenv("LLM_ROUTING_COOLDOWN", "30"))
+# ストリーミングのマッチングのヘッジ：最初のトークンが LLM_HEDGE_DELAY 秒以内に来なければ別のモデルにも送り、先に始まった方を使う
+# ヘッジ先は LLM_HEDGE_MODEL（"provider:model"）、省略時は自動選択の次の候補。LLM_HEDGE_DELAY 省略時は直近の TTFT の p95
+# （計測が LLM_HEDGE_MIN_SAMPLES 件に満たないうちは LLM_HEDGE_INITIAL_DELAY 秒）
+LLM_HEDGE = os.getenv("LLM_HEDGE", "false").lower() == "true"
+LLM_HEDGE_MODEL = os.getenv("LLM_HEDGE_MODEL", "")
+LLM_HEDGE_DELAY = os.getenv("LLM_HEDGE_DELAY", "")
+LLM_HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", "0.95"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_HEDGE_INITIAL_DELAY = float(os.getenv("LLM_HEDGE_INITIAL_DELAY", "2"))
+
+# LLM・埋め込みのレート制限（llm_config.RATE_LIMITS のプロバイダーごとの rpm / tpm。マッチングを構造化・RAG登録より優先する）
+# 429 は retry-after（なければジッター付きの指数バックオフ）だけ待って RATE_LIMIT_MAX_RETRIES 回まで再試行する
+RATE_LIMIT = os.getenv("RATE_LIMIT", "true").lower() == "true"
+RATE_LIMIT_MAX_RETRIES = int(os.getenv("RATE_LIMIT_MAX_RETRIES", "5"))
+
+# 埋め込みモデルと文書埋め込みキャッシュ（SQLite、件数上限を超えるとLRUで退避）
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE", "true").lower() == "true"
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", ".cache/embeddings.sqlite3")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "50000"))
+
+# 要員のベクトルインデックス名
+YOIN_INDEX_NAME = "yoin2"
+# ベクトルストアのバックエンド（pinecone / local）。local はこのディレクトリ以下にインデックスごとに保存
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone").lower()
+LOCAL_VECTOR_DIR = os.getenv("LOCAL_VECTOR_DIR", ".cache/vectors")
+
+# マッチング検索のキャッシュ（クエリ埋め込み / 検索結果）：件数上限と有効期限（秒）
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "512"))
+QUERY_EMBEDDING_CACHE_TTL = float(os.getenv("QUERY_EMBEDDING_CACHE_TTL", "3600"))
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "256"))
+RETRIEVAL_CACHE_TTL = float(os.getenv("RETRIEVAL_CACHE_TTL", "300"))
+
+# 構造化プロンプトの応答キャッシュ（SQLite、件数上限を超えるとLRUで退避）
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE", "true").lower() == "true"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", ".cache/llm_responses.sqlite3")
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "20000"))
+
+# LLM・埋め込みの呼び出しの記録と再生（off / record / replay / auto）。CASSETTE_SPEED=0 で再生時に待たない
+CASSETTE_MODE = os.getenv("CASSETTE_MODE", "off").lower()
+CASSETTE_PATH = os.getenv("CASSETTE_PATH", ".cache/cassettes/default.jsonl.gz")
+CASSETTE_SPEED = float(os.getenv("CASSETTE_SPEED", "1"))
+
+# ハイブリッド検索（ベクトル検索 + スキル欄の語彙検索をRRFで統合）
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "true").lower() == "true"
+HYBRID_DEPTH = int(os.getenv("HYBRID_DEPTH", "40"))  # 統合前に各検索から取る件数
+RRF_K = int(os.getenv("RRF_K", "60"))
+LEXICAL_INDEX_DIR = os.getenv("LEXICAL_INDEX_DIR", ".cache/lexical")
+# RAG登録中に語彙インデックスをファイルに書き出す間隔（バッチ数）。書き出すたびに全体を書き直すため毎バッチにはしない
+LEXICAL_SAVE_BATCHES = int(os.getenv("LEXICAL_SAVE_BATCHES", "20"))
+
+# マッチング前の事前フィルタ（勤務形態・地域・単価のルールで明らかな不一致を除外）と単価の許容超過率
+PREFILTER_ENABLED = os.getenv("PREFILTER", "true").lower() == "true"
+PREFILTER_PRICE_TOLERANCE = float(os.getenv("PREFILTER_PRICE_TOLERANCE", "0.15"))
+# ベクトル検索へのメタデータフィルタ（事前フィルタと同じ条件 + 受信日時の期間）。期間は日数、0で期間の条件なし
+MATCH_FILTER = os.getenv("MATCH_FILTER", "true").lower() == "true"
+MATCH_RECENCY_DAYS = int(os.getenv("MATCH_RECENCY_DAYS", "28"))
+
+# 並列スコアリング（mode=parallel）：1グループの候補数、同時に実行するLLM呼び出し数、最終的に残す人数
+MATCH_GROUP_SIZE = int(os.getenv("MATCH_GROUP_SIZE", "4"))
+MATCH_PARALLELISM = int(os.getenv("MATCH_PARALLELISM", "5"))
+MATCH_TOP_N = int(os.getenv("MATCH_TOP_N", "5"))
+
+# マッチングのプロンプト：検索する候補数と、プロンプト全体の入力トークンの予算（収まる候補だけを検索順にLLMに渡す）
+MATCH_RETRIEVAL_K = int(os.getenv("MATCH_RETRIEVAL_K", "40"))
+# quickモード（検索結果だけを返す）の候補数
+MATCH_QUICK_K = int(os.getenv("MATCH_QUICK_K", "20"))
+MATCH_INPUT_TOKENS = int(os.getenv("MATCH_INPUT_TOKENS", "6000"))
+# 候補の整形：スキルは先頭から MATCH_SKILL_MAX_ITEMS 件、備考・メールタイトルは MATCH_FIELD_MAX_CHARS 文字まで
+MATCH_SKILL_MAX_ITEMS = int(os.getenv("MATCH_SKILL_MAX_ITEMS", "12"))
+MATCH_FIELD_MAX_CHARS = int(os.getenv("MATCH_FIELD_MAX_CHARS", "120"))
+
+# ストリームの llm_chunk に累積テキスト（accumulated）を付けるか（リクエストの include_accumulated で個別に指定可）
+STREAM_INCLUDE_ACCUMULATED = os.getenv("STREAM_INCLUDE_ACCUMULATED", "false").lower() == "true"
+
+# ストリームの各段階のあとに入れる待ち時間（秒）。0 でもイベントループには制御を返す
+STREAM_STAGE_DELAY = float(os.getenv("STREAM_STAGE_DELAY", "0"))
+
+# マッチング結果のストリームで、閉じた時点でイベントとして送る箇所
+MATCHING_STREAM_WATCH = {
+    ("candidates", "*"): "candidate_ready",
+    ("比較チャート", "*"): "comparison_ready",
+    ("推奨アクション",): "actions_ready",
+}
+
+# 構造化フローの同時実行数（LLM呼び出しの最大並列数）
+FORMAT_CONCURRENCY = int(os.getenv("FORMAT_CONCURRENCY", "4"))
+# 進捗ログを出力する間隔（件数）
+FORMAT_PROGRESS_INTERVAL = int(os.getenv("FORMAT_PROGRESS_INTERVAL", "10"))
+
+# GASからの読み込み：1ページの件数とHTTPタイムアウト（秒）
+GAS_PAGE_SIZE = int(os.getenv("GAS_PAGE_SIZE", "100"))
+GAS_TIMEOUT = float(os.getenv("GAS_TIMEOUT", "120"))
+
+# GASへの書き戻しを何件ずつまとめるか（doPostのバッチモード）
+GAS_POST_BATCH_SIZE = int(os.getenv("GAS_POST_BATCH_SIZE", "50"))
+GAS_POST_MAX_RETRIES = int(os.getenv("GAS_POST_MAX_RETRIES", "3"))
+
+# RAG登録：埋め込み1リクエストあたりの件数、upsert1回あたりの件数、並列ワーカー数、バッチごとの試行回数
+INDEX_BATCH_SIZE = int(os.getenv("INDEX_BATCH_SIZE", "64"))
+INDEX_UPSERT_CHUNK = int(os.getenv("INDEX_UPSERT_CHUNK", "32"))
+INDEX_WORKERS = int(os.getenv("INDEX_WORKERS", "4"))
+INDEX_MAX_RETRIES = int(os.getenv("INDEX_MAX_RETRIES", "3"))
+# インクリメンタル登録のチェックポイント（最後に登録した受信日時と同時刻のID）
+INDEX_CHECKPOINT_PATH = os.getenv("INDEX_CHECKPOINT_PATH", ".cache/index_yoin_checkpoint.json")
+
+# APIから同期処理を実行するスレッド数（イベントループを止めないため）
+# FLOW_WORKERS: 構造化・RAG登録フロー（長時間）、BLOCKING_WORKERS: マッチング中のベクトル検索など（短時間）
+FLOW_WORKERS = int(os.getenv("FLOW_WORKERS", "2"))
+BLOCKING_WORKERS = int(os.getenv("BLOCKING_WORKERS", "16"))
+
+# バックグラウンドジョブ（/format_yoin 等）の状態の保存先。同時実行数は FLOW_WORKERS
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", ".cache/jobs.sqlite3")
+
+# GASのdoGetが受け付けるクエリパラメータ
+GAS_QUERY_KEYS = ("start_date", "end_date", "limit", "offset", "cols", "body_len", "max_bytes", "id")
 
 # Initialize LangChain components (遅延初期化)
-llm = None
 embeddings = None
-vectorstore = None
+vectorstores: Dict[str, Any] = {}
+lexical_indexes: Dict[str, Any] = {}
+gas_session = None
+llm_cache = None
+cassette = None
+# LLMクライアントのレジストリ：(provider, model, streaming) → (client, identity)
+llm_clients: Dict[Tuple[str, str, bool], Tuple[Any, Dict[str, Any]]] = {}
+# クライアント作成中（ロック内）にルーター等の共有オブジェクトを初期化するため再入可能にする
+llm_clients_lock = threading.RLock()
+llm_router = None
+scheduler = None
+blocking_executors: Dict[str, Any] = {}
+job_manager = None
 
-def get_llm(provider=None):
-    """高速化対応のマルチプロバイダーLLM取得関数"""
-    global llm
-    if llm is None:
-        from llm_config import get_model_config
-        
-        current_provider = provider or LLM_PROVIDER
-        model_config = get_model_config(current_provider, LLM_MODEL)
-        
-        if current_provider == "ai_studio":
-            try:
-                from langchain_google_genai import ChatGoogleGenerativeAI
-                llm = ChatGoogleGenerativeAI(
-                    model=model_config["model"],
-                    temperature=model_config["temperature"],
-                    google_api_key=GEMINI_API_KEY
-                )
-                print(f"Using Google AI Studio {model_config['model']}: {model_config['description']}")
-            except ImportError:
-                print("Warning: langchain-google-genai not installed. Falling back to OpenAI")
-                current_provider = "openai"
-                model_config = get_model_config("openai", "gpt4o_mini")
-        
-        elif current_provider == "bedrock":
-            try:
-                from langchain_aws import ChatBedrock
-                llm = ChatBedrock(
-                    model_id=model_config["model_id"],
-                    region_name=model_config.get("region_name", AWS_REGION),
-                    model_kwargs={"temperature": model_config["temperature"]}
-                )
-                print(f"Using AWS Bedrock {model_config['model_id']}: {model_config['description']}")
-            except ImportError:
-                print("Warning: langchain-aws not installed. Falling back to OpenAI")
-                current_provider = "openai"
-                model_config = get_model_config("openai", "gpt4o_mini")
-        
-        if current_provider == "openai":
-            llm = ChatOpenAI(
-                model=model_config["model"], 
-                temperature=model_config["temperature"], 
-                api_key=OPENAI_API_KEY
+# マッチング検索のキャッシュ。インデックスの世代が変わると検索結果キャッシュは参照されなくなる
+query_embedding_cache = TTLCache(QUERY_EMBEDDING_CACHE_SIZE, QUERY_EMBEDDING_CACHE_TTL, name="query_embedding")
+retrieval_cache = TTLCache(RETRIEVAL_CACHE_SIZE, RETRIEVAL_CACHE_TTL, name="retrieval")
+index_generations: Dict[str, int] = {}
+index_generation_lock = threading.Lock()
+
+def llm_callbacks(provider: str, model: str, model_config: Dict[str, Any]) -> list:
+    """LLMクライアントに渡すコールバック（呼び出し数・トークン数・エラーのメトリクスと、ルーティング用の実測値）"""
+    from llm_router import RouterStatsHandler
+    return [
+        ratelimit.SchedulerHandler(get_scheduler(), provider),
+        metrics.LLMMetricsHandler(provider, model_config.get("model") or model_config.get("model_id")),
+        RouterStatsHandler(get_llm_router(), provider, model)
+    ]
+
+def router_metrics():
+    """/metrics 用：ルーティング候補ごとの実測レイテンシ・TTFT（EWMA）・エラー率・遮断状態"""
+    if llm_router is None:
+        return
+    for state in llm_router.snapshot():
+        labels = {"provider": state["provider"], "model": state["model"]}
+        if state["latency_ms"] is not None:
+            yield "llm_route_latency_ewma_seconds", "gauge", "EWMA LLM call latency used for routing", labels, state["latency_ms"] / 1000
+        if state["ttft_ms"] is not None:
+            yield "llm_route_ttft_ewma_seconds", "gauge", "EWMA time to first token used for routing", labels, state["ttft_ms"] / 1000
+        yield "llm_route_error_rate", "gauge", "EWMA LLM error rate used for routing", labels, state["error_rate"]
+        yield "llm_route_circuit_open", "gauge", "1 while the circuit breaker keeps the model out of routing", labels, int(state["circuit"] != "closed")
+
+def scheduler_metrics():
+    """/metrics 用：プロバイダー・優先度ごとの待ち件数・待ち時間・429の回数・残りの枠"""
+    if scheduler is None:
+        return
+    for state in scheduler.stats():
+        labels = {"provider": state["provider"], "priority": state["priority"]}
+        provider = {"provider": state["provider"]}
+        yield "llm_scheduler_queue_depth", "gauge", "Model calls waiting for a rate-limit slot", labels, state["queue_depth"]
+        yield "llm_scheduler_granted_total", "counter", "Model calls let through by the scheduler", labels, state["granted"]
+        yield "llm_scheduler_wait_seconds_total", "counter", "Time model calls spent waiting for a slot", labels, state["wait_seconds"]
+        if state["priority"] != ratelimit.PRIORITY_NAMES[ratelimit.INTERACTIVE]:
+            continue  # プロバイダー単位の値は1回だけ出す
+        yield "llm_rate_limited_total", "counter", "429 / throttling responses from the provider", provider, state["rate_limited"]
+        yield "llm_rate_limit_retries_total", "counter", "Retries after a 429 / throttling response", provider, state["retries"]
+        yield "llm_scheduler_blocked_seconds", "gauge", "Remaining pause after a 429 (retry-after or backoff)", provider, state["blocked_sec"]
+        if state["requests_available"] is not None:
+            yield "llm_scheduler_requests_available", "gauge", "Requests left in the per-minute bucket", provider, state["requests_available"]
+        if state["tokens_available"] is not None:
+            yield "llm_scheduler_tokens_available", "gauge", "Tokens left in the per-minute bucket", provider, state["tokens_available"]
+
+def cache_metrics():
+    """/metrics 用：各キャッシュのヒット数・ミス数・ヒット率・件数"""
+    caches = [query_embedding_cache.stats(), retrieval_cache.stats()]
+    if llm_cache is not None:
+        caches.append(llm_cache.stats())
+    if embeddings is not None and hasattr(embeddings, "cache_stats"):
+        caches.append(embeddings.cache_stats())
+    if cassette is not None:
+        caches.append(cassette.stats())
+    for stats in caches:
+        labels = {"cache": stats["name"]}
+        yield "cache_hits_total", "counter", "Cache hits", labels, stats["hits"]
+        yield "cache_misses_total", "counter", "Cache misses", labels, stats["misses"]
+        yield "cache_hit_ratio", "gauge", "Cache hit ratio since process start", labels, stats["hit_ratio"]
+        yield "cache_entries", "gauge", "Entries currently held by the cache", labels, stats["entries"]
+
+# 段階の所要時間をメトリクスに流す（GAS・ベクトルストア・埋め込みの呼び出しは依存先ごとのレイテンシにも記録）
+timing.add_observer(metrics.observe_stage)
+metrics.map_dependency_stages({
+    "gas_fetch": ("gas", "fetch"),
+    "gas_post": ("gas", "post"),
+    "query_embedding": ("embeddings", "embed_query"),
+    "vector_search": (VECTOR_BACKEND, "query"),
+    "vector_fetch": (VECTOR_BACKEND, "fetch"),
+    "index_upsert": (VECTOR_BACKEND, "upsert"),
+})
+metrics.register_collector(cache_metrics)
+metrics.register_collector(router_metrics)
+metrics.register_collector(scheduler_metrics)
+
+def get_blocking_executor(kind: str = "io"):
+    """同期処理用のスレッドプール（kind="flow" は構造化・RAG登録フロー用、"io" はそれ以外）"""
+    if kind not in blocking_executors:
+        from concurrent.futures import ThreadPoolExecutor
+        workers = FLOW_WORKERS if kind == "flow" else BLOCKING_WORKERS
+        blocking_executors[kind] = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix=f"blocking-{kind}")
+    return blocking_executors[kind]
+
+async def run_blocking(fn, *args, kind: str = "io", **kwargs):
+    """同期関数をスレッドプールで実行して結果を待つ（計測コンテキストは引き継ぐ）"""
+    import asyncio
+    return await asyncio.wrap_future(timing.submit_with_context(get_blocking_executor(kind), fn, *args, **kwargs))
+
+def get_job_manager():
+    """バッチフロー（構造化・RAG登録）のジョブ管理（FLOW_WORKERS 件まで同時に実行）"""
+    global job_manager
+    if job_manager is None:
+        job_manager = jobs.JobManager(
+            jobs.JobStore(JOB_DB_PATH),
+            {"format_yoin": format_yoin_flow, "format_anken": format_anken_flow, "index_yoin": index_yoin_flow},
+            get_blocking_executor("flow")
+        )
+    return job_manager
+
+def resolve_llm(provider: str = None, model: str = None) -> Tuple[str, str]:
+    """リクエストで指定された (provider, model) を llm_config.LLM_MODELS のキーに解決する
+
+    省略時は LLM_PROVIDER / LLM_MODEL。model だけの指定はそのモデルを持つプロバイダーを探す。
+    一覧にない組み合わせは ValueError
+    """
+    from llm_config import DEFAULT_MODELS, LLM_MODELS, get_model_config
+    if model and not provider:
+        provider = next((name for name, models in LLM_MODELS.items() if model in models), None)
+        if provider is None:
+            raise ValueError(f"Unsupported model '{model}'")
+    if not provider:
+        provider, model = LLM_PROVIDER, LLM_MODEL
+    model = model or DEFAULT_MODELS.get(provider)
+    get_model_config(provider, model)
+    return provider, model
+
+def create_llm(provider: str, model: str, streaming: bool):
+    """LLMクライアントを作成する。Returns: (client, identity)
+
+    ai_studio / bedrock のライブラリがなければ OpenAI gpt4o_mini で代替し、identity は実際のモデルを表す
+    """
+    from llm_config import get_model_config
+    model_config = get_model_config(provider, model)
+    streaming_kwargs = {"streaming": True} if streaming else {}
+
+    if provider == "ai_studio":
+        try:
+            from langchain_google_genai import ChatGoogleGenerativeAI
+            client = ChatGoogleGenerativeAI(
+                model=model_config["model"],
+                temperature=model_config["temperature"],
+                google_api_key=GEMINI_API_KEY,
+                rate_limiter=ratelimit.ProviderRateLimiter(get_scheduler(), provider),
+                callbacks=llm_callbacks(provider, model, model_config),
+                **streaming_kwargs
             )
-            print(f"Using OpenAI {model_config['model']}: {model_config['description']}")
-    
-    return llm
+            print(f"Using Google AI Studio {model_config['model']}: {model_config['description']}")
+        except ImportError:
+            print("Warning: langchain-google-genai not installed. Falling back to OpenAI")
+            return create_llm("openai", "gpt4o_mini", streaming)
+    elif provider == "bedrock":
+        try:
+            from langchain_aws import ChatBedrock
+            client = ChatBedrock(
+                model_id=model_config["model_id"],
+                region_name=model_config.get("region_name", AWS_REGION),
+                model_kwargs={"temperature": model_config["temperature"]},
+                rate_limiter=ratelimit.ProviderRateLimiter(get_scheduler(), provider),
+                callbacks=llm_callbacks(provider, model, model_config),
+                **streaming_kwargs
+            )
+            print(f"Using AWS Bedrock {model_config['model_id']}: {model_config['description']}")
+        except ImportError:
+            print("Warning: langchain-aws not installed. Falling back to OpenAI")
+            return create_llm("openai", "gpt4o_mini", streaming)
+    else:
+        client = ChatOpenAI(
+            model=model_config["model"],
+            temperature=model_config["temperature"],
+            api_key=OPENAI_API_KEY,
+            stream_usage=True,
+            rate_limiter=ratelimit.ProviderRateLimiter(get_scheduler(), provider),
+            callbacks=llm_callbacks(provider, model, model_config),
+            **streaming_kwargs
+        )
+        print(f"Using OpenAI {model_config['model']}: {model_config['description']}")
+
+    # 応答キャッシュのキーに使う（フォールバック後の実際のプロバイダー・モデル）
+    identity = {
+        "provider": provider,
+        "model": model_config.get("model") or model_config.get("model_id"),
+        "temperature": model_config["temperature"]
+    }
+    return client, identity
+
+def get_llm_entry(provider: str = None, model: str = None, streaming: bool = False):
+    """(provider, model, streaming) ごとに1度だけクライアントを作成して再利用する（接続プールも共有される）"""
+    key = (*resolve_llm(provider, model), streaming)
+    entry = llm_clients.get(key)
+    if entry is None:
+        with llm_clients_lock:
+            entry = llm_clients.get(key)
+            if entry is None:
+                entry = llm_clients[key] = with_cassette(*create_llm(*key))
+    return entry
+
+def get_cassette():
+    """LLM・埋め込みのカセット（CASSETTE_MODE=off の場合は None）"""
+    global cassette
+    if cassette is None and CASSETTE_MODE != "off":
+        from cassette import Cassette
+        cassette = Cassette(CASSETTE_PATH, CASSETTE_MODE, CASSETTE_SPEED)
+        print(f"Cassette: {CASSETTE_MODE} {CASSETTE_PATH} ({cassette.stats()['entries']} recordings)")
+    return cassette
+
+def with_cassette(client, identity: Dict[str, Any]):
+    """カセットが有効ならクライアントを記録・再生のラッパーで包む。Returns: (client, identity)"""
+    if get_cassette() is None:
+        return client, identity
+    from cassette import CassetteChatModel
+    return CassetteChatModel(underlying=client, cassette=get_cassette(), identity=identity), identity
+
+def get_llm(provider: str = None, model: str = None, streaming: bool = False):
+    """LLMクライアントを取得（省略時は LLM_PROVIDER / LLM_MODEL）"""
+    return get_llm_entry(provider, model, streaming)[0]
+
+def get_llm_identity(provider: str = None, model: str = None) -> Dict[str, Any]:
+    return get_llm_entry(provider, model)[1]
+
+def parse_model_list(text: str, setting: str) -> List[Tuple[str, str]]:
+    """"provider:model" または "model" のカンマ区切りを (provider, model) のリストにする（不明なモデルは警告して除く）"""
+    routes = []
+    for item in filter(None, (part.strip() for part in text.split(","))):
+        provider, _, model = item.rpartition(":")
+        try:
+            routes.append(resolve_llm(provider or None, model))
+        except ValueError as e:
+            print(f"Warning: ignoring '{item}' in {setting}: {e}")
+    return routes
+
+def get_scheduler() -> ratelimit.Scheduler:
+    """LLM・埋め込みの呼び出しで共有するスケジューラ（RATE_LIMIT=false ならレート制限なしで、429の再試行だけ行う）"""
+    global scheduler
+    if scheduler is None:
+        from llm_config import RATE_LIMITS
+        with llm_clients_lock:
+            if scheduler is None:
+                scheduler = ratelimit.Scheduler(RATE_LIMITS if RATE_LIMIT else {}, max_retries=RATE_LIMIT_MAX_RETRIES)
+    return scheduler
+
+def get_llm_router():
+    """モデルごとの実測値を持つルーター（候補は LLM_ROUTING_CANDIDATES、省略時は認証情報のあるプロバイダーの全モデル）"""
+    global llm_router
+    if llm_router is None:
+        from llm_config import LLM_MODELS, SPEED_RANKING
+        from llm_router import LLMRouter
+        with llm_clients_lock:
+            if llm_router is None:
+                routes = parse_model_list(LLM_ROUTING_CANDIDATES, "LLM_ROUTING_CANDIDATES")
+                if not routes:
+                    configured = {
+                        "openai": bool(OPENAI_API_KEY),
+                        "ai_studio": bool(GEMINI_API_KEY),
+                        "bedrock": bool(os.getenv("AWS_ACCESS_KEY_ID") or os.getenv("AWS_PROFILE")),
+                    }
+                    # 未計測のうちは SPEED_RANKING の順に試す
+                    ordered = SPEED_RANKING + [(p, m) for p in LLM_MODELS for m in LLM_MODELS[p]]
+                    routes = [route for route in dict.fromkeys(ordered) if configured.get(route[0])]
+                quality = {(p, m): config.get("quality", 0) for p in LLM_MODELS for m, config in LLM_MODELS[p].items()}
+                llm_router = LLMRouter(routes, quality, failure_threshold=LLM_ROUTING_FAILURE_THRESHOLD,
+                                       cooldown_sec=LLM_ROUTING_COOLDOWN)
+    return llm_router
+
+def llm_routes(provider: str = None, model: str = None, streaming: bool = False):
+    """このリクエストで試すモデルの順番
+
+    provider / model の指定がある場合や LLM_ROUTING=false の場合はそのモデルだけ。
+    Returns: (routes, routing): routing はルーターで選んだ場合の判断材料（ストリームの status イベント用）、それ以外は None
+    """
+    if provider or model or not LLM_ROUTING:
+        return [resolve_llm(provider, model)], None
+    router = get_llm_router()
+    routes = router.ranked(streaming=streaming, min_quality=LLM_ROUTING_MIN_QUALITY)[:max(1, LLM_ROUTING_MAX_ATTEMPTS)]
+    if not routes:
+        print("Warning: no healthy LLM route meets LLM_ROUTING_MIN_QUALITY; using the default model")
+        return [resolve_llm()], None
+    return routes, {"selected": f"{routes[0][0]}:{routes[0][1]}", "candidates": [router.describe(route) for route in routes]}
+
+def routing_message(routing: Dict[str, Any]) -> str:
+    best = routing["candidates"][0]
+    measured = f"EWMA {best['latency_ms']}ms" if best["latency_ms"] is not None else "未計測"
+    if best["ttft_ms"] is not None:
+        measured += f", TTFT {best['ttft_ms']}ms"
+    return f"モデルを自動選択: {routing['selected']}（{measured}, エラー率 {best['error_rate']:.0%}）"
+
+async def ainvoke_with_fallback(routes: List[Tuple[str, str]], prompt_value):
+    """routes の順にLLMを呼び、失敗したら次のモデルで再試行する。Returns: (response, (provider, model))"""
+    for attempt, (provider, model) in enumerate(routes, start=1):
+        try:
+            # 429 は次のモデルがあればそちらへ、最後のモデルならバックオフして再試行する
+            response = await get_scheduler().acall(
+                provider, lambda: get_llm(provider, model).ainvoke(prompt_value), acquire=False, penalized=True,
+                max_retries=None if attempt == len(routes) else 0
+            )
+            return response, (provider, model)
+        except Exception as e:
+            if attempt >= len(routes):
+                raise
+            print(f"LLM {provider}:{model} failed ({e}); falling back to {routes[attempt][0]}:{routes[attempt][1]}")
+
+def hedge_plan(route: Tuple[str, str], routes: List[Tuple[str, str]]):
+    """ストリーミングのヘッジ先と、ヘッジを送るまでの待ち時間（秒）。ヘッジしない場合は (None, None)"""
+    if not LLM_HEDGE:
+        return None, None
+    candidates = parse_model_list(LLM_HEDGE_MODEL, "LLM_HEDGE_MODEL") or routes
+    backup = next((candidate for candidate in candidates if candidate != route), None)
+    if backup is None:
+        return None, None
+    if LLM_HEDGE_DELAY:
+        return backup, float(LLM_HEDGE_DELAY)
+    ttft_ms = get_llm_router().ttft_quantile(route, LLM_HEDGE_QUANTILE, LLM_HEDGE_MIN_SAMPLES)
+    return backup, ttft_ms / 1000 if ttft_ms is not None else LLM_HEDGE_INITIAL_DELAY
+
+async def warm_up_llms():
+    """APIの起動時に既定のモデルと LLM_WARMUP_MODELS のクライアントを作成する
+
+    OpenAIは LLM_WARMUP_CONNECT=true のとき models.list（トークンを消費しない）で接続・TLSも確立しておく。
+    作成・接続に失敗したモデルは警告だけ出して飛ばす（認証情報がなくてもAPIは起動し、最初の呼び出しで作り直す）
+    """
+    targets = parse_model_list(LLM_WARMUP_MODELS, "LLM_WARMUP_MODELS")
+    try:
+        targets.insert(0, resolve_llm())
+    except ValueError as e:
+        print(f"Warning: skipping warm-up of the default LLM: {e}")
+    connected = set()
+    for provider, model in dict.fromkeys(targets):
+        for streaming in (False, True):
+            try:
+                client = get_llm(provider, model, streaming)
+                root = getattr(client, "root_async_client", None)
+                if not LLM_WARMUP_CONNECT or root is None or id(root) in connected:
+                    continue
+                connected.add(id(root))
+                await root.models.list()
+            except Exception as e:
+                print(f"Warning: LLM warm-up failed for {provider}:{model}" + (" (stream)" if streaming else "") + f": {e}")
+    print(f"LLM clients ready: {', '.join(f'{p}:{m}' + (' (stream)' if s else '') for p, m, s in llm_clients) or 'none'}")
+
+def get_llm_cache():
+    """構造化プロンプトの応答キャッシュ（LLM_CACHE=false の場合は None）"""
+    global llm_cache
+    if llm_cache is None and LLM_CACHE_ENABLED:
+        from disk_cache import DiskLRUCache
+        llm_cache = DiskLRUCache(LLM_CACHE_PATH, LLM_CACHE_MAX_ENTRIES, name="llm_response")
+    return llm_cache
+
+def llm_cache_key(prompt_text: str) -> str:
+    """(provider, model, temperature, prompt) のハッシュ"""
+    import hashlib
+    identity = get_llm_identity()
+    payload = json.dumps([identity["provider"], identity["model"], identity["temperature"], prompt_text], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
 
 def clean_json_response(response_text: str) -> str:
     """LLMレスポンスからJSONを抽出・クリーンアップする関数"""
@@ -96,19 +552,48 @@ def clean_json_response(response_text: str) -> str:
 def get_embeddings():
     global embeddings
     if embeddings is None:
-        embeddings = OpenAIEmbeddings(model="text-embedding-3-small", api_key=OPENAI_API_KEY)
+        embeddings = OpenAIEmbeddings(model=EMBEDDING_MODEL, api_key=OPENAI_API_KEY)
+        # キャッシュに当たらなかった分だけがレート制限の枠を使う
+        embeddings = ratelimit.ScheduledEmbeddings(embeddings, get_scheduler(), "embeddings")
+        if get_cassette() is not None:
+            # 再生時はレート制限の枠も使わない（キャッシュに当たらなかった分だけが記録・再生される）
+            from cassette import CassetteEmbeddings
+            embeddings = CassetteEmbeddings(embeddings, EMBEDDING_MODEL, get_cassette())
+        if EMBEDDING_CACHE_ENABLED:
+            # 同じ文書の再埋め込みを避けるため、永続キャッシュを前段に置く
+            from disk_cache import DiskLRUCache
+            from embedding_cache import CachedEmbeddings
+            cache = DiskLRUCache(EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_ENTRIES, name="embedding")
+            embeddings = CachedEmbeddings(embeddings, EMBEDDING_MODEL, cache)
     return embeddings
 
-def get_vectorstore():
-    global vectorstore
-    if vectorstore is None:
-        vectorstore = PineconeVectorStore.from_existing_index(
-            index_name="yoin-index",
-            embedding=get_embeddings(),
-            pinecone_api_key=PINECONE_API_KEY,
-            host=PINECONE_INDEX_HOST
-        )
-    return vectorstore
+def get_lexical_index(index_name: str = None):
+    """スキル・プロフィール欄の語彙インデックスを取得（インデックスごとに再利用）"""
+    from lexical_index import LexicalIndex
+    index_name = index_name or YOIN_INDEX_NAME
+    if index_name not in lexical_indexes:
+        lexical_indexes[index_name] = LexicalIndex(os.path.join(LEXICAL_INDEX_DIR, f"{index_name}.pkl"))
+    return lexical_indexes[index_name]
+
+def get_vectorstore(index_name: str = None):
+    """ベクトルストアを取得（VECTOR_BACKEND=pinecone | local、インデックスごとに再利用）"""
+    index_name = index_name or YOIN_INDEX_NAME
+    if index_name not in vectorstores:
+        if VECTOR_BACKEND == "local":
+            from local_vectorstore import LocalVectorStore
+            vectorstores[index_name] = LocalVectorStore(
+                os.path.join(LOCAL_VECTOR_DIR, index_name),
+                embedding=get_embeddings()
+            )
+        else:
+            vectorstores[index_name] = PineconeVectorStore(
+                index_name=index_name,
+                embedding=get_embeddings(),
+                pinecone_api_key=PINECONE_API_KEY,
+                text_key=PINECONE_TEXT_KEY,
+                namespace=PINECONE_NAMESPACE
+            )
+    return vectorstores[index_name]
 
 # Pydantic models for structured output
 class YoinStructured(BaseModel):
@@ -147,24 +632,179 @@ class MatchingResult(BaseModel):
     comparision: List[Dict[str, Any]]
     actions: List[str]
 
+class GroupScore(BaseModel):
+    yoin_id: str
+    match_score: int
+    skill_match: str
+    work_style_match: str
+    price_match: str
+    comment: str
+    action: str
+
+class GroupScoringResult(BaseModel):
+    scores: List[GroupScore]
+
+def get_gas_session() -> requests.Session:
+    """GAS呼び出し用の共有セッション（keep-aliveで接続を再利用）"""
+    global gas_session
+    if gas_session is None:
+        gas_session = requests.Session()
+        gas_session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+    return gas_session
+
 def get_data_from_gas(type_: str, params: Dict[str, Any] = None) -> Dict:
-    """GASからデータを取得"""
+    """GASからデータを取得（1ページ分）"""
     url = f"{GAS_URL}?type={type_}"
     if params:
-        param_str = "&".join([f"{k}={v}" for k, v in params.items() if v])
+        param_str = "&".join([f"{k}={v}" for k, v in params.items() if v and k in GAS_QUERY_KEYS])
         url += f"&{param_str}"
     
-    response = requests.get(url)
-    response.raise_for_status()
-    return response.json()
+    with timing.span("gas_fetch"):
+        response = get_gas_session().get(url, timeout=GAS_TIMEOUT)
+        response.raise_for_status()
+        return response.json()
+
+def iter_gas_records(type_: str, params: Dict[str, Any] = None, stats: Dict[str, Any] = None):
+    """GASのレコードをoffsetページングで遅延取得するジェネレータ
+
+    - params["limit"] は取得する合計件数の上限（未指定なら範囲内の全件）
+    - 1ページは GAS_PAGE_SIZE 件。現在のページを処理している間に次のページを先読みする
+    - GAS側で max_bytes により打ち切られたページは警告を出し、next_offset から続きを取得する
+    - ページ境界で同じIDが重複した場合（取得中にシートへ行が追加された等）は読み飛ばす
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    params = dict(params or {})
+    max_records = int(params["limit"]) if params.get("limit") else None
+    offset = int(params.get("offset") or 0)
+    stats = stats if stats is not None else {}
+    stats.update({"pages": 0, "records": 0, "truncated_pages": 0})
+
+    def page_size(already: int) -> int:
+        if max_records is None:
+            return GAS_PAGE_SIZE
+        return max(0, min(GAS_PAGE_SIZE, max_records - already))
+
+    def fetch(page_offset: int, size: int) -> Dict:
+        return get_data_from_gas(type_, {**params, "offset": page_offset, "limit": size})
+
+    seen_ids = set()
+    first_offset = offset
+    requested = page_size(0)
+    if requested == 0:
+        return
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="gas-prefetch") as executor:
+        future = timing.submit_with_context(executor, fetch, offset, requested)
+        while future is not None:
+            data = future.result()
+            records = data.get("records") or []
+            stats["pages"] += 1
+            next_offset = data.get("next_offset", offset + len(records))
+            if stats["pages"] == 1:
+                # 合計件数の見込み（ジョブの進捗・残り時間用）。count_matched を返さない古いGASでは limit のみ
+                if data.get("count_matched") is not None:
+                    available = max(0, int(data["count_matched"]) - first_offset)
+                    stats["total"] = min(available, max_records) if max_records is not None else available
+                else:
+                    stats["total"] = max_records
+                jobs.report_total(stats["total"])
+
+            if data.get("truncated"):
+                stats["truncated_pages"] += 1
+                print(
+                    f"Warning: GAS page for '{type_}' at offset={offset} was truncated by max_bytes "
+                    f"({len(records)}/{requested} records); continuing from offset={next_offset}"
+                )
+
+            # 次ページの先読み（このページを処理している間に取得する）
+            fetched = stats["records"] + len(records)
+            more = bool(records) and (data.get("truncated") or len(records) >= requested)
+            requested = page_size(fetched)
+            future = timing.submit_with_context(executor, fetch, next_offset, requested) if more and requested > 0 else None
+            offset = next_offset
+
+            for record in records:
+                stats["records"] += 1
+                record_id = record.get("ID")
+                if record_id:
+                    if record_id in seen_ids:
+                        continue
+                    seen_ids.add(record_id)
+                yield record
 
-def post_data_to_gas(type_: str, data: Dict) -> Dict:
-    """GASにデータをPOST"""
-    print("data", data)
+    print(
+        f"Fetched {stats['records']} '{type_}' records from GAS in {stats['pages']} page(s)"
+        + (f", {stats['truncated_pages']} truncated by max_bytes" if stats["truncated_pages"] else "")
+    )
+
+def post_records_to_gas(type_: str, records: List[Dict]) -> Dict:
+    """GASに複数レコードをまとめてPOST（doPostのバッチモード）"""
     url = f"{GAS_URL}?type={type_}"
-    response = requests.post(url, json=data)
-    response.raise_for_status()
-    return response.json()
+    with timing.span("gas_post"):
+        response = get_gas_session().post(url, json={"type": type_, "records": records}, timeout=GAS_TIMEOUT)
+        response.raise_for_status()
+        return response.json()
+
+class GasRecordBuffer:
+    """構造化レコードをバッファし、batch_size件ごとにGASへまとめて書き戻す
+
+    with文で使うと、ブロックを抜ける際に残りのレコードをflushする。
+    書き戻しに失敗したら指数バックオフで再試行し、それでも失敗したレコードは failed / failed_ids に数える。
+    """
+
+    def __init__(self, type_: str, batch_size: int = None, max_retries: int = None):
+        self.type_ = type_
+        self.batch_size = max(1, batch_size or GAS_POST_BATCH_SIZE)
+        self.max_retries = max(1, max_retries or GAS_POST_MAX_RETRIES)
+        self.records: List[Dict] = []
+        self.posted = 0
+        self.failed = 0
+        self.failed_ids: List[str] = []
+
+    def add(self, record: Dict):
+        self.records.append(record)
+        if len(self.records) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> Dict:
+        if not self.records:
+            return {}
+        import time
+
+        chunk, self.records = self.records, []
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                result = post_records_to_gas(self.type_, chunk)
+                error = None if result.get("status") == "success" else result.get("message", result)
+            except Exception as e:
+                result, error = {"status": "error", "message": str(e)}, e
+            if error is None:
+                break
+            if attempt >= self.max_retries:
+                self.failed += len(chunk)
+                self.failed_ids.extend(str(record.get("id", "")) for record in chunk)
+                print(f"Error posting {len(chunk)} {self.type_} records to GAS after {attempt} attempts: {error}")
+                return result
+            wait = 2 ** (attempt - 1)
+            print(f"Retrying post of {len(chunk)} {self.type_} records (attempt {attempt}/{self.max_retries}) "
+                  f"in {wait}s: {error}")
+            time.sleep(wait)
+        self.posted += len(chunk)
+        deleted = result.get("deletedDuplicates", {})
+        print(
+            f"Posted {len(chunk)} {self.type_} records to GAS "
+            f"(appended {result.get('appended')}, duplicates removed: sheet {deleted.get('sheet')}, "
+            f"batch {deleted.get('batch')}, pinecone {deleted.get('pinecone')})"
+        )
+        return result
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # 例外時も構造化済みのレコードは書き戻す
+        self.flush()
+        return False
 
 def format_yoin_item(item: Dict) -> str:
     """要員アイテムをプロンプト用テキストに整形"""
@@ -188,7 +828,43 @@ ID: {item.get('ID', '')}
 {item.get('本文', '')}
 """
 
-def structure_yoin_data(raw_text: str, item: Dict) -> Dict:
+def invoke_structuring(prompt_text: str, model_cls, use_cache: bool = True) -> Dict:
+    """構造化プロンプトをLLMに送り、Pydanticモデルで検証した辞書を返す
+
+    use_cache=True の場合は応答キャッシュを参照し、パースに成功した応答だけを保存する。
+    """
+    cache = get_llm_cache() if use_cache else None
+    key = llm_cache_key(prompt_text) if cache is not None else None
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            try:
+                return model_cls(**json.loads(clean_json_response(cached.decode("utf-8")))).model_dump()
+            except Exception:
+                pass  # 読めないエントリは無視して再生成する
+
+    # LLMを直接呼び出し
+    # 429 はバックオフして再試行する（解析失敗として読み飛ばさない）
+    with timing.span("llm_structuring"):
+        response = get_scheduler().call(resolve_llm()[0], lambda: get_llm().invoke(prompt_text),
+                                        acquire=False, penalized=True)
+    
+    # JSONパースとPydanticバリデーション
+    try:
+        # レスポンスをクリーンアップしてJSONを抽出
+        cleaned_response = clean_json_response(response.content)
+        # JSON文字列をパース
+        json_data = json.loads(cleaned_response)
+        # Pydanticモデルを作成
+        result = model_cls(**json_data)
+    except Exception as e:
+        return {"error": f"Parse failed: {e}", "raw_response": response.content, "cleaned_response": clean_json_response(response.content)}
+
+    if cache is not None:
+        cache.put(key, response.content.encode("utf-8"))
+    return result.model_dump()
+
+def structure_yoin_data(raw_text: str, item: Dict, use_cache: bool = True) -> Dict:
     """要員データを構造化"""
     prompt_text = f"""
 あなたはITエンジニア派遣の「要員情報」を整理するアシスタントです。
@@ -224,22 +900,10 @@ def structure_yoin_data(raw_text: str, item: Dict) -> Dict:
 - idとdateは絶対に入力値と一致させてください。
 """
     
-    # LLMを直接呼び出し
-    response = get_llm().invoke(prompt_text)
-    
-    # JSONパースとPydanticバリデーション
-    try:
-        # レスポンスをクリーンアップしてJSONを抽出
-        cleaned_response = clean_json_response(response.content)
-        # JSON文字列をパース
-        json_data = json.loads(cleaned_response)
-        # Pydanticモデルを作成
-        result = YoinStructured(**json_data)
-        return result.model_dump()
-    except Exception as e:
-        return {"error": f"Parse failed: {e}", "raw_response": response.content, "cleaned_response": clean_json_response(response.content)}
+    # LLM呼び出し（応答キャッシュ経由）とPydanticバリデーション
+    return invoke_structuring(prompt_text, YoinStructured, use_cache=use_cache)
 
-def structure_anken_data(raw_text: str, item: Dict) -> Dict:
+def structure_anken_data(raw_text: str, item: Dict, use_cache: bool = True) -> Dict:
     """案件データを構造化"""
     prompt_text = f"""
 あなたはITエンジニア派遣の「案件情報」を整理するアシスタントです。
@@ -275,57 +939,154 @@ def structure_anken_data(raw_text: str, item: Dict) -> Dict:
 - idとdateは絶対に入力値と一致させてください。
 """
     
-    # LLMを直接呼び出し
-    response = get_llm().invoke(prompt_text)
-    
-    # JSONパースとPydanticバリデーション
+    # LLM呼び出し（応答キャッシュ経由）とPydanticバリデーション
+    return invoke_structuring(prompt_text, AnkenStructured, use_cache=use_cache)
+
+def param_flag(params: Dict[str, Any], key: str) -> bool:
+    """真偽値パラメータを解釈（CLIからは文字列 "true"/"false" で渡される）"""
+    value = params.get(key, False)
+    if isinstance(value, str):
+        return value.lower() == "true"
+    return bool(value)
+
+def resolve_concurrency(value) -> int:
+    """concurrencyパラメータを1以上の整数に正規化（未指定時は FORMAT_CONCURRENCY）"""
+    if value in (None, ""):
+        return max(1, FORMAT_CONCURRENCY)
+    return max(1, int(value))
+
+def structure_records(records, format_fn, structure_fn, concurrency: int, label: str, stats: Dict[str, Any] = None,
+                      buffer: "GasRecordBuffer" = None):
+    """レコードを並列に構造化し、入力順に (record, structured) を返すジェネレータ
+
+    - 実行中のLLM呼び出しは concurrency 件までに制限する
+    - 先読みは concurrency の2倍までなので、records はイテレータでもよい
+    - 1件の例外は {"error": ...} に変換し、他のレコードの処理は継続する
+    - 終了時にスループットのサマリを出力し、stats に集計値を書き込む
+    - buffer を渡すと、GASへの書き戻しに失敗した件数も進捗の失敗件数に含める
+    """
+    import time
+    from collections import deque
+    from concurrent.futures import ThreadPoolExecutor
+
+    def work(record):
+        try:
+            # 対話的なマッチングの呼び出しを先に通す
+            with ratelimit.priority(ratelimit.BATCH):
+                return structure_fn(format_fn(record), record)
+        except Exception as e:
+            reason = "Rate limited" if ratelimit.is_rate_limited(e) else "Structuring failed"
+            return {"error": f"{reason}: {e}", "raw_response": ""}
+
+    # クライアント生成はワーカー起動前に済ませる（並列初期化を避ける）
+    get_llm()
+
+    stats = stats if stats is not None else {}
+    processed = failed = 0
+    started = time.monotonic()
+    source = iter(records)
+    pending = deque()
+    exhausted = False
+
+    print(f"[{label}] structuring with concurrency={concurrency}")
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=label) as executor:
+        while True:
+            while not exhausted and len(pending) < concurrency * 2:
+                try:
+                    record = next(source)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending.append((record, timing.submit_with_context(executor, work, record)))
+            if not pending:
+                break
+
+            # 先頭から順に結果を受け取ることで入力順を保つ
+            record, future = pending.popleft()
+            structured = future.result()
+            processed += 1
+            if "error" in structured:
+                failed += 1
+            try:
+                jobs.report_progress(processed, failed + (buffer.failed if buffer else 0))
+            except jobs.JobCancelled:
+                # 未着手のLLM呼び出しは取り消す（構造化済みのレコードは呼び出し元で書き戻される）
+                for _, pending_future in pending:
+                    pending_future.cancel()
+                print(f"[{label}] cancelled after {processed} records")
+                raise
+            if FORMAT_PROGRESS_INTERVAL > 0 and processed % FORMAT_PROGRESS_INTERVAL == 0:
+                elapsed = time.monotonic() - started
+                print(f"[{label}] progress: {processed} processed, {failed} failed, {processed / elapsed:.2f} rec/s")
+            yield record, structured
+
+    elapsed = time.monotonic() - started
+    stats.update({
+        "processed": processed,
+        "succeeded": processed - failed,
+        "failed": failed,
+        "elapsed_sec": round(elapsed, 2),
+        "records_per_sec": round(processed / elapsed, 2) if elapsed > 0 else 0.0,
+        "concurrency": concurrency,
+    })
+    print(
+        f"[{label}] summary: {processed} processed ({processed - failed} ok / {failed} failed) "
+        f"in {elapsed:.1f}s, {stats['records_per_sec']} rec/s, concurrency={concurrency}"
+    )
+    if llm_cache is not None:
+        stats["llm_cache"] = llm_cache.stats()
+        print(f"[{label}] LLM response cache: {stats['llm_cache']}")
+
+def record_post_results(stats: Dict[str, Any], buffer: GasRecordBuffer):
+    """書き戻しの結果を stats に加える（書き戻せなかったレコードは失敗として数え直し、進捗にも反映する）"""
+    stats["posted"] = buffer.posted
+    stats["post_failed"] = buffer.failed
+    if not buffer.failed:
+        return
+    stats["failed"] = stats.get("failed", 0) + buffer.failed
+    stats["succeeded"] = stats.get("succeeded", 0) - buffer.failed
+    stats["post_failed_ids"] = buffer.failed_ids
+    print(f"Failed to post {buffer.failed} {buffer.type_} records to GAS: {', '.join(buffer.failed_ids)}")
     try:
-        # レスポンスをクリーンアップしてJSONを抽出
-        cleaned_response = clean_json_response(response.content)
-        # JSON文字列をパース
-        json_data = json.loads(cleaned_response)
-        # Pydanticモデルを作成
-        result = AnkenStructured(**json_data)
-        return result.model_dump()
-    except Exception as e:
-        return {"error": f"Parse failed: {e}", "raw_response": response.content, "cleaned_response": clean_json_response(response.content)}
+        jobs.report_progress(stats.get("processed", 0), stats["failed"])
+    except jobs.JobCancelled:
+        pass  # 処理はすべて終わっている
 
 # 構造化フロー（要員）
 def format_yoin_flow(params: Dict[str, Any]):
     """構造化フロー（要員）"""
     print("Starting format_yoin flow...")
+    timings = timing.start()
+    jobs.start_phase("format_yoin")
     
     # with_indexパラメータをチェック
-    with_index = params.get("with_index", False)
-    if isinstance(with_index, str):
-        with_index = with_index.lower() == "true"
+    with_index = param_flag(params, "with_index")
+    concurrency = resolve_concurrency(params.get("concurrency"))
+    # no_cache=true の場合は応答キャッシュを使わずに再構造化する
+    structure_fn = functools.partial(structure_yoin_data, use_cache=not param_flag(params, "no_cache"))
     
-    # Get data from GAS
-    data = get_data_from_gas("yoin", params)
-    records = data.get("records", [])
+    # Get data from GAS（ページングしながら遅延取得）
+    records = iter_gas_records("yoin", params)
     
-    for record in records:
-        # Format item
-        formatted_text = format_yoin_item(record)
-        
-        # Structure with LLM
-        structured = structure_yoin_data(formatted_text, record)
-        
-        # エラーチェック
-        if "error" in structured:
-            print(f"Error processing record {record.get('ID', 'unknown')}: {structured['error']}")
-            print(f"Raw response: {structured.get('raw_response', '')}")
-            continue
-        
-        # Post back to GAS
-        # raw_inputフィールドを追加してメール本文をK列に保存
-        structured["raw_input"] = record.get('本文', '')
-        post_data = {
-            "type": "yoin",
-            "record": structured
-        }
-        post_data_to_gas("yoin", post_data)
-        print(f"Processed yoin ID: {structured.get('id', 'unknown')}")
+    stats = {}
+    with GasRecordBuffer("yoin") as buffer:
+        for record, structured in structure_records(
+            records, format_yoin_item, structure_fn, concurrency, "format_yoin", stats, buffer
+        ):
+            # エラーチェック
+            if "error" in structured:
+                print(f"Error processing record {record.get('ID', 'unknown')}: {structured['error']}")
+                print(f"Raw response: {structured.get('raw_response', '')}")
+                continue
+            
+            # Post back to GAS（バッファしてまとめて書き戻す）
+            # raw_inputフィールドを追加してメール本文をK列に保存
+            structured["raw_input"] = record.get('本文', '')
+            buffer.add(structured)
+            print(f"Processed yoin ID: {structured.get('id', 'unknown')}")
+    record_post_results(stats, buffer)
+    stats["timings"] = timings.report()
+    print(f"Timings: {stats['timings']}")
     
     print("format_yoin flow completed.")
     
@@ -335,67 +1096,51 @@ def format_yoin_flow(params: Dict[str, Any]):
         # paramsからwith_indexを除外してindex_yoin_flowに渡す
         index_params = {k: v for k, v in params.items() if k != "with_index"}
         index_yoin_flow(index_params)
+
+    return stats
         
 # 構造化フロー（案件）
 def format_anken_flow(params: Dict[str, Any]):
     """構造化フロー（案件）"""
     print("Starting format_anken flow...")
+    timings = timing.start()
+    jobs.start_phase("format_anken")
+    concurrency = resolve_concurrency(params.get("concurrency"))
+    # no_cache=true の場合は応答キャッシュを使わずに再構造化する
+    structure_fn = functools.partial(structure_anken_data, use_cache=not param_flag(params, "no_cache"))
     
-    # Get data from GAS
-    data = get_data_from_gas("anken", params)
-
-    records = data.get("records", [])
+    # Get data from GAS（ページングしながら遅延取得）
+    records = iter_gas_records("anken", params)
     
-    for record in records:
-        raw_text = record["本文"]
-        # Format item
-        formatted_text = format_anken_item(record)
+    stats = {}
+    with GasRecordBuffer("anken") as buffer:
+        for record, structured in structure_records(
+            records, format_anken_item, structure_fn, concurrency, "format_anken", stats, buffer
+        ):
+            # エラーチェック
+            if "error" in structured:
+                print(f"Error processing record {record.get('ID', 'unknown')}: {structured['error']}")
+                print(f"Raw response: {structured.get('raw_response', '')}")
+                continue
+            
+            # raw_inputフィールドを追加してメール本文をK列に保存
+            structured["raw_input"] = record.get('本文', '')
 
-        # print(formatted_text)
-        
-        # Structure with LLM
-        structured = structure_anken_data(formatted_text, record)
-        
-        # エラーチェック
-        if "error" in structured:
-            print(f"Error processing record {record.get('ID', 'unknown')}: {structured['error']}")
-            print(f"Raw response: {structured.get('raw_response', '')}")
-            continue
-        
-        # raw_inputフィールドを追加してメール本文をK列に保存
-        structured["raw_input"] = record.get('本文', '')
-
-        print(structured)
-        
-        # Post back to GAS
-        post_data = {
-            "type": "anken",
-            "record": structured
-        }
-        post_data_to_gas("anken", post_data)
-        print(f"Processed anken ID: {structured.get('id', 'unknown')}")
+            print(structured)
+            
+            # Post back to GAS（バッファしてまとめて書き戻す）
+            buffer.add(structured)
+            print(f"Processed anken ID: {structured.get('id', 'unknown')}")
+    record_post_results(stats, buffer)
+    stats["timings"] = timings.report()
+    print(f"Timings: {stats['timings']}")
     
     print("format_anken flow completed.")
+    return stats
 
-# RAG登録フロー（要員）
-def index_yoin_flow(params: Dict[str, Any]):
-    """RAG登録フロー（要員）"""
-    print("Starting index_yoin flow...")
-    
-    # Get formatted data from GAS
-    data = get_data_from_gas("yoin_format", params)
-    records = data.get("records", [])
-    
-    # Initialize Pinecone vector store
-    vectorstore = PineconeVectorStore(
-        index_name="yoin2",  # Assuming index name from host
-        embedding=get_embeddings(),
-        pinecone_api_key=PINECONE_API_KEY
-    )
-    
-    for record in records:
-        # Create RAG text
-        rag_text = f"""
+def build_yoin_rag_text(record: Dict) -> str:
+    """構造化済み要員レコードからRAG登録用テキストを作成"""
+    rag_text = f"""
         【要員ID】 {record.get('ID', '')}
         【受信日時】 {record.get('受信日時', '')}
         【氏名】 {record.get('氏名', '')}
@@ -407,33 +1152,242 @@ def index_yoin_flow(params: Dict[str, Any]):
         【備考】 {record.get('備考', '')}
         【メールタイトル】 {record.get('メールタイトル', '')}
         """
-        
-        # Add to vector store
-        vectorstore.add_texts(
-            texts=[rag_text.strip()],
-            ids=[record.get('ID', '')],
-            metadatas=[{
-                "recieved_at": int(record.get('受信日時', '').replace('-', '')[:8]),
-                "text": rag_text.strip()
-            }]
-        )
-        print(f"Indexed yoin ID: {record.get('ID', '')}")
-    
-    print("index_yoin flow completed.")
+    return rag_text.strip()
 
-# 要員マッチフロー
-def matching_yoin_flow(anken: str):
-    """要員マッチフロー"""
-    print("Starting matching_yoin flow...")
+def build_yoin_document(record: Dict) -> Dict[str, Any]:
+    """要員レコード → upsert用の {id, text, lexical_text, metadata}
+
+    metadata には検索時のフィルタ用に地域・勤務形態・希望単価（万円）・年齢を型付きで持たせる
+    """
+    from lexical_index import yoin_lexical_text
+    from prefilter import yoin_metadata
+    rag_text = build_yoin_rag_text(record)
+    return {
+        "id": record.get('ID', ''),
+        "text": rag_text,
+        "lexical_text": yoin_lexical_text(record),
+        "metadata": {
+            "recieved_at": int(record.get('受信日時', '').replace('-', '')[:8]),
+            **yoin_metadata(record),
+            "text": rag_text
+        }
+    }
+
+def batched(iterable, size: int):
+    """iterable を size 件ずつのリストに分割するジェネレータ"""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def write_vectors(vectorstore, documents: List[Dict[str, Any]], vectors: List[List[float]]):
+    """埋め込み済みのベクトルをベクトルストアに書き込む（Pinecone は INDEX_UPSERT_CHUNK 件ずつ upsert）"""
+    texts = [d["text"] for d in documents]
+    ids = [d["id"] for d in documents]
+    metadatas = [dict(d["metadata"]) for d in documents]
+    if hasattr(vectorstore, "add_embeddings"):
+        vectorstore.add_embeddings(texts, vectors, metadatas=metadatas, ids=ids)
+        return
+    for metadata, text in zip(metadatas, texts):
+        metadata[PINECONE_TEXT_KEY] = text
+    for chunk in batched(zip(ids, vectors, metadatas), INDEX_UPSERT_CHUNK):
+        vectorstore.index.upsert(vectors=chunk, namespace=PINECONE_NAMESPACE)
+
+def upsert_yoin_batch(vectorstore, documents: List[Dict[str, Any]]) -> int:
+    """1バッチ分の要員をまとめて埋め込み・upsert（失敗時はこのバッチだけをリトライ）
+
+    段階は index_batch（再試行の待ちを含むバッチ全体）、index_embedding（埋め込み。レート制限の待ちを含む）、
+    index_upsert（ベクトルストアへの書き込みだけ）に分けて計測する
+    """
+    import time
+
+    with timing.span("index_batch"):
+        for attempt in range(1, INDEX_MAX_RETRIES + 1):
+            try:
+                # 埋め込みはバッチ全体で1リクエスト
+                with timing.span("index_embedding"), ratelimit.priority(ratelimit.BATCH):
+                    vectors = vectorstore.embeddings.embed_documents([d["text"] for d in documents])
+                with timing.span("index_upsert"):
+                    write_vectors(vectorstore, documents, vectors)
+                return len(documents)
+            except Exception as e:
+                if attempt >= INDEX_MAX_RETRIES:
+                    raise
+                wait = 2 ** (attempt - 1)
+                print(f"Retrying batch of {len(documents)} (attempt {attempt}/{INDEX_MAX_RETRIES}) in {wait}s: {e}")
+                time.sleep(wait)
+
+# RAG登録フロー（要員）
+def index_yoin_flow(params: Dict[str, Any]):
+    """RAG登録フロー（要員）"""
+    import time
+    from collections import deque
+    from concurrent.futures import ThreadPoolExecutor
+
+    print("Starting index_yoin flow...")
+    timings = timing.start()
+    jobs.start_phase("index_yoin")
+
+    # incrementalパラメータをチェック（チェックポイント以降の行だけを登録する）
+    incremental = param_flag(params, "incremental")
+
+    checkpoint = None
+    received_at = {}
+    if incremental:
+        from index_checkpoint import IndexCheckpoint
+        checkpoint = IndexCheckpoint(INDEX_CHECKPOINT_PATH)
+        print(f"Incremental mode: checkpoint={checkpoint.summary()}")
+        # 新しい順に取得するため、途中で打ち切ると古い未登録行を飛ばしてしまう → limit/offset は使わない
+        if any(params.get(k) for k in ("limit", "offset")):
+            print("Warning: limit/offset are ignored in incremental mode")
+        params = {k: v for k, v in params.items() if k not in ("limit", "offset")}
+        if checkpoint.start_date():
+            params["start_date"] = checkpoint.start_date()
     
-    # Parse anken data
-    anken_data = json.loads(anken)
+    # Get formatted data from GAS（ページングしながら遅延取得）
+    records = iter_gas_records("yoin_format", params)
     
-    # Create search text with weighted keywords (improved approach)
+    # Initialize vector store（Pinecone またはローカル）
+    vectorstore = get_vectorstore(YOIN_INDEX_NAME)
+
+    stats = {"indexed": 0, "failed": 0, "failed_ids": [], "skipped": 0}
+    # upsert に失敗したレコードの受信日時（次回再試行する。high-water mark はこの最古の直前までしか進めない）
+    retry_at = []
+    # 語彙インデックスに書き出していない登録済み分。チェックポイントには書き出した後で記録する
+    # （途中で落ちても、語彙インデックスから抜けたままのIDを登録済みとして読み飛ばさない）
+    unsaved = {"batches": 0, "done": []}
+
+    def save_progress():
+        if HYBRID_SEARCH and unsaved["batches"]:
+            get_lexical_index(YOIN_INDEX_NAME).save()
+        if checkpoint is not None and unsaved["done"]:
+            checkpoint.mark_done(unsaved["done"])
+        unsaved["batches"] = 0
+        unsaved["done"] = []
+
+    def pending_records():
+        if checkpoint is None:
+            yield from records
+            return
+        from index_checkpoint import parse_received_at
+        for record in records:
+            record_id = record.get('ID', '')
+            ts = parse_received_at(record.get('受信日時'))
+            if ts is None:
+                print(f"Error parsing 受信日時 for yoin ID {record_id or 'unknown'}: {record.get('受信日時')!r}")
+                stats["failed"] += 1
+                stats["failed_ids"].append(record_id)
+                checkpoint.mark_poison(record_id, f"unparseable 受信日時: {record.get('受信日時')!r}")
+                continue
+            if not checkpoint.is_pending(record_id, ts):
+                stats["skipped"] += 1
+                continue
+            received_at[record_id] = ts
+            yield record
+
+    def documents():
+        for record in pending_records():
+            try:
+                yield build_yoin_document(record)
+            except Exception as e:
+                print(f"Error building document for yoin ID {record.get('ID', 'unknown')}: {e}")
+                stats["failed"] += 1
+                stats["failed_ids"].append(record.get('ID', ''))
+                if checkpoint is not None:
+                    # 同じ行は何度やっても失敗するので、high-water mark を止めない
+                    checkpoint.mark_poison(record.get('ID', ''), f"build failed: {e}")
+                    received_at.pop(record.get('ID', ''), None)
+
+    def collect(batch, future):
+        ids = [d["id"] for d in batch]
+        try:
+            stats["indexed"] += future.result()
+            if HYBRID_SEARCH:
+                # 語彙インデックスもベクトルと同じ単位で更新する（ファイルへの書き出しは save_progress でまとめて行う）
+                get_lexical_index(YOIN_INDEX_NAME).upsert(batch, save=False)
+            bump_index_generation(YOIN_INDEX_NAME)
+            print(f"Indexed {len(ids)} yoin IDs: {', '.join(ids)}")
+            unsaved["batches"] += 1
+            if checkpoint is not None:
+                unsaved["done"].extend((i, received_at.pop(i)) for i in ids)
+            # 語彙インデックスを使わなければ、チェックポイントはバッチごとに記録する（追記だけなので軽い）
+            if not HYBRID_SEARCH or unsaved["batches"] >= LEXICAL_SAVE_BATCHES:
+                save_progress()
+        except Exception as e:
+            stats["failed"] += len(ids)
+            stats["failed_ids"].extend(ids)
+            retry_at.extend(received_at.pop(i) for i in ids if i in received_at)
+            print(f"Error indexing batch of {len(ids)} yoin IDs ({ids[0]}...): {e}")
+        jobs.report_progress(stats["indexed"] + stats["failed"] + stats["skipped"], stats["failed"])
+
+    # バッチ単位で並列にupsert（投入済みのバッチは workers の2倍まで）
+    started = time.monotonic()
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=INDEX_WORKERS, thread_name_prefix="index_yoin") as executor:
+        for batch in batched(documents(), INDEX_BATCH_SIZE):
+            pending.append((batch, timing.submit_with_context(executor, upsert_yoin_batch, vectorstore, batch)))
+            while len(pending) >= INDEX_WORKERS * 2:
+                collect(*pending.popleft())
+        while pending:
+            collect(*pending.popleft())
+    save_progress()
+
+    elapsed = time.monotonic() - started
+    stats["elapsed_sec"] = round(elapsed, 2)
+    stats["vectors_per_sec"] = round(stats["indexed"] / elapsed, 2) if elapsed > 0 else 0.0
+    print(
+        f"index_yoin summary: {stats['indexed']} vectors in {elapsed:.1f}s "
+        f"({stats['vectors_per_sec']} vectors/sec), {stats['failed']} failed"
+    )
+    if stats["failed_ids"]:
+        print(f"Failed yoin IDs: {', '.join(stats['failed_ids'])}")
+
+    if checkpoint is not None:
+        retry_from = min(retry_at, default=None)
+        checkpoint.advance(retry_from)
+        if retry_from is None:
+            print(f"Checkpoint advanced: {checkpoint.summary()}")
+        else:
+            # 最古の失敗より前までは進め、それ以降の登録済みIDは次回読み飛ばす
+            print(
+                f"Checkpoint advanced up to {retry_from.isoformat()} (oldest failed batch); "
+                f"{len(checkpoint.run_done)} IDs recorded for resume: {checkpoint.summary()}"
+            )
+        if checkpoint.poison:
+            print(f"Unindexable yoin IDs (do not hold back the checkpoint): {', '.join(sorted(checkpoint.poison))}")
+        stats["checkpoint"] = checkpoint.summary()
+        print(f"Skipped {stats['skipped']} already indexed records")
+
+    # 埋め込みキャッシュのヒット状況
+    embedding = get_embeddings()
+    if hasattr(embedding, "cache_stats"):
+        stats["embedding_cache"] = embedding.cache_stats()
+        print(f"Embedding cache: {stats['embedding_cache']}")
+    stats["timings"] = timings.report()
+    print(f"Timings: {stats['timings']}")
+    
+    print("index_yoin flow completed.")
+    return stats
+
+def get_index_generation(index_name: str) -> int:
+    """インデックスの世代番号（書き込みのたびに増える）"""
+    return index_generations.get(index_name, 0)
+
+def bump_index_generation(index_name: str):
+    """インデックスへの書き込みを記録し、このプロセスの検索結果キャッシュを無効化する"""
+    with index_generation_lock:
+        index_generations[index_name] = index_generations.get(index_name, 0) + 1
+
+def build_search_text(anken_data: Dict[str, Any]) -> str:
+    """案件データからベクトル検索用のクエリテキストを作成（重点キーワードで重み付け）"""
     重点キーワード = anken_data.get('重点キーワード', '')
     
     # より自然な形で重要度を高める
-    search_text = f"""
+    return f"""
 【最重要スキル】: {重点キーワード}
 案件名: {anken_data.get('案件名', '')}
 求めるスキル: {重点キーワード}
@@ -443,89 +1397,523 @@ def matching_yoin_flow(anken: str):
 備考: {anken_data.get('備考', '')}
 優先技術: {重点キーワード}
 """.strip()
+
+def build_lexical_query(anken_data: Dict[str, Any]) -> str:
+    """語彙検索用のクエリ（重点キーワードは2倍の重み）"""
+    重点キーワード = anken_data.get('重点キーワード', '')
+    return "\n".join([重点キーワード, 重点キーワード, anken_data.get('必須スキル', '')])
+
+def build_yoin_filter(anken_data: Dict[str, Any]) -> Dict[str, Any]:
+    """案件の勤務形態・作業場所・単価と受信日時の期間から、要員検索のメタデータフィルタを作る"""
+    from datetime import datetime, timedelta
+    from index_checkpoint import JST
+    from prefilter import anken_conditions, build_metadata_filter
+
+    if not MATCH_FILTER:
+        return {}
+    conditions = []
+    metadata_filter = build_metadata_filter(anken_conditions(anken_data), PREFILTER_PRICE_TOLERANCE)
+    if metadata_filter:
+        conditions.extend(metadata_filter["$and"])
+    if MATCH_RECENCY_DAYS > 0:
+        since = datetime.now(JST) - timedelta(days=MATCH_RECENCY_DAYS)
+        conditions.append({"recieved_at": {"$gte": int(since.strftime("%Y%m%d"))}})
+    return {"$and": conditions} if conditions else {}
+
+def existing_vector_ids(vectorstore, ids: List[str]) -> set:
+    """ベクトルストアに存在するIDだけを返す（語彙インデックスにだけ残った古いIDを除くため）"""
+    if not ids:
+        return set()
+    if hasattr(vectorstore, "index") and hasattr(vectorstore.index, "fetch"):
+        return set(vectorstore.index.fetch(ids=ids).vectors.keys())
+    try:
+        return {doc.id for doc in vectorstore.get_by_ids(ids)}
+    except NotImplementedError:
+        return set(ids)
+
+def fuse_with_lexical(dense_docs, lexical_query: str, k: int, index_name: str, filter: Dict[str, Any] = None):
+    """ベクトル検索結果と語彙検索結果を RRF で統合し、上位k件を返す
+
+    順位は RRF で決め、スコアはベクトル検索の類似度のまま返す（語彙検索だけでヒットした候補は None）。
+    RRF のスコアはメタデータの rrf_score に入れる
+    """
+    from langchain_core.documents import Document
+    from lexical_index import reciprocal_rank_fusion
+
+    lexical_index = get_lexical_index(index_name)
+    with timing.span("lexical_search"):
+        lexical_hits = lexical_index.search(lexical_query, k=HYBRID_DEPTH, filter=filter)
+    if not lexical_hits:
+        return dense_docs[:k]
+
+    dense_by_id = {doc.id: (doc, score) for doc, score in dense_docs}
+    dense_ranking = [doc.id for doc, _ in dense_docs]
+    lexical_ranking = [doc_id for doc_id, _ in lexical_hits]
+    fused = reciprocal_rank_fusion([dense_ranking, lexical_ranking], k=RRF_K)[:k]
+
+    # 語彙検索だけでヒットしたIDは、ベクトルストアから削除済みでないか確認する
+    lexical_only = [doc_id for doc_id, _ in fused if doc_id not in dense_by_id]
+    with timing.span("vector_fetch"):
+        alive = existing_vector_ids(get_vectorstore(index_name), lexical_only)
+
+    dense_rank = {doc_id: i for i, doc_id in enumerate(dense_ranking, start=1)}
+    lexical_rank = {doc_id: i for i, doc_id in enumerate(lexical_ranking, start=1)}
+    results = []
+    for doc_id, fused_score in fused:
+        score = None
+        if doc_id in dense_by_id:
+            base, score = dense_by_id[doc_id]
+            page_content, metadata = base.page_content, base.metadata
+        elif doc_id in alive:
+            entry = lexical_index.get(doc_id)
+            if entry is None:
+                continue
+            page_content = entry["text"]
+            metadata = {key: value for key, value in entry["metadata"].items() if key != "text"}
+        else:
+            continue
+        metadata = {**metadata, "dense_rank": dense_rank.get(doc_id), "lexical_rank": lexical_rank.get(doc_id),
+                    "rrf_score": round(fused_score, 6)}
+        results.append((Document(id=doc_id, page_content=page_content, metadata=metadata), score))
+    return results
+
+def retrieval_keys(search_text: str, k: int, index_name: str, lexical_query: str, filter: Dict[str, Any]):
+    """Returns: (hybrid, クエリ埋め込みキャッシュのキー, 検索結果キャッシュのキー)"""
+    hybrid = HYBRID_SEARCH and bool(lexical_query and lexical_query.strip())
+    query_key = " ".join(search_text.split())
+    lexical_key = " ".join(lexical_query.split()) if hybrid else None
+    filter_key = json.dumps(filter, ensure_ascii=False, sort_keys=True) if filter else None
+    return hybrid, query_key, (query_key, lexical_key, filter_key, k, index_name, get_index_generation(index_name))
+
+def search_by_embedding(embedding: List[float], k: int, index_name: str, lexical_query: str, filter: Dict[str, Any],
+                        hybrid: bool):
+    """クエリ埋め込みでベクトル検索（hybrid なら語彙検索と統合）。Returns: (docs, filter_fallback)"""
+    vectorstore = get_vectorstore(index_name)
+
+    def search(metadata_filter):
+        kwargs = {"filter": metadata_filter} if metadata_filter else {}
+        with timing.span("vector_search"):
+            dense_docs = vectorstore.similarity_search_by_vector_with_score(
+                embedding, k=max(k, HYBRID_DEPTH) if hybrid else k, **kwargs
+            )
+        if hybrid:
+            return fuse_with_lexical(dense_docs, lexical_query, k, index_name, filter=metadata_filter)
+        return dense_docs
+
+    docs = search(filter)
+    filter_fallback = bool(filter) and not docs
+    if filter_fallback:
+        print("No candidates matched the metadata filter; searching without it")
+        docs = search(None)
+    return docs, filter_fallback
+
+def search_cache_info(retrieval_hit: bool, embedding_hit: bool, hybrid: bool, filter, filter_fallback: bool) -> Dict[str, Any]:
+    return {"retrieval_hit": retrieval_hit, "embedding_hit": embedding_hit, "hybrid": hybrid,
+            "filtered": bool(filter), "filter_fallback": filter_fallback}
+
+def search_yoin_candidates(search_text: str, k: int = 20, index_name: str = YOIN_INDEX_NAME, lexical_query: str = None,
+                           filter: Dict[str, Any] = None):
+    """要員の検索（ベクトル検索、lexical_query がある場合は語彙検索とRRFで統合）
+
+    filter はPinecone形式のメタデータフィルタ（build_yoin_filter）。フィルタで1件も残らない場合は
+    フィルタなしで検索し直す（メタデータ追加前に登録した要員だけのインデックスなど）。
+    クエリ埋め込みと検索結果はキャッシュする。
+
+    Returns:
+        (docs, cache_info): docs は [(Document, score)]、cache_info はキャッシュのヒット状況
+    """
+    hybrid, query_key, result_key = retrieval_keys(search_text, k, index_name, lexical_query, filter)
+    cached = retrieval_cache.get(result_key)
+    if cached is not None:
+        docs, filter_fallback = cached
+        return docs, search_cache_info(True, True, hybrid, filter, filter_fallback)
+
+    embedding = query_embedding_cache.get(query_key)
+    embedding_hit = embedding is not None
+    if not embedding_hit:
+        with timing.span("query_embedding"):
+            embedding = get_embeddings().embed_query(search_text)
+        query_embedding_cache.put(query_key, embedding)
+
+    docs, filter_fallback = search_by_embedding(embedding, k, index_name, lexical_query, filter, hybrid)
+    retrieval_cache.put(result_key, (docs, filter_fallback))
+    return docs, search_cache_info(False, embedding_hit, hybrid, filter, filter_fallback)
+
+async def asearch_yoin_candidates(search_text: str, k: int = 20, index_name: str = YOIN_INDEX_NAME,
+                                  lexical_query: str = None, filter: Dict[str, Any] = None):
+    """search_yoin_candidates の非同期版（クエリ埋め込みは aembed_query、検索はスレッドプールで実行）"""
+    hybrid, query_key, result_key = retrieval_keys(search_text, k, index_name, lexical_query, filter)
+    cached = retrieval_cache.get(result_key)
+    if cached is not None:
+        docs, filter_fallback = cached
+        return docs, search_cache_info(True, True, hybrid, filter, filter_fallback)
+
+    embedding = query_embedding_cache.get(query_key)
+    embedding_hit = embedding is not None
+    if not embedding_hit:
+        with timing.span("query_embedding"):
+            embedding = await get_embeddings().aembed_query(search_text)
+        query_embedding_cache.put(query_key, embedding)
+
+    docs, filter_fallback = await run_blocking(search_by_embedding, embedding, k, index_name, lexical_query, filter, hybrid)
+    retrieval_cache.put(result_key, (docs, filter_fallback))
+    return docs, search_cache_info(False, embedding_hit, hybrid, filter, filter_fallback)
+
+def apply_prefilter(anken_data: Dict[str, Any], docs):
+    """事前フィルタを適用する。Returns: (docs, report)（無効時は report が None）"""
+    if not PREFILTER_ENABLED:
+        return docs, None
+    from prefilter import prefilter_candidates
+    return prefilter_candidates(anken_data, docs, price_tolerance=PREFILTER_PRICE_TOLERANCE)
+
+def prefilter_summary(report: Dict[str, Any]) -> Dict[str, Any]:
+    """ログ・ストリーム用の事前フィルタ結果（除外件数をルールごとに）"""
+    return {
+        "before": report["before"],
+        "after": report["after"],
+        "removed": report["removed"],
+        "annotated": len(report["notes"]),
+    }
+
+def format_score(score) -> str:
+    """プロンプトに載せる類似度（語彙検索だけでヒットした候補は類似度がない）"""
+    return "-（キーワード一致のみ）" if score is None else str(round(float(score), 4))
+
+def candidate_block(doc, score, notes: Dict[str, List[str]] = None) -> str:
+    """候補1件のプロンプト用テキスト（項目ごとに整形し、スキル・備考を切り詰める。事前フィルタの注記があれば添える）"""
+    from prompt_budget import compact_candidate
+    note_text = ""
+    if notes and doc.id in notes:
+        note_text = "\n【事前判定】 " + " / ".join(notes[doc.id])
+    content = compact_candidate(doc.page_content, MATCH_SKILL_MAX_ITEMS, MATCH_FIELD_MAX_CHARS)
+    return f"""
+■ 要員ID: {doc.id}
+スコア: {format_score(score)}
+{content}{note_text}
+-------------------------
+""".strip() + "\n"
+
+def build_matches_text(docs, notes: Dict[str, List[str]] = None) -> str:
+    """検索結果をLLMに渡すテキストにする"""
+    if not docs:
+        return "検索結果がありませんでした。"
+    return "".join(candidate_block(doc, score, notes) for doc, score in docs)
+
+def get_token_counter(provider: str = None, model: str = None):
+    """実際に呼び出すモデル（フォールバック後）のトークナイザーで数える関数"""
+    from prompt_budget import TokenCounter
+    identity = get_llm_identity(provider, model)
+    return TokenCounter(identity["provider"], identity["model"])
+
+def fit_matching_context(anken_data: Dict[str, Any], docs, notes: Dict[str, List[str]] = None,
+                         route: Tuple[str, str] = None):
+    """MATCHING_PROMPT 全体が MATCH_INPUT_TOKENS に収まる候補を検索順に残す
+
+    収まらない候補は飛ばして次を試す（先頭の1件は予算を超えても残す）。
+    Returns: (docs, matches_text, report)。report はリクエストごとのプロンプトの内訳（prompt_budget.context_report）
+    """
+    from prompt_budget import context_report, fit_to_budget
+    count = get_token_counter(*(route or (None, None)))
+    template = PromptTemplate.from_template(MATCHING_PROMPT)
+    anken_formatted = json.dumps(anken_data, ensure_ascii=False)
+    fixed = count(template.format(anken_formatted=anken_formatted, matches_text=""))
+    costs = [count(candidate_block(doc, score, notes)) for doc, score in docs]
+    kept, _ = fit_to_budget(costs, MATCH_INPUT_TOKENS - fixed)
+    selected = [docs[i] for i in kept]
+    matches_text = build_matches_text(selected, notes)
+    prompt_tokens = count(template.format(anken_formatted=anken_formatted, matches_text=matches_text))
+    report = context_report(count, len(docs), len(selected), MATCH_INPUT_TOKENS, prompt_tokens)
+    return selected, matches_text, report
+
+def observe_prompt(report: Dict[str, Any], mode: str):
+    metrics.matching_prompt_tokens.observe(report["prompt_tokens"], mode=mode)
+    metrics.matching_candidates_dropped.inc(report["dropped"], mode=mode)
+    print(f"Prompt: {report}")
+
+def split_candidate_groups(docs, size: int) -> List[list]:
+    """検索結果を size 件ずつのグループに分ける（検索順を保つ）"""
+    size = max(1, size)
+    return [docs[i:i + size] for i in range(0, len(docs), size)]
+
+def group_scoring_inputs(anken_data: Dict[str, Any], group, notes: Dict[str, List[str]] = None) -> Dict[str, str]:
+    return {
+        "anken_formatted": json.dumps(anken_data, ensure_ascii=False),
+        "matches_text": build_matches_text(group, notes)
+    }
+
+def group_scoring_chain(provider: str = None, model: str = None):
+    prompt = PromptTemplate.from_template(GROUP_SCORING_PROMPT)
+    return prompt | get_llm(provider, model) | JsonOutputParser(pydantic_object=GroupScoringResult)
+
+def as_score(value) -> float:
+    """マッチ度を数値に（"85点" のような文字列も許容、解釈できなければ0）"""
+    if isinstance(value, (int, float)):
+        return value
+    match = re.search(r"\d+(?:\.\d+)?", str(value or ""))
+    return float(match.group()) if match else 0
+
+def merge_group_scores(docs, scores: List[Dict[str, Any]], top_n: int = None) -> Dict[str, Any]:
+    """グループごとの採点結果を統合し、MATCHING_PROMPT と同じ形式（上位 top_n 名）にする
+
+    同点は検索順で並べ、比較チャート・推奨アクションは上位の要員の採点結果から組み立てる
+    """
+    from prefilter import infer_prefecture, parse_rag_fields
+
+    top_n = top_n or MATCH_TOP_N
+    rank = {doc.id: i for i, (doc, _) in enumerate(docs)}
+    by_id = {doc.id: doc for doc, _ in docs}
+    best: Dict[str, Dict[str, Any]] = {}
+    for entry in scores:
+        yoin_id = str(entry.get("要員ID", "")).strip()
+        if yoin_id in by_id and yoin_id not in best:
+            best[yoin_id] = entry
+    ranked = sorted(best.items(), key=lambda item: (-as_score(item[1].get("マッチ度")), rank[item[0]]))[:top_n]
+
+    candidates, chart, actions = [], [], []
+    for yoin_id, entry in ranked:
+        fields = parse_rag_fields(by_id[yoin_id].page_content)
+        name = fields.get("氏名") or yoin_id
+        score = as_score(entry.get("マッチ度"))
+        candidates.append({
+            "要員ID": yoin_id,
+            "受信日時": fields.get("受信日時", ""),
+            "要員情報": {
+                "氏名": name,
+                "年齢": fields.get("年齢", ""),
+                "スキル": fields.get("スキル", ""),
+                "希望単価": fields.get("単価（希望）", ""),
+                "最寄駅": fields.get("最寄駅", ""),
+                "都道府県": infer_prefecture(fields.get("最寄駅", "")) or "不明",
+                "希望勤務形態": fields.get("勤務形態（希望）", ""),
+                "備考": fields.get("備考", "")
+            },
+            "マッチ度": int(score) if float(score).is_integer() else score,
+            "理由コメント": entry.get("理由コメント", "")
+        })
+        chart.append({name: {
+            "スキルのマッチ度": entry.get("スキルのマッチ度", ""),
+            "勤務形態のマッチ度": entry.get("勤務形態のマッチ度", ""),
+            "単価のマッチ度": entry.get("単価のマッチ度", "")
+        }})
+        action = str(entry.get("推奨アクション", "") or "").strip()
+        if action:
+            actions.append(action if action.startswith(name) else f"{name}は{action}")
+    return {"candidates": candidates, "比較チャート": chart, "推奨アクション": actions}
+
+async def amatching_yoin_parallel(anken_data: Dict[str, Any], docs, notes: Dict[str, List[str]] = None,
+                                  routes: List[Tuple[str, str]] = None) -> Dict[str, Any]:
+    """候補をグループに分けて並列に採点し、統合する（mode=parallel）。結果には timings を付ける"""
+    async for event in matching_yoin_parallel_stream(anken_data, docs, notes, routes):
+        if event["type"] == "error":
+            raise RuntimeError(event["message"])
+        if event["type"] == "final_result":
+            return event["result"]
+
+async def matching_yoin_parallel_stream(anken_data: Dict[str, Any], docs, notes: Dict[str, List[str]] = None,
+                                       routes: List[Tuple[str, str]] = None):
+    """amatching_yoin_parallel のストリーミング版（グループの採点が終わるたびに group_result を送る）
+
+    routes は試すモデルの順番（llm_routes）。グループごとに、失敗したら次のモデルで採点し直す
+    """
+    import asyncio
+    import time
+
+    routes = routes or llm_routes()[0]
+    # 通常モードと同じ予算で候補を選んでからグループに分ける（prompt_tokens は各グループのプロンプトの合計）
+    with timing.span("prompt_build"):
+        docs, _, context = fit_matching_context(anken_data, docs, notes, routes[0])
+        groups = split_candidate_groups(docs, MATCH_GROUP_SIZE)
+        count = get_token_counter(*routes[0])
+        template = PromptTemplate.from_template(GROUP_SCORING_PROMPT)
+        context["prompt_tokens"] = sum(
+            count(template.format(**group_scoring_inputs(anken_data, group, notes))) for group in groups
+        )
+    observe_prompt(context, "parallel")
+    semaphore = asyncio.Semaphore(max(1, MATCH_PARALLELISM))
+    started = time.perf_counter()
+    yield {"type": "status", "message": f"{len(docs)}件を{len(groups)}グループに分けて並列に採点中...", "prompt": context}
+
+    async def work(index, group):
+        async with semaphore:
+            group_started = time.perf_counter()
+            scores, error, used = [], None, None
+            for attempt, (provider, model) in enumerate(routes, start=1):
+                used = f"{provider}:{model}"
+                try:
+                    result = await get_scheduler().acall(
+                        provider, lambda: group_scoring_chain(provider, model).ainvoke(group_scoring_inputs(anken_data, group, notes)),
+                        acquire=False, penalized=True, max_retries=None if attempt == len(routes) else 0
+                    )
+                    scores, error = result.get("scores", []), None
+                    break
+                except Exception as e:
+                    error = str(e)
+            elapsed_ms = round((time.perf_counter() - group_started) * 1000, 1)
+            timing.record("llm_group", elapsed_ms)
+            print(f"Group {index}/{len(groups)}: {len(group)} candidates in {elapsed_ms}ms via {used}"
+                  + (f" (error: {error})" if error else ""))
+            return {"group": index, "size": len(group), "elapsed_ms": elapsed_ms, "model": used, "error": error}, scores
+
+    timings, all_scores = [], []
+    tasks = [asyncio.ensure_future(work(index, group)) for index, group in enumerate(groups, start=1)]
+    for future in asyncio.as_completed(tasks):
+        group_timing, scores = await future
+        timings.append(group_timing)
+        all_scores.extend(scores)
+        yield {
+            "type": "group_result",
+            "message": f"グループ{group_timing['group']}/{len(groups)}の採点完了" + ("（失敗）" if group_timing["error"] else ""),
+            **group_timing,
+            "scores": scores
+        }
+
+    timings.sort(key=lambda group_timing: group_timing["group"])
+    if groups and all(group_timing["error"] for group_timing in timings):
+        yield {"type": "error", "message": f"採点に失敗しました: {timings[0]['error']}", "timings": timings}
+        return
+    with timing.span("merge"):
+        result = merge_group_scores(docs, all_scores)
+    # 採点に失敗したグループの要員は candidates に含まれないため、候補と並べて返す
+    failed_groups = [
+        {"group": group_timing["group"], "yoin_ids": [doc.id for doc, _ in groups[group_timing["group"] - 1]],
+         "error": group_timing["error"]}
+        for group_timing in timings if group_timing["error"]
+    ]
+    result = {"candidates": result.pop("candidates"), "failed_groups": failed_groups, **result}
+    result["timings"] = {"groups": timings, "total_ms": round((time.perf_counter() - started) * 1000, 1)}
+    result["prompt"] = context
+    yield {
+        "type": "final_result",
+        "message": "マッチング分析完了" + (f"（{len(failed_groups)}グループは採点に失敗）" if failed_groups else ""),
+        "result": result
+    }
+
+# 要員マッチフロー
+def matching_yoin_flow(anken: str, mode: str = None, provider: str = None, model: str = None):
+    """要員マッチフロー（CLI用の同期版。amatching_yoin_flow を新しいイベントループで実行する）"""
+    import asyncio
+    return asyncio.run(amatching_yoin_flow(anken, mode, provider, model))
+
+async def amatching_yoin_flow(anken: str, mode: str = None, provider: str = None, model: str = None):
+    """要員マッチフロー（mode="parallel" でグループごとの並列採点）
+
+    provider / model で llm_config.LLM_MODELS のモデルを指定できる（省略時は LLM_PROVIDER / LLM_MODEL）。
+
+    埋め込み・LLMは非同期で呼び出し、ベクトル検索はスレッドプールで実行する（APIのイベントループを止めない）。
+    段階ごとの所要時間は timing.current() に記録される（APIでは Server-Timing ヘッダに出力）
+    """
+    print("Starting matching_yoin flow...")
+    timings = timing.start()
+    routes, routing = llm_routes(provider, model)
+    if routing:
+        print(f"Routing: {routing}")
     
-    # Initialize Pinecone vector store
-    vectorstore = PineconeVectorStore(
-        index_name="yoin2",
-        embedding=get_embeddings(),
-        pinecone_api_key=PINECONE_API_KEY
+    # Parse anken data
+    anken_data = json.loads(anken)
+    
+    # Create search text with weighted keywords (improved approach)
+    search_text = build_search_text(anken_data)
+    
+    # Search similar vectors（キャッシュ経由）
+    docs, cache_info = await asearch_yoin_candidates(
+        search_text, k=MATCH_RETRIEVAL_K, lexical_query=build_lexical_query(anken_data), filter=build_yoin_filter(anken_data)
     )
+    print(f"Search cache: {cache_info}")
     
-    # Search similar vectors
-    docs = vectorstore.similarity_search_with_score(search_text, k=20)
+    # 勤務形態・地域・単価の事前フィルタ
+    with timing.span("prefilter"):
+        docs, prefilter_report = apply_prefilter(anken_data, docs)
+    if prefilter_report:
+        print(f"Prefilter: {prefilter_summary(prefilter_report)}")
     
     # Format results for LLM
-    matches_text = ""
-    if docs:
-        for doc, score in docs:
-            print("debug")
-            print(doc.page_content)
-            matches_text += f"""
-■ 要員ID: {doc.id}
-スコア: {score}
-{doc.page_content}
--------------------------
-""".strip() + "\n"
-    else:
-        matches_text = "検索結果がありませんでした。"
+    for doc, score in docs:
+        print("debug")
+        print(doc.page_content)
+    notes = prefilter_report["notes"] if prefilter_report else None
+    
+    if mode == "parallel":
+        result = await amatching_yoin_parallel(anken_data, docs, notes, routes)
+        print("Matching result:")
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        print(f"Timings: {timings.report()}")
+        print("matching_yoin flow completed.")
+        return result
     
     # LLM matching - マルチプロバイダー対応
-    prompt = PromptTemplate.from_template(MATCHING_PROMPT)
+    with timing.span("prompt_build"):
+        docs, matches_text, context = fit_matching_context(anken_data, docs, notes, routes[0])
+        prompt_value = PromptTemplate.from_template(MATCHING_PROMPT).invoke({
+            "anken_formatted": json.dumps(anken_data, ensure_ascii=False),
+            "matches_text": matches_text
+        })
 
-    print(f"debug - Using LLM Provider: {LLM_PROVIDER}, Model: {LLM_MODEL or 'default'}")
+    print(f"debug - Using LLM routes: {routes}")
     print("debug" + MATCHING_PROMPT)
     
-    chain = prompt | get_llm() | JsonOutputParser(pydantic_object=MatchingResult)
-    result = chain.invoke({
-        "anken_formatted": json.dumps(anken_data, ensure_ascii=False),
-        "matches_text": matches_text
-    })
+    with timing.span("llm_complete"):
+        response, (provider, model) = await ainvoke_with_fallback(routes, prompt_value)
+    with timing.span("parse"):
+        result = JsonOutputParser(pydantic_object=MatchingResult).invoke(response)
+    observe_prompt(context, "single")
+    result["prompt"] = context
     
     print("Matching result:")
     print(json.dumps(result, ensure_ascii=False, indent=2))
+    print(f"Timings: {timings.report()}")
     print("matching_yoin flow completed.")
     return result
 
 # 要員マッチフロー（ストリーミング対応・高速化版）
-async def matching_yoin_flow_stream(anken: str, mode: str = None):
-    """要員マッチフロー（ストリーミング対応・マルチプロバイダー対応）"""
+async def matching_yoin_flow_stream(anken: str, mode: str = None, include_accumulated: bool = None,
+                                    provider: str = None, model: str = None):
+    """要員マッチフロー（ストリーミング対応・マルチプロバイダー対応）
+
+    LLMの出力はストリーム中に読み進め、候補者・比較チャートの各要素と推奨アクションを
+    閉じた時点で candidate_ready / comparison_ready / actions_ready として送る。
+    最後に段階ごとの所要時間を timings イベントとして送る
+    """
+    timings = timing.start()
+    async for event in matching_yoin_stream_events(anken, mode, include_accumulated, provider, model):
+        yield event
+    yield {"type": "timings", **timings.report()}
+
+async def matching_yoin_stream_events(anken: str, mode: str = None, include_accumulated: bool = None,
+                                      provider: str = None, model: str = None):
+    """matching_yoin_flow_stream の本体（timings イベント以外）"""
     import asyncio
+    import time
     
-    yield {"type": "status", "message": f"案件データを解析中... (Provider: {LLM_PROVIDER}, Model: {LLM_MODEL or 'default'})"}
-    await asyncio.sleep(0.1)
+    routes, routing = llm_routes(provider, model, streaming=True)
+    provider, model = routes[0]
+    yield {"type": "status", "message": f"案件データを解析中... (Provider: {provider}, Model: {model})"}
+    if routing:
+        yield {"type": "status", "message": routing_message(routing), "routing": routing}
+    await asyncio.sleep(STREAM_STAGE_DELAY)
     
     # Parse anken data
     anken_data = json.loads(anken)
     
     yield {"type": "status", "message": "検索クエリを作成中..."}
-    await asyncio.sleep(0.1)
+    await asyncio.sleep(STREAM_STAGE_DELAY)
     
     # Create search text with weighted keywords
-    重点キーワード = anken_data.get('重点キーワード', '')
-    
-    search_text = f"""
-【最重要スキル】: {重点キーワード}
-案件名: {anken_data.get('案件名', '')}
-求めるスキル: {重点キーワード}
-必須スキル: {anken_data.get('必須スキル', '')}
-作業場所: {anken_data.get('作業場所', '')}
-単価: {anken_data.get('単価', '')}
-備考: {anken_data.get('備考', '')}
-優先技術: {重点キーワード}
-""".strip()
+    search_text = build_search_text(anken_data)
     
     yield {"type": "status", "message": "データベースから要員を検索中..."}
-    await asyncio.sleep(0.1)
+    await asyncio.sleep(STREAM_STAGE_DELAY)
     
-    # Initialize Pinecone vector store
-    vectorstore = PineconeVectorStore(
-        index_name="yoin2",
-        embedding=get_embeddings(),
-        pinecone_api_key=PINECONE_API_KEY
+    # Search similar vectors（キャッシュ経由）
+    docs, cache_info = await asearch_yoin_candidates(
+        search_text, k=MATCH_QUICK_K if mode == "quick" else MATCH_RETRIEVAL_K,
+        lexical_query=build_lexical_query(anken_data), filter=build_yoin_filter(anken_data)
     )
-    
-    # Search similar vectors
-    docs = vectorstore.similarity_search_with_score(search_text, k=20)
+    if cache_info["retrieval_hit"]:
+        yield {"type": "status", "message": "検索結果キャッシュを使用", "cache": cache_info}
+    elif cache_info["embedding_hit"]:
+        yield {"type": "status", "message": "クエリ埋め込みキャッシュを使用", "cache": cache_info}
+    if cache_info["filter_fallback"]:
+        yield {"type": "status", "message": "条件に合う要員がいないため、絞り込みなしで検索しました", "cache": cache_info}
     
     # 見つかった要員のIDリストを作成
     found_yoin_ids = [doc.id for doc, score in docs]
@@ -534,9 +1922,10 @@ async def matching_yoin_flow_stream(anken: str, mode: str = None):
         "type": "search_complete", 
         "message": f"{len(docs)}件の候補を発見", 
         "count": len(docs),
-        "yoin_ids": found_yoin_ids
+        "yoin_ids": found_yoin_ids,
+        "cache": cache_info
     }
-    await asyncio.sleep(0.1)
+    await asyncio.sleep(STREAM_STAGE_DELAY)
     
     # quickモードの場合は検索結果のみ返す
     if mode == "quick":
@@ -545,7 +1934,7 @@ async def matching_yoin_flow_stream(anken: str, mode: str = None):
             formatted_results.append({
                 "id": doc.id,
                 "content": doc.page_content,
-                "score": float(score),
+                "score": float(score) if score is not None else None,
                 "metadata": doc.metadata
             })
             yield {
@@ -554,7 +1943,7 @@ async def matching_yoin_flow_stream(anken: str, mode: str = None):
                 "total": len(docs),
                 "result": formatted_results[-1]
             }
-            await asyncio.sleep(0.05)
+            await asyncio.sleep(STREAM_STAGE_DELAY)
         
         yield {
             "type": "final_result",
@@ -564,102 +1953,150 @@ async def matching_yoin_flow_stream(anken: str, mode: str = None):
         return
     
     # 通常モード: LLMでのマッチング分析（高速化対応）
-    yield {"type": "status", "message": f"AI分析を開始中... (Using {LLM_PROVIDER}:{LLM_MODEL or 'default'})"}
-    await asyncio.sleep(0.1)
+    yield {"type": "status", "message": f"AI分析を開始中... (Using {provider}:{model})"}
+    await asyncio.sleep(STREAM_STAGE_DELAY)
+    
+    # 勤務形態・地域・単価の事前フィルタ
+    with timing.span("prefilter"):
+        docs, prefilter_report = apply_prefilter(anken_data, docs)
+    if prefilter_report:
+        summary = prefilter_summary(prefilter_report)
+        removed_total = summary["before"] - summary["after"]
+        yield {
+            "type": "prefilter",
+            "message": f"事前フィルタで{removed_total}件を除外（残り{summary['after']}件）",
+            **summary
+        }
+    
+    notes = prefilter_report["notes"] if prefilter_report else None
+    
+    # parallelモード: グループごとに並列採点して統合
+    if mode == "parallel":
+        async for event in matching_yoin_parallel_stream(anken_data, docs, notes, routes):
+            yield event
+        return
     
     # Format results for LLM
-    matches_text = ""
-    if docs:
-        for doc, score in docs:
-            matches_text += f"""
-■ 要員ID: {doc.id}
-スコア: {score}
-{doc.page_content}
--------------------------
-""".strip() + "\n"
-    else:
-        matches_text = "検索結果がありませんでした。"
+    with timing.span("prompt_build"):
+        docs, matches_text, context = fit_matching_context(anken_data, docs, notes, (provider, model))
+    observe_prompt(context, "stream")
     
-    yield {"type": "status", "message": "マッチング分析中..."}
-    await asyncio.sleep(0.1)
+    yield {
+        "type": "status",
+        "message": f"マッチング分析中...（候補{context['candidates']}件、入力 約{context['prompt_tokens']}トークン）",
+        "prompt": context
+    }
+    await asyncio.sleep(STREAM_STAGE_DELAY)
     
     # LLM matching with streaming - マルチプロバイダー対応
     prompt = PromptTemplate.from_template(MATCHING_PROMPT)
     
-    # ストリーミング対応のLLM作成（設定ファイルベース）
-    from llm_config import get_model_config
-    model_config = get_model_config(LLM_PROVIDER, LLM_MODEL)
-    
-    if LLM_PROVIDER == "ai_studio":
-        try:
-            from langchain_google_genai import ChatGoogleGenerativeAI
-            llm_stream = ChatGoogleGenerativeAI(
-                model=model_config["model"],
-                temperature=model_config["temperature"],
-                google_api_key=GEMINI_API_KEY,
-                streaming=True
-            )
-        except ImportError:
-            from langchain_openai import ChatOpenAI
-            fallback_config = get_model_config("openai", "gpt4o_mini")
-            llm_stream = ChatOpenAI(
-                model=fallback_config["model"], 
-                temperature=fallback_config["temperature"], 
-                api_key=OPENAI_API_KEY,
-                streaming=True
-            )
-    elif LLM_PROVIDER == "bedrock":
-        try:
-            from langchain_aws import ChatBedrock
-            llm_stream = ChatBedrock(
-                model_id=model_config["model_id"],
-                region_name=model_config.get("region_name", AWS_REGION),
-                model_kwargs={"temperature": model_config["temperature"]},
-                streaming=True
-            )
-        except ImportError:
-            from langchain_openai import ChatOpenAI
-            fallback_config = get_model_config("openai", "gpt4o_mini")
-            llm_stream = ChatOpenAI(
-                model=fallback_config["model"], 
-                temperature=fallback_config["temperature"], 
-                api_key=OPENAI_API_KEY,
-                streaming=True
-            )
-    else:  # OpenAI
-        from langchain_openai import ChatOpenAI
-        llm_stream = ChatOpenAI(
-            model=model_config["model"], 
-            temperature=model_config["temperature"], 
-            api_key=OPENAI_API_KEY,
-            streaming=True
-        )
-    
-    chain = prompt | llm_stream
+    prompt_inputs = {
+        "anken_formatted": json.dumps(anken_data, ensure_ascii=False),
+        "matches_text": matches_text
+    }
     
     # ストリーミングでLLMレスポンスを処理
+    from stream_json import IncrementalJsonParser
+    if include_accumulated is None:
+        include_accumulated = STREAM_INCLUDE_ACCUMULATED
+    stream_parser = IncrementalJsonParser(MATCHING_STREAM_WATCH)
     accumulated_response = ""
-    async for chunk in chain.astream({
-        "anken_formatted": json.dumps(anken_data, ensure_ascii=False),
-        "matches_text": matches_text
-    }):
-        if chunk.content:
-            accumulated_response += chunk.content
+    llm_started = time.perf_counter()
+    first_token = True
+    from hedging import hedged_astream
+    
+    def open_stream(route):
+        # ストリーミング用のクライアント（レジストリで再利用）
+        return (prompt | get_llm(*route, streaming=True)).astream(prompt_inputs)
+    
+    tried = []
+    for provider, model in routes:
+        if (provider, model) in tried:
+            continue
+        backup, delay = hedge_plan((provider, model), routes) if not tried else (None, None)
+        tried += [(provider, model)] + ([backup] if backup else [])
+        if backup:
+            metrics.llm_hedge_streams.inc(provider=provider, model=model)
+            metrics.llm_hedge_delay.observe(delay, provider=provider, model=model)
+        try:
+            async for kind, value in hedged_astream(open_stream, (provider, model), backup, delay,
+                                                    prompt_tokens=context["prompt_tokens"]):
+                if kind == "hedge":
+                    reason = f"{delay:.1f}秒以内に応答が始まらないため" if value == "timeout" else "失敗したため"
+                    yield {
+                        "type": "status",
+                        "message": f"{provider}:{model} が{reason} {backup[0]}:{backup[1]} にも送信しました",
+                        "hedge": {"primary": f"{provider}:{model}", "backup": f"{backup[0]}:{backup[1]}",
+                                  "reason": value, "delay_sec": round(delay, 3)}
+                    }
+                    continue
+                if kind == "winner":
+                    if value["hedged"]:
+                        winner = "backup" if value["route"] == backup else "primary"
+                        metrics.llm_hedges.inc(provider=provider, model=model, winner=winner)
+                        metrics.llm_hedge_wasted_tokens.inc(value["wasted_prompt_tokens"], provider=provider,
+                                                            model=model, type="prompt")
+                        metrics.llm_hedge_wasted_tokens.inc(value["wasted_completion_tokens"], provider=provider,
+                                                            model=model, type="completion")
+                        print(f"Hedge for {provider}:{model}: {winner} {value['route'][0]}:{value['route'][1]} "
+                              f"started first ({value['wasted_prompt_tokens']} prompt + "
+                              f"{value['wasted_completion_tokens']} completion tokens wasted)")
+                    provider, model = value["route"]
+                    continue
+                chunk = value
+                if chunk.content:
+                    if first_token:
+                        timing.record("llm_first_token", (time.perf_counter() - llm_started) * 1000)
+                        first_token = False
+                    accumulated_response += chunk.content
+                    event = {"type": "llm_chunk", "content": chunk.content}
+                    if include_accumulated:
+                        event["accumulated"] = accumulated_response
+                    yield event
+                    for event_type, index, value in stream_parser.feed(chunk.content):
+                        if event_type == "candidate_ready":
+                            yield {"type": event_type, "index": index + 1, "candidate": value}
+                        elif event_type == "comparison_ready":
+                            yield {"type": event_type, "index": index + 1, "entry": value}
+                        else:
+                            yield {"type": event_type, "actions": value}
+            break
+        except Exception as e:
+            # 最初のトークンを送った後は切り替えられない（クライアントに途中までの出力が届いている）
+            remaining = [route for route in routes if route not in tried]
+            if not first_token or not remaining:
+                raise
+            next_provider, next_model = remaining[0]
+            print(f"LLM {provider}:{model} failed before the first token ({e}); "
+                  f"falling back to {next_provider}:{next_model}")
             yield {
-                "type": "llm_chunk",
-                "content": chunk.content,
-                "accumulated": accumulated_response
+                "type": "status",
+                "message": f"{provider}:{model} が失敗したため {next_provider}:{next_model} に切り替えます",
+                "routing": {"failed": f"{provider}:{model}", "error": str(e)[:200],
+                            "selected": f"{next_provider}:{next_model}"}
             }
     
+    timing.record("llm_complete", (time.perf_counter() - llm_started) * 1000)
+    
     yield {"type": "status", "message": "分析結果を整理中..."}
-    await asyncio.sleep(0.1)
+    await asyncio.sleep(STREAM_STAGE_DELAY)
     
     # Parse final JSON result
     try:
         # JSONパーサーで最終結果を解析
         from langchain_core.output_parsers import JsonOutputParser
         parser = JsonOutputParser(pydantic_object=MatchingResult)
-        result = parser.parse(accumulated_response)
+        with timing.span("parse"):
+            try:
+                result = parser.parse(accumulated_response)
+            except Exception:
+                # 末尾カンマ・カンマ抜けなどの崩れを補正して読み直す
+                from stream_json import lenient_loads
+                start, end = accumulated_response.find("{"), accumulated_response.rfind("}")
+                if start < 0 or end < start:
+                    raise
+                result = lenient_loads(accumulated_response[start:end + 1])
         
         yield {
             "type": "final_result",
@@ -680,7 +2117,10 @@ def main(action: str, **kwargs):
         "end_date": kwargs.get("end_date"),
         "limit": kwargs.get("limit"),
         "offset": kwargs.get("offset"),
-        "with_index": kwargs.get("with_index")
+        "with_index": kwargs.get("with_index"),
+        "concurrency": kwargs.get("concurrency"),
+        "incremental": kwargs.get("incremental"),
+        "no_cache": kwargs.get("no_cache")
     }
     
     if action == "format_yoin":
@@ -690,14 +2130,17 @@ def main(action: str, **kwargs):
     elif action == "index_yoin":
         index_yoin_flow(params)
     elif action == "matching_yoin":
-        matching_yoin_flow(kwargs.get("anken", ""))
+        matching_yoin_flow(kwargs.get("anken", ""), kwargs.get("mode", None), kwargs.get("provider"), kwargs.get("model"))
     elif action == "matching_yoin_stream":
         # ストリーミング版の実行（asyncio対応）
         import asyncio
         async def run_stream():
             async for chunk in matching_yoin_flow_stream(
                 kwargs.get("anken", ""), 
-                kwargs.get("mode", None)
+                kwargs.get("mode", None),
+                param_flag(kwargs, "include_accumulated") if "include_accumulated" in kwargs else None,
+                kwargs.get("provider"),
+                kwargs.get("model")
             ):
                 print(f"Stream chunk: {chunk}")
         
@@ -0,0 +1,299 @@
+"""
+バッチフロー（構造化・RAG登録）のバックグラウンド実行
+
+    manager = JobManager(JobStore(".cache/jobs.sqlite3"), {"format_yoin": format_yoin_flow}, executor)
+    job = manager.submit("format_yoin", params)   # すぐにジョブIDを返し、フローはスレッドプールで実行する
+    manager.get(job.id).to_dict()                 # 処理件数・失敗件数・合計件数・スループット・残り時間
+    manager.cancel(job.id)
+
+状態と進捗はSQLiteに保存し、再起動時は resume() で未完了のジョブを最初から実行し直す
+（構造化は応答キャッシュ、RAG登録は埋め込みキャッシュ・チェックポイントにより処理済み分はすぐに終わる）。
+フローの中からは start_phase / report_total / report_progress で進捗を伝える（ジョブ外では何もしない）。
+取り消されたジョブは、次に進捗を報告した時点で JobCancelled を送出して止まる。
+"""
+
+import contextvars
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+UNFINISHED = (QUEUED, RUNNING)
+
+# 進捗をSQLiteに書き込む最短間隔（秒）。状態の変化は常に書き込む
+_SAVE_INTERVAL = 1.0
+
+_COLUMNS = ("id", "action", "params", "status", "phase", "processed", "failed", "total", "created_at", "started_at",
+            "phase_started", "finished_at", "error", "result", "resumed", "cancel_requested")
+
+_current: contextvars.ContextVar = contextvars.ContextVar("job", default=None)
+
+
+class JobCancelled(Exception):
+    """ジョブが取り消された（フローの途中で送出される）"""
+
+
+class Job:
+    """1件のジョブの状態（進捗は現在のフェーズ、例えば format_yoin の後の index_yoin ごと）"""
+
+    def __init__(self, id: str, action: str, params: Dict[str, Any]):
+        self.id = id
+        self.action = action
+        self.params = params
+        self.status = QUEUED
+        self.phase: Optional[str] = None
+        self.processed = 0
+        self.failed = 0
+        self.total: Optional[int] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.phase_started: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.error: Optional[str] = None
+        self.result: Any = None
+        self.resumed = 0
+        self.cancel_requested = False
+        self.store: Optional["JobStore"] = None
+        self._saved_at = 0.0
+
+    def save(self, force: bool = True):
+        if self.store is None:
+            return
+        now = time.monotonic()
+        if force or now - self._saved_at >= _SAVE_INTERVAL:
+            self._saved_at = now
+            self.store.save(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        records_per_sec = eta_sec = None
+        if self.phase_started is not None:
+            elapsed = (self.finished_at or time.time()) - self.phase_started
+            if elapsed > 0 and self.processed:
+                records_per_sec = round(self.processed / elapsed, 2)
+        if self.status == RUNNING and records_per_sec and self.total is not None:
+            eta_sec = round(max(0, self.total - self.processed) / records_per_sec, 1)
+        return {
+            "id": self.id,
+            "action": self.action,
+            "params": self.params,
+            "status": self.status,
+            "phase": self.phase,
+            "processed": self.processed,
+            "failed": self.failed,
+            "total": self.total,
+            "records_per_sec": records_per_sec,
+            "eta_sec": eta_sec,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+            "result": self.result,
+            "resumed": self.resumed,
+            "cancel_requested": self.cancel_requested,
+        }
+
+
+class JobStore:
+    """ジョブの永続化（SQLite、WALモード。複数スレッドから利用できる）"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, action TEXT NOT NULL, params TEXT NOT NULL, status TEXT NOT NULL,"
+            " phase TEXT, processed INTEGER NOT NULL, failed INTEGER NOT NULL, total INTEGER,"
+            " created_at REAL NOT NULL, started_at REAL, phase_started REAL, finished_at REAL,"
+            " error TEXT, result TEXT, resumed INTEGER NOT NULL, cancel_requested INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_created_at ON jobs(created_at)")
+
+    def save(self, job: Job):
+        values = (
+            job.id, job.action, json.dumps(job.params, ensure_ascii=False), job.status, job.phase, job.processed,
+            job.failed, job.total, job.created_at, job.started_at, job.phase_started, job.finished_at, job.error,
+            json.dumps(job.result, ensure_ascii=False, default=str) if job.result is not None else None,
+            job.resumed, int(job.cancel_requested),
+        )
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO jobs ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})",
+                values
+            )
+
+    def _job(self, row) -> Job:
+        data = dict(zip(_COLUMNS, row))
+        job = Job(data["id"], data["action"], json.loads(data["params"]))
+        for key in ("status", "phase", "processed", "failed", "total", "created_at", "started_at", "phase_started",
+                    "finished_at", "error", "resumed"):
+            setattr(job, key, data[key])
+        job.result = json.loads(data["result"]) if data["result"] else None
+        job.cancel_requested = bool(data["cancel_requested"])
+        job.store = self
+        return job
+
+    def _select(self, where: str = "", args=(), limit: int = None) -> List[Job]:
+        sql = f"SELECT {', '.join(_COLUMNS)} FROM jobs {where} ORDER BY created_at DESC"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        with self._lock:
+            rows = self._conn.execute(sql, args).fetchall()
+        return [self._job(row) for row in rows]
+
+    def load(self, job_id: str) -> Optional[Job]:
+        jobs = self._select("WHERE id = ?", (job_id,))
+        return jobs[0] if jobs else None
+
+    def recent(self, limit: int = 20) -> List[Job]:
+        return self._select(limit=limit)
+
+    def unfinished(self) -> List[Job]:
+        """待機中・実行中のまま残っているジョブ（古い順）"""
+        return list(reversed(self._select("WHERE status IN (?, ?)", UNFINISHED)))
+
+
+class JobManager:
+    """ジョブの受け付け・実行・取り消し（同時実行数は executor のスレッド数で決まる）"""
+
+    def __init__(self, store: JobStore, runners: Dict[str, Callable[[Dict[str, Any]], Any]], executor):
+        self.store = store
+        self.runners = runners
+        self.executor = executor
+        self.jobs: Dict[str, Job] = {}  # このプロセスで待機中・実行中のジョブ
+        self._lock = threading.Lock()
+
+    def submit(self, action: str, params: Dict[str, Any]) -> Job:
+        if action not in self.runners:
+            raise ValueError(f"Unknown job action: {action}")
+        job = Job(uuid.uuid4().hex, action, dict(params or {}))
+        job.store = self.store
+        job.save()
+        self._enqueue(job)
+        print(f"Job {job.id} queued: {action}")
+        return job
+
+    def _enqueue(self, job: Job):
+        with self._lock:
+            self.jobs[job.id] = job
+        # 空のコンテキストで実行する（ワーカースレッドに前のジョブの計測・進捗を残さない）
+        self.executor.submit(contextvars.Context().run, self._run, job)
+
+    def _run(self, job: Job):
+        with self._lock:
+            runnable = job.status == QUEUED
+            if runnable:
+                job.status = RUNNING
+                job.started_at = time.time()
+        if not runnable:
+            self._forget(job)
+            return
+        job.save()
+        _current.set(job)
+        try:
+            job.result = self.runners[job.action](dict(job.params))
+            job.status = SUCCEEDED
+        except JobCancelled:
+            job.status = CANCELLED
+        except Exception as e:
+            job.status = FAILED
+            job.error = str(e)
+            print(f"Job {job.id} ({job.action}) failed: {e}")
+        job.finished_at = time.time()
+        job.save()
+        self._forget(job)
+        print(f"Job {job.id} ({job.action}) {job.status}: {job.processed} processed, {job.failed} failed")
+
+    def _forget(self, job: Job):
+        with self._lock:
+            self.jobs.pop(job.id, None)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            job = self.jobs.get(job_id)
+        return job or self.store.load(job_id)
+
+    def recent(self, limit: int = 20) -> List[Job]:
+        with self._lock:
+            live = dict(self.jobs)
+        return [live.get(job.id, job) for job in self.store.recent(limit)]
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """待機中のジョブはすぐに、実行中のジョブは次の進捗報告で取り消す"""
+        job = self.get(job_id)
+        if job is None or job.status not in UNFINISHED:
+            return job
+        with self._lock:
+            job.cancel_requested = True
+            if job.status == QUEUED:
+                job.status = CANCELLED
+                job.finished_at = time.time()
+        job.save()
+        return job
+
+    def resume(self) -> List[Job]:
+        """前回の起動で終わらなかったジョブを再実行する（取り消し済みのものは取り消しとして閉じる）"""
+        resumed = []
+        for job in self.store.unfinished():
+            if job.id in self.jobs:
+                continue
+            if job.cancel_requested:
+                job.status = CANCELLED
+                job.finished_at = time.time()
+                job.save()
+                continue
+            job.status = QUEUED
+            job.resumed += 1
+            job.processed = job.failed = 0
+            job.total = job.phase = job.phase_started = None
+            job.save()
+            self._enqueue(job)
+            resumed.append(job)
+            print(f"Job {job.id} resumed: {job.action} (attempt {job.resumed + 1})")
+        return resumed
+
+
+def current() -> Optional[Job]:
+    return _current.get()
+
+
+def start_phase(name: str):
+    """進捗の集計を新しいフェーズで始める（件数・合計・スループットの起点をリセット）"""
+    job = _current.get()
+    if job is None:
+        return
+    job.phase = name
+    job.processed = job.failed = 0
+    job.total = None
+    job.phase_started = time.time()
+    job.save()
+
+
+def report_total(total: Optional[int]):
+    job = _current.get()
+    if job is not None:
+        job.total = total
+        job.save()
+
+
+def report_progress(processed: int, failed: int = 0):
+    """現在のフェーズの処理件数（失敗を含む）と失敗件数を記録する。取り消されていれば JobCancelled を送出する"""
+    job = _current.get()
+    if job is None:
+        return
+    job.processed = processed
+    job.failed = failed
+    job.save(force=False)
+    if job.cancel_requested:
+        raise JobCancelled(job.id)
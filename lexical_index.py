@@ -0,0 +1,189 @@
+"""
+要員のスキル・プロフィール欄に対する語彙（キーワード）インデックス
+日本語は文字bigram、英数字は単語単位でトークン化し、BM25でスコアリングする
+ベクトル検索の結果とは reciprocal_rank_fusion で統合する
+"""
+
+import math
+import os
+import pickle
+import re
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from metadata_filter import matches_filter
+
+# 英数字の技術用語（c++, c#, node.js, vue.js, asp.net 等を1語として扱う）
+_WORD_PATTERN = re.compile(r"[a-z0-9][a-z0-9+#]*(?:[._-][a-z0-9+#]+)*")
+# 日本語（ひらがな・カタカナ・漢字）の連続
+_JA_PATTERN = re.compile(r"[\u3040-\u30ff\u3400-\u9fff\uf900-\ufaff]+")
+
+# BM25のパラメータ
+_K1 = 1.2
+_B = 0.75
+
+
+def tokenize(text: str) -> List[str]:
+    """英数字は単語、日本語は文字bigram（1文字の語はそのまま）に分割する"""
+    if not text:
+        return []
+    text = unicodedata.normalize("NFKC", str(text)).lower()
+    tokens = _WORD_PATTERN.findall(text)
+    for run in _JA_PATTERN.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def yoin_lexical_text(record: Dict[str, Any]) -> str:
+    """語彙インデックスに載せる要員の欄（スキルは2倍の重み）"""
+    skill = record.get("スキル", "") or ""
+    return "\n".join([
+        skill,
+        skill,
+        record.get("備考", "") or "",
+        record.get("勤務形態（希望）", "") or "",
+        record.get("メールタイトル", "") or "",
+    ])
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """複数のランキング（IDのリスト）を RRF で統合し、スコアの高い順に返す"""
+    scores: Dict[str, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] += 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class LexicalIndex:
+    """BM25の転置インデックス（ファイルに永続化、別プロセスの更新は検索時に読み直す）
+
+    文書ごとに語の出現数・文書長・RAGテキスト・メタデータを保持し、
+    転置インデックス（語 → {ID: 出現数}）は読み込み時に組み立てる。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.RLock()
+        self._mtime: Optional[float] = None
+        self._docs: Dict[str, Dict[str, Any]] = {}
+        self._postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self._total_len = 0
+        self._dirty = False  # 保存していない更新がある
+        self._load()
+
+    def _load(self):
+        self._docs = {}
+        if os.path.exists(self.path):
+            with open(self.path, "rb") as f:
+                self._docs = pickle.load(f)
+            self._mtime = os.path.getmtime(self.path)
+        self._postings = defaultdict(dict)
+        self._total_len = 0
+        for doc_id, doc in self._docs.items():
+            self._add_postings(doc_id, doc)
+
+    def _add_postings(self, doc_id: str, doc: Dict[str, Any]):
+        for term, tf in doc["tf"].items():
+            self._postings[term][doc_id] = tf
+        self._total_len += doc["len"]
+
+    def _remove_postings(self, doc_id: str):
+        doc = self._docs.get(doc_id)
+        if doc is None:
+            return
+        for term in doc["tf"]:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+        self._total_len -= doc["len"]
+
+    def _reload_if_changed(self):
+        # 保存前の更新がある間は読み直さない（次の save で書き出す）
+        if not self._dirty and os.path.exists(self.path) and os.path.getmtime(self.path) != self._mtime:
+            self._load()
+
+    def save(self):
+        with self._lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump(self._docs, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path)
+            self._mtime = os.path.getmtime(self.path)
+            self._dirty = False
+
+    def upsert(self, documents: Iterable[Dict[str, Any]], save: bool = True):
+        """documents: {id, lexical_text, text, metadata} のリスト（同じIDは置き換え）
+
+        save=False ならメモリ上だけ更新する（まとめて登録するときは最後に save() を呼ぶ）
+        """
+        with self._lock:
+            self._reload_if_changed()
+            for document in documents:
+                doc_id = document["id"]
+                tf = Counter(tokenize(document["lexical_text"]))
+                self._remove_postings(doc_id)
+                doc = {
+                    "tf": dict(tf),
+                    "len": sum(tf.values()),
+                    "text": document["text"],
+                    "metadata": document.get("metadata", {}),
+                }
+                self._docs[doc_id] = doc
+                self._add_postings(doc_id, doc)
+            self._dirty = True
+            if save:
+                self.save()
+
+    def delete(self, ids: Iterable[str]):
+        with self._lock:
+            self._reload_if_changed()
+            for doc_id in ids:
+                self._remove_postings(doc_id)
+                self._docs.pop(doc_id, None)
+            self.save()
+
+    def get(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._docs.get(doc_id)
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def search(self, query: str, k: int = 20, filter: Optional[Dict[str, Any]] = None) -> List[Tuple[str, float]]:
+        """BM25スコアの上位k件を (ID, スコア) で返す（クエリ内で繰り返した語は重みが増える）
+
+        filter はベクトル検索と同じPinecone形式のメタデータフィルタ
+        """
+        query_tf = Counter(tokenize(query))
+        with self._lock:
+            self._reload_if_changed()
+            n_docs = len(self._docs)
+            if not n_docs or not query_tf:
+                return []
+            avg_len = self._total_len / n_docs or 1.0
+            scores: Dict[str, float] = defaultdict(float)
+            allowed: Dict[str, bool] = {}
+            for term, qtf in query_tf.items():
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    if filter:
+                        if doc_id not in allowed:
+                            allowed[doc_id] = matches_filter(self._docs[doc_id]["metadata"], filter)
+                        if not allowed[doc_id]:
+                            continue
+                    doc_len = self._docs[doc_id]["len"]
+                    norm = tf * (_K1 + 1) / (tf + _K1 * (1 - _B + _B * doc_len / avg_len))
+                    scores[doc_id] += qtf * idf * norm
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
@@ -1,6 +1,8 @@
 """
 LLMプロバイダーとモデルの設定マッピング
 高速化対応のための各種クラウドサービス・モデル対応表
+
+quality はルーティング（LLM_ROUTING=true）で使う品質の目安（1: 軽量 / 2: 標準 / 3: 高性能）
 """
 
 # 各プロバイダーでサポートされるモデル設定
@@ -9,16 +11,19 @@ LLM_MODELS = {
         "gpt4o_mini": {
             "model": "gpt-4o-mini",
             "temperature": 0.7,
+            "quality": 2,
             "description": "OpenAI GPT-4o mini（従来モデル）"
         },
         "gpt4o": {
             "model": "gpt-4o",
             "temperature": 0.7,
+            "quality": 3,
             "description": "OpenAI GPT-4o（高性能モデル）"
         },
         "gpt35_turbo": {
             "model": "gpt-3.5-turbo",
             "temperature": 0.7,
+            "quality": 1,
             "description": "OpenAI GPT-3.5 Turbo（高速モデル）"
         }
     },
@@ -27,21 +32,25 @@ LLM_MODELS = {
         "gemini_flash": {
             "model": "gemini-flash-latest",
             "temperature": 0.7,
+            "quality": 2,
             "description": "Google AI Studio Gemini Flash Latest（最高速）"
         },
         "gemini_pro": {
             "model": "gemini-pro-latest",
             "temperature": 0.7,
+            "quality": 3,
             "description": "Google AI Studio Gemini Pro Latest（高性能）"
         },
         "gemini_20_flash": {
             "model": "gemini-2.0-flash",
             "temperature": 0.7,
+            "quality": 2,
             "description": "Google AI Studio Gemini 2.0 Flash（安定版）"
         },
         "gemini_25_flash": {
             "model": "gemini-2.5-flash",
             "temperature": 0.7,
+            "quality": 2,
             "description": "Google AI Studio Gemini 2.5 Flash（最新版）"
         }
     },
@@ -50,24 +59,28 @@ LLM_MODELS = {
         "claude_haiku": {
             "model_id": "anthropic.claude-3-haiku-20240307-v1:0",
             "temperature": 0.7,
+            "quality": 2,
             "region_name": "ap-northeast-1",
             "description": "AWS Bedrock Claude 3 Haiku（最高速）"
         },
         "claude_sonnet": {
             "model_id": "anthropic.claude-3-sonnet-20240229-v1:0",
             "temperature": 0.7,
+            "quality": 3,
             "region_name": "ap-northeast-1",
             "description": "AWS Bedrock Claude 3 Sonnet（バランス型）"
         },
         "titan_text": {
             "model_id": "amazon.titan-text-express-v1",
             "temperature": 0.7,
+            "quality": 1,
             "region_name": "ap-northeast-1",
             "description": "AWS Bedrock Titan Text Express（高速）"
         },
         "titan_text_lite": {
             "model_id": "amazon.titan-text-lite-v1",
             "temperature": 0.7,
+            "quality": 1,
             "region_name": "ap-northeast-1", 
             "description": "AWS Bedrock Titan Text Lite（軽量高速）"
         }
@@ -81,20 +94,35 @@ DEFAULT_MODELS = {
     "bedrock": "claude_haiku"
 }
 
-# 速度順ランキング（推定）
+# プロバイダーごとのレート制限（1分あたりのリクエスト数 rpm・トークン数 tpm）。契約のティアに合わせて調整する
+# 構造化・RAG登録・マッチングの全プロセス内の呼び出しで共有する（ratelimit.Scheduler）。embeddings は埋め込みAPI
+RATE_LIMITS = {
+    "openai": {"rpm": 500, "tpm": 200000},
+    "ai_studio": {"rpm": 1000, "tpm": 1000000},
+    "bedrock": {"rpm": 100, "tpm": 200000},
+    "embeddings": {"rpm": 3000, "tpm": 1000000},
+}
+
+# 速度順ランキング（推定）。ルーティングでは実測値がないモデルを試す順番としてだけ使う
 SPEED_RANKING = [
     ("ai_studio", "gemini_flash"),
+    ("ai_studio", "gemini_20_flash"),
     ("bedrock", "claude_haiku"),
     ("ai_studio", "gemini_pro"),
     ("bedrock", "titan_text_lite"),
     ("bedrock", "titan_text"),
     ("openai", "gpt35_turbo"),
-    ("ai_studio", "gemini_15_pro"),
+    ("ai_studio", "gemini_25_flash"),
     ("bedrock", "claude_sonnet"),
     ("openai", "gpt4o_mini"),
     ("openai", "gpt4o")
 ]
 
+# ランキングに LLM_MODELS にないモデルが紛れ込んだら読み込み時に気付けるようにする
+_unknown_ranked = [f"{provider}:{model}" for provider, model in SPEED_RANKING if model not in LLM_MODELS.get(provider, {})]
+if _unknown_ranked:
+    raise ValueError(f"SPEED_RANKING contains models missing from LLM_MODELS: {_unknown_ranked}")
+
 def get_model_config(provider: str, model_name: str = None):
     """
     指定されたプロバイダーとモデル名の設定を取得
@@ -129,7 +157,7 @@ def list_available_models():
     print(f"\n=== Speed Ranking (Fastest to Slowest) ===")
     for i, (provider, model) in enumerate(SPEED_RANKING, 1):
         config = LLM_MODELS[provider][model]
-        print(f"{i:2d}. {provider}:{model} - {config['description']}")
+        print(f"{i:2d}. {provider}:{model} (quality {config['quality']}) - {config['description']}")
 
 if __name__ == "__main__":
     list_available_models()
\ No newline at end of file
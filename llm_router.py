@@ -0,0 +1,197 @@
+"""
+LLMのモデル選択（実測のレイテンシ・エラー率にもとづくルーティング）
+
+- (provider, model) ごとに所要時間・最初のトークンまでの時間（TTFT）・エラー率の指数移動平均（EWMA）を記録する
+- ranked() は品質の条件を満たすモデルを「計測・復帰の試行 → 健全 → エラー率が高い」の順に、
+  同じ区分の中では速い順（ストリーミングは TTFT、それ以外は所要時間）に並べる
+- 連続して failure_threshold 回失敗したモデルは cooldown_sec の間候補から外す（サーキットブレーカー）。
+  待機時間が過ぎたら（half_open）1件だけ先頭に置いて試し、成功すれば戻し、失敗すればまた cooldown_sec 外す
+- 未計測のモデル、最後の計測から probe_interval_sec 以上経ったモデルは先頭に置いて1回計測する
+- 記録は RouterStatsHandler（LangChainのコールバック）から行う。直近の TTFT は ttft_quantile()（ヘッジの待ち時間）にも使う
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# ttft_quantile の計算に使う直近の TTFT の件数
+TTFT_WINDOW = 200
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+Route = Tuple[str, str]
+
+
+class ModelStats:
+    def __init__(self):
+        self.latency_ms: Optional[float] = None
+        self.ttft_ms: Optional[float] = None
+        self.ttft_samples: deque = deque(maxlen=TTFT_WINDOW)
+        self.error_rate = 0.0
+        self.calls = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.probe_started: Optional[float] = None  # half_open の試行を送った時刻（同時に1件だけ）
+        self.last_sample: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+
+class LLMRouter:
+    def __init__(self, routes: Sequence[Route], quality: Dict[Route, int], alpha: float = 0.3,
+                 failure_threshold: int = 3, cooldown_sec: float = 30, max_error_rate: float = 0.5,
+                 probe_interval_sec: float = 600):
+        self.routes = list(dict.fromkeys(routes))  # 並び順は未計測時の優先順位
+        self.quality = quality
+        self.alpha = alpha
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown_sec = cooldown_sec
+        self.max_error_rate = max_error_rate
+        self.probe_interval_sec = probe_interval_sec
+        self._stats: Dict[Route, ModelStats] = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, route: Route) -> ModelStats:
+        entry = self._stats.get(route)
+        if entry is None:
+            entry = self._stats[route] = ModelStats()
+        return entry
+
+    def _ewma(self, current: Optional[float], value: float) -> float:
+        return value if current is None else self.alpha * value + (1 - self.alpha) * current
+
+    def record_success(self, route: Route, latency_ms: float, ttft_ms: float = None):
+        with self._lock:
+            entry = self._entry(route)
+            entry.calls += 1
+            entry.latency_ms = self._ewma(entry.latency_ms, latency_ms)
+            if ttft_ms is not None:
+                entry.ttft_ms = self._ewma(entry.ttft_ms, ttft_ms)
+                entry.ttft_samples.append(ttft_ms)
+            entry.error_rate = self._ewma(entry.error_rate, 0.0)
+            entry.consecutive_failures = 0
+            entry.opened_at = None
+            entry.probe_started = None
+            entry.last_sample = time.monotonic()
+
+    def record_failure(self, route: Route, error: str = None):
+        with self._lock:
+            entry = self._entry(route)
+            entry.calls += 1
+            entry.failures += 1
+            entry.consecutive_failures += 1
+            entry.error_rate = self._ewma(entry.error_rate, 1.0)
+            entry.last_error = error
+            entry.last_sample = time.monotonic()
+            entry.probe_started = None
+            if entry.consecutive_failures >= self.failure_threshold:
+                was_open = entry.opened_at is not None
+                entry.opened_at = time.monotonic()
+                if not was_open:
+                    print(f"Circuit opened for {route[0]}:{route[1]} after {entry.consecutive_failures} failures: {error}")
+
+    def _circuit(self, entry: ModelStats, now: float) -> str:
+        if entry.opened_at is None:
+            return CLOSED
+        return HALF_OPEN if now - entry.opened_at >= self.cooldown_sec else OPEN
+
+    def ranked(self, streaming: bool = False, min_quality: int = 0) -> List[Route]:
+        """試す順に並べたモデル（遮断中で待機時間内のもの・品質の条件を満たさないものは含めない）"""
+        now = time.monotonic()
+        keyed = []
+        with self._lock:
+            for order, route in enumerate(self.routes):
+                if self.quality.get(route, 0) < min_quality:
+                    continue
+                entry = self._stats.get(route) or ModelStats()
+                circuit = self._circuit(entry, now)
+                if circuit == OPEN:
+                    continue
+                stale = entry.last_sample is None or now - entry.last_sample >= self.probe_interval_sec
+                if circuit == HALF_OPEN:
+                    # 試行中の呼び出しがあれば結果を待つ（応答がないまま cooldown_sec 経ったら試行し直す）
+                    if entry.probe_started is not None and now - entry.probe_started < self.cooldown_sec:
+                        continue
+                    self._entry(route).probe_started = now
+                    group = 0
+                elif stale:
+                    group = 0
+                elif entry.error_rate > self.max_error_rate:
+                    group = 2
+                else:
+                    group = 1
+                speed = entry.ttft_ms if streaming and entry.ttft_ms is not None else entry.latency_ms
+                keyed.append(((group, speed if speed is not None else 0.0, order), route))
+        return [route for _, route in sorted(keyed)]
+
+    def ttft_quantile(self, route: Route, quantile: float = 0.95, min_samples: int = 20) -> Optional[float]:
+        """直近の TTFT（ミリ秒）の分位点。件数が min_samples に満たなければ None"""
+        with self._lock:
+            entry = self._stats.get(route)
+            samples = sorted(entry.ttft_samples) if entry is not None else []
+        if len(samples) < max(1, min_samples):
+            return None
+        return samples[min(len(samples) - 1, int(quantile * len(samples)))]
+
+    def describe(self, route: Route) -> Dict[str, Any]:
+        """ルーティングの判断材料（ストリームのイベント・ログ用）"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._stats.get(route) or ModelStats()
+            return {
+                "provider": route[0],
+                "model": route[1],
+                "quality": self.quality.get(route, 0),
+                "latency_ms": round(entry.latency_ms, 1) if entry.latency_ms is not None else None,
+                "ttft_ms": round(entry.ttft_ms, 1) if entry.ttft_ms is not None else None,
+                "error_rate": round(entry.error_rate, 3),
+                "calls": entry.calls,
+                "circuit": self._circuit(entry, now),
+            }
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        return [self.describe(route) for route in self.routes]
+
+
+class RouterStatsHandler(BaseCallbackHandler):
+    """LLMクライアントの callbacks に渡し、呼び出しごとの所要時間・TTFT・成否をルーターに記録する"""
+
+    run_inline = True
+
+    def __init__(self, router: LLMRouter, provider: str, model: str):
+        self.router = router
+        self.route = (provider, model)
+        self._started: Dict[Any, float] = {}
+        self._first_token: Dict[Any, float] = {}
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        if token and run_id in self._started and run_id not in self._first_token:
+            self._first_token[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        started = self._started.pop(run_id, None)
+        first_token = self._first_token.pop(run_id, None)
+        if started is None:
+            return
+        now = time.perf_counter()
+        ttft_ms = (first_token - started) * 1000 if first_token is not None else None
+        self.router.record_success(self.route, (now - started) * 1000, ttft_ms)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._started.pop(run_id, None)
+        self._first_token.pop(run_id, None)
+        if isinstance(error, asyncio.CancelledError):
+            return  # ヘッジで負けた・クライアントが切断した呼び出しは失敗として数えない
+        self.router.record_failure(self.route, str(error)[:200])
@@ -0,0 +1,353 @@
+"""
+ローカル（プロセス内）ベクトルストア
+Pineconeの代わりに、float32行列（memmap）に対する内積の完全探索で検索する
+
+保存形式（directory 以下）:
+- vectors.f32 : 正規化済みベクトルの行列（capacity × dim、memmap）
+- columns.pkl : ID と メタデータの列（列ごとのリスト、行番号は行列と一致）
+- columns.log : columns.pkl 以降に追加した行（add_embeddings 1回ごとに追記。読み込み時に columns.pkl へ重ねる）
+
+columns.log が columns.pkl より大きくなったら、書き込み側が columns.pkl に書き直して消す
+（毎回全体を書き直すと、バッチ登録の総コストが件数の2乗になるため）
+"""
+
+import os
+import pickle
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from metadata_filter import MISSING, matches_value
+
+_VECTORS_FILE = "vectors.f32"
+_COLUMNS_FILE = "columns.pkl"
+_COLUMNS_LOG_FILE = "columns.log"
+_MIN_CAPACITY = 1024
+
+
+class LocalVectorStore(VectorStore):
+    """PineconeVectorStore と同じ add_texts / similarity_search_* / delete を持つローカル実装
+
+    - スコアはコサイン類似度（Pineconeのcosineインデックスと同じ尺度）
+    - 同じIDの追加は上書き（upsert）
+    - 別プロセス（cronのCLI等）の書き込みは、検索時にファイル更新を検知して読み直す
+    - filter= はPinecone形式のメタデータフィルタ（metadata_filter と同じ意味で、列ごとにまとめて評価する）
+    """
+
+    def __init__(self, directory: str, embedding: Embeddings, text_key: str = "text"):
+        self.directory = directory
+        self._embedding = embedding
+        self._text_key = text_key
+        self._lock = threading.RLock()
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    # ------------------------------------------------------------------
+    # 永続化
+    # ------------------------------------------------------------------
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _stamp(self) -> Tuple[Optional[int], int]:
+        """(columns.pkl の更新時刻, columns.log のサイズ)。どちらかが変われば別プロセスが書き込んでいる"""
+        try:
+            snapshot = os.stat(self._path(_COLUMNS_FILE)).st_mtime_ns
+        except FileNotFoundError:
+            snapshot = None
+        try:
+            log_size = os.path.getsize(self._path(_COLUMNS_LOG_FILE))
+        except FileNotFoundError:
+            log_size = 0
+        return snapshot, log_size
+
+    def _load(self):
+        # 読み込み中に追記されても次の検索で読み直すよう、読む前の状態を控える
+        self._stamp_seen = self._stamp()
+        columns_path = self._path(_COLUMNS_FILE)
+        if os.path.exists(columns_path):
+            with open(columns_path, "rb") as f:
+                state = pickle.load(f)
+            self._snapshot_size = os.path.getsize(columns_path)
+        else:
+            state = {"dim": None, "capacity": 0, "ids": [], "columns": {}}
+            self._snapshot_size = 0
+        self._dim: Optional[int] = state["dim"]
+        self._capacity: int = state["capacity"]
+        self._ids: List[str] = state["ids"]
+        self._columns: Dict[str, List[Any]] = state["columns"]
+        self._index: Dict[str, int] = {id_: i for i, id_ in enumerate(self._ids)}
+        self._codes: Dict[str, Tuple[np.ndarray, List[Any]]] = {}
+        for entry in self._read_log():
+            self._dim = entry["dim"]
+            self._capacity = max(self._capacity, entry["capacity"])
+            self._apply_rows(entry["ids"], entry["metadatas"])
+        self._matrix = None
+        if self._dim and self._capacity:
+            self._matrix = np.memmap(self._path(_VECTORS_FILE), dtype=np.float32, mode="r+",
+                                     shape=(self._capacity, self._dim))
+
+    def _read_log(self) -> Iterable[Dict[str, Any]]:
+        try:
+            f = open(self._path(_COLUMNS_LOG_FILE), "rb")
+        except FileNotFoundError:
+            return
+        with f:
+            while True:
+                try:
+                    yield pickle.load(f)
+                except (EOFError, pickle.UnpicklingError):
+                    # 末尾は書き込み途中（または中断された追記）のことがある
+                    return
+
+    def _save(self, entry: Optional[Dict[str, Any]] = None):
+        """entry（追加した行）があれば columns.log に追記し、なければ・ログが大きくなったら columns.pkl に書き直す"""
+        if self._matrix is not None:
+            self._matrix.flush()
+        log_path = self._path(_COLUMNS_LOG_FILE)
+        if entry is not None:
+            with open(log_path, "ab") as f:
+                pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+            log_size = os.path.getsize(log_path)
+            if log_size <= self._snapshot_size:
+                self._stamp_seen = self._stamp()
+                return
+        state = {"dim": self._dim, "capacity": self._capacity, "ids": self._ids, "columns": self._columns}
+        tmp_path = self._path(_COLUMNS_FILE + ".tmp")
+        with open(tmp_path, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self._path(_COLUMNS_FILE))
+        # columns.pkl を置き換えた後に消す（間で止まっても、ログの重ね直しは同じ結果になる）
+        if os.path.exists(log_path):
+            os.remove(log_path)
+        self._snapshot_size = os.path.getsize(self._path(_COLUMNS_FILE))
+        self._stamp_seen = self._stamp()
+
+    def _reload_if_changed(self):
+        if self._stamp() != self._stamp_seen:
+            self._load()
+
+    def _ensure_capacity(self, rows: int, dim: int):
+        if self._dim is None:
+            self._dim = dim
+        elif dim != self._dim:
+            raise ValueError(f"Embedding dimension mismatch: expected {self._dim}, got {dim}")
+        if rows <= self._capacity:
+            return
+        capacity = max(_MIN_CAPACITY, self._capacity)
+        while capacity < rows:
+            capacity *= 2
+        # ファイルを伸ばしてから開き直す（既存の行はそのまま残る）
+        if self._matrix is not None:
+            self._matrix.flush()
+            self._matrix = None
+        with open(self._path(_VECTORS_FILE), "ab") as f:
+            f.truncate(capacity * self._dim * 4)
+        self._capacity = capacity
+        self._matrix = np.memmap(self._path(_VECTORS_FILE), dtype=np.float32, mode="r+",
+                                 shape=(self._capacity, self._dim))
+
+    # ------------------------------------------------------------------
+    # 追加・削除
+    # ------------------------------------------------------------------
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        embedding_chunk_size: int = 1000,
+        **kwargs: Any,
+    ) -> List[str]:
+        texts = list(texts)
+        vectors: List[List[float]] = []
+        for i in range(0, len(texts), embedding_chunk_size):
+            vectors.extend(self._embedding.embed_documents(texts[i:i + embedding_chunk_size]))
+        return self.add_embeddings(texts, vectors, metadatas=metadatas, ids=ids)
+
+    def add_embeddings(
+        self,
+        texts: List[str],
+        embeddings: List[List[float]],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+    ) -> List[str]:
+        """埋め込み済みのベクトルを追加する（埋め込みとは別に書き込みの時間を計るため）"""
+        import uuid
+
+        ids = list(ids) if ids else [str(uuid.uuid4()) for _ in texts]
+        metadatas = metadatas or [{} for _ in texts]
+        if not embeddings:
+            return ids
+        matrix = _normalize(np.asarray(embeddings, dtype=np.float32))
+
+        with self._lock:
+            self._reload_if_changed()
+            self._codes = {}
+            new_rows = sum(1 for id_ in dict.fromkeys(ids) if id_ not in self._index)
+            self._ensure_capacity(len(self._ids) + new_rows, matrix.shape[1])
+            metadatas = [{**metadata, self._text_key: text} for text, metadata in zip(texts, metadatas)]
+            for row, vector in zip(self._apply_rows(ids, metadatas), matrix):
+                self._matrix[row] = vector
+            self._save({"dim": self._dim, "capacity": self._capacity, "ids": ids, "metadatas": metadatas})
+        return ids
+
+    def _apply_rows(self, ids: List[str], metadatas: List[dict]) -> List[int]:
+        """IDとメタデータを列に書き込み、行番号を返す（columns.log の読み込みでも同じ順に行を割り当てる）"""
+        rows = []
+        for id_, metadata in zip(ids, metadatas):
+            row = self._index.get(id_)
+            if row is None:
+                row = len(self._ids)
+                self._ids.append(id_)
+                self._index[id_] = row
+                for column in self._columns.values():
+                    column.append(None)
+            for key in metadata:
+                if key not in self._columns:
+                    self._columns[key] = [None] * len(self._ids)
+            for key, column in self._columns.items():
+                column[row] = metadata.get(key)
+            rows.append(row)
+        return rows
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        if not ids:
+            return False
+        with self._lock:
+            self._reload_if_changed()
+            self._codes = {}
+            for id_ in ids:
+                row = self._index.pop(id_, None)
+                if row is None:
+                    continue
+                # 最終行を削除位置に移して詰める
+                last = len(self._ids) - 1
+                if row != last:
+                    moved = self._ids[last]
+                    self._ids[row] = moved
+                    self._index[moved] = row
+                    self._matrix[row] = self._matrix[last]
+                    for column in self._columns.values():
+                        column[row] = column[last]
+                self._ids.pop()
+                for column in self._columns.values():
+                    column.pop()
+            self._save()
+        return True
+
+    def get_by_ids(self, ids, /) -> List[Document]:
+        with self._lock:
+            self._reload_if_changed()
+            return [self._document(self._index[id_]) for id_ in ids if id_ in self._index]
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    # ------------------------------------------------------------------
+    # 検索
+    # ------------------------------------------------------------------
+    def _document(self, row: int) -> Document:
+        metadata = {key: column[row] for key, column in self._columns.items() if column[row] is not None}
+        text = metadata.pop(self._text_key, "")
+        return Document(id=self._ids[row], page_content=text, metadata=metadata)
+
+    def _column_codes(self, key: str, count: int) -> Tuple[np.ndarray, List[Any]]:
+        """列を (行ごとの値の番号, 番号ごとの値) に変換する（書き込みまでキャッシュ。None はフィールドなし）"""
+        cached = self._codes.get(key)
+        if cached is not None and len(cached[0]) == count:
+            return cached
+        column = self._columns.get(key) or [None] * count
+        codes = np.empty(count, dtype=np.intp)
+        values: List[Any] = []
+        seen: Dict[Any, int] = {}
+        for row in range(count):
+            value = column[row]
+            try:
+                code = seen.get(value)
+                if code is None:
+                    code = seen[value] = len(values)
+                    values.append(value)
+            except TypeError:  # リストなどハッシュできない値は行ごとに評価する
+                code = len(values)
+                values.append(value)
+            codes[row] = code
+        self._codes[key] = (codes, values)
+        return codes, values
+
+    def _filter_mask(self, filter: Dict[str, Any], count: int) -> np.ndarray:
+        """フィルタに一致する行のマスク（条件は列の異なる値ごとに1回だけ評価し、行へは番号で展開する）"""
+        mask = np.ones(count, dtype=bool)
+        for key, condition in filter.items():
+            if key == "$and":
+                for sub in condition:
+                    mask &= self._filter_mask(sub, count)
+            elif key == "$or":
+                matched = np.zeros(count, dtype=bool)
+                for sub in condition:
+                    matched |= self._filter_mask(sub, count)
+                mask &= matched
+            else:
+                codes, values = self._column_codes(key, count)
+                results = np.fromiter(
+                    (matches_value(MISSING if value is None else value, condition) for value in values),
+                    dtype=bool, count=len(values))
+                mask &= results[codes]
+        return mask
+
+    def similarity_search_by_vector_with_score(
+        self, embedding: List[float], *, k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        query = _normalize(np.asarray(embedding, dtype=np.float32)[None, :])[0]
+        with self._lock:
+            self._reload_if_changed()
+            count = len(self._ids)
+            if count == 0 or k <= 0:
+                return []
+            scores = self._matrix[:count] @ query
+            if filter:
+                mask = self._filter_mask(filter, count)
+                count = int(mask.sum())
+                if count == 0:
+                    return []
+                scores = np.where(mask, scores, -np.inf)
+            k = min(k, count)
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(self._document(int(i)), float(scores[i])) for i in top]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(self._embedding.embed_query(query), k=k, **kwargs)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, **kwargs)]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k=k, **kwargs)]
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        *,
+        ids: Optional[List[str]] = None,
+        directory: str = ".cache/vectors/default",
+        **kwargs: Any,
+    ) -> "LocalVectorStore":
+        store = cls(directory, embedding)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
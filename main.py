@@ -1,23 +1,38 @@
 # FastAPIアプリのエントリーポイント
-from fastapi import FastAPI, HTTPException, Body
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Body, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
+from starlette.routing import Match
 import uvicorn
 import json
 
+import metrics
+
 # Import Pydantic models
 from models import (
     WorkflowParams, 
     MatchingRequest, 
-    SuccessResponse, 
     MatchingResponse, 
-    HealthResponse
+    HealthResponse,
+    JobAcceptedResponse,
+    JobResponse,
+    JobListResponse
 )
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """起動時：LLMクライアントの作成・接続と、前回終わらなかったバッチジョブの再実行"""
+    from job_matching_flow import get_job_manager, warm_up_llms
+    await warm_up_llms()
+    get_job_manager().resume()
+    yield
+
 app = FastAPI(
     title="Job Matching API",
     description="ジョブマッチングワークフローのAPI",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS設定（必要に応じて）
@@ -27,53 +42,107 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
-@app.post("/format_yoin", response_model=SuccessResponse)
+def resolve_route(scope) -> str:
+    """リクエストに一致するルートのパス（メトリクスのラベル。未登録のパスは None）"""
+    for route in app.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return None
+
+# ルートごとのリクエスト時間・処理中の件数（/metrics で出力）
+app.add_middleware(metrics.MetricsMiddleware, route_resolver=resolve_route)
+
+def resolve_model(provider, model):
+    """リクエストで指定されたモデルを検証する（llm_config.LLM_MODELS にないものは400）
+
+    省略時は None のまま渡し、フロー側で既定のモデル（LLM_ROUTING=true なら自動選択）を使う
+    """
+    from job_matching_flow import resolve_llm
+    if not provider and not model:
+        return None, None
+    try:
+        return resolve_llm(provider, model)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/format_yoin", response_model=JobAcceptedResponse, status_code=202)
 async def api_format_yoin(params: WorkflowParams = Body(default=None)):
-    """要員データ構造化API"""
+    """要員データ構造化API（バックグラウンドジョブとして実行し、進捗は /jobs/{job_id} で確認する）"""
     try:
-        from job_matching_flow import format_yoin_flow
+        from job_matching_flow import get_job_manager
         if params is None:
             params = WorkflowParams()
         params_dict = params.model_dump()
-        format_yoin_flow(params_dict)
-        return {"status": "success", "message": "要員データ構造化完了"}
+        job = get_job_manager().submit("format_yoin", params_dict)
+        return {"status": "accepted", "message": "要員データ構造化を開始しました", "job_id": job.id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/format_anken", response_model=SuccessResponse)
+@app.post("/format_anken", response_model=JobAcceptedResponse, status_code=202)
 async def api_format_anken(params: WorkflowParams = Body(default=None)):
-    """案件データ構造化API"""
+    """案件データ構造化API（バックグラウンドジョブとして実行し、進捗は /jobs/{job_id} で確認する）"""
     try:
-        from job_matching_flow import format_anken_flow
+        from job_matching_flow import get_job_manager
         if params is None:
             params = WorkflowParams()
         params_dict = params.model_dump()
-        format_anken_flow(params_dict)
-        return {"status": "success", "message": "案件データ構造化完了"}
+        job = get_job_manager().submit("format_anken", params_dict)
+        return {"status": "accepted", "message": "案件データ構造化を開始しました", "job_id": job.id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/index_yoin", response_model=SuccessResponse)
+@app.post("/index_yoin", response_model=JobAcceptedResponse, status_code=202)
 async def api_index_yoin(params: WorkflowParams = Body(default=None)):
-    """要員データRAG登録API"""
+    """要員データRAG登録API（バックグラウンドジョブとして実行し、進捗は /jobs/{job_id} で確認する）"""
     try:
-        from job_matching_flow import index_yoin_flow
+        from job_matching_flow import get_job_manager
         if params is None:
             params = WorkflowParams()
         params_dict = params.model_dump()
-        index_yoin_flow(params_dict)
-        return {"status": "success", "message": "要員データRAG登録完了"}
+        job = get_job_manager().submit("index_yoin", params_dict)
+        return {"status": "accepted", "message": "要員データRAG登録を開始しました", "job_id": job.id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/jobs", response_model=JobListResponse)
+async def api_list_jobs(limit: int = 20):
+    """最近のバッチジョブ（新しい順）"""
+    from job_matching_flow import get_job_manager
+    return {"jobs": [job.to_dict() for job in get_job_manager().recent(limit)]}
+
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+async def api_get_job(job_id: str):
+    """バッチジョブの状態と進捗（処理件数・失敗件数・合計件数・スループット・残り時間）"""
+    from job_matching_flow import get_job_manager
+    job = get_job_manager().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    return job.to_dict()
+
+@app.post("/jobs/{job_id}/cancel", response_model=JobResponse)
+async def api_cancel_job(job_id: str):
+    """バッチジョブの取り消し（実行中のジョブは次の進捗報告の時点で止まる）"""
+    from job_matching_flow import get_job_manager
+    job = get_job_manager().cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    return job.to_dict()
+
 @app.post("/matching_yoin", response_model=MatchingResponse)
-async def api_matching_yoin(request: MatchingRequest):
-    """要員マッチングAPI"""
+async def api_matching_yoin(request: MatchingRequest, response: Response):
+    """要員マッチングAPI（段階ごとの所要時間を Server-Timing ヘッダで返す）"""
+    provider, model = resolve_model(request.provider, request.model)
     try:
-        from job_matching_flow import matching_yoin_flow
-        result = matching_yoin_flow(request.anken)
+        import timing
+        from job_matching_flow import amatching_yoin_flow
+        result = await amatching_yoin_flow(request.anken, request.mode, provider, model)
+        timings = timing.current()
+        if timings is not None:
+            response.headers["Server-Timing"] = timings.server_timing()
         return {"status": "success", "result": result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -81,13 +150,17 @@ async def api_matching_yoin(request: MatchingRequest):
 @app.post("/matching_yoin_stream")
 async def api_matching_yoin_stream(request: MatchingRequest):
     """要員マッチングAPI（ストリーミング対応・高速化版）"""
+    provider, model = resolve_model(request.provider, request.model)
     try:
         from job_matching_flow import matching_yoin_flow_stream
         
         async def generate_stream():
             async for chunk in matching_yoin_flow_stream(
                 request.anken, 
-                request.inputs.mode if hasattr(request, 'inputs') and request.inputs else None
+                request.mode,
+                request.include_accumulated,
+                provider,
+                model
             ):
                 yield f"data: {json.dumps(chunk, ensure_ascii=False)}\\n\\n"
         
@@ -107,13 +180,17 @@ async def api_matching_yoin_stream(request: MatchingRequest):
 @app.post("/matching_yoin_raw_stream")
 async def api_matching_yoin_raw_stream(request_data: dict = Body(...)):
     """要員マッチングAPI（生ストリーミング・高速化版）"""
+    provider, model = resolve_model(request_data.get("provider"), request_data.get("model"))
     try:
         from job_matching_flow import matching_yoin_flow_stream
         
         async def generate_stream():
             async for chunk in matching_yoin_flow_stream(
                 request_data.get("anken", ""),
-                request_data.get("mode", None)
+                request_data.get("mode", None),
+                request_data.get("include_accumulated", None),
+                provider,
+                model
             ):
                 yield f"data: {json.dumps(chunk, ensure_ascii=False)}\\n\\n"
         
@@ -135,6 +212,12 @@ async def health_check():
     """ヘルスチェックエンドポイント"""
     return {"status": "healthy"}
 
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus形式のメトリクス"""
+    import job_matching_flow  # noqa: F401  キャッシュ等のコレクタを登録する
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 if __name__ == "__main__":
     # 開発サーバー起動
     uvicorn.run(
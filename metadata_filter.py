@@ -0,0 +1,62 @@
+"""
+Pinecone形式のメタデータフィルタをPython側で評価する（ローカルベクトルストア・語彙インデックス用）
+
+対応する演算子: $eq, $ne, $gt, $gte, $lt, $lte, $in, $nin, $exists, $and, $or
+{"field": 値} は {"field": {"$eq": 値}} と同じ。
+メタデータにないフィールドは $ne / $nin / {"$exists": False} だけが一致する。
+"""
+
+from typing import Any, Dict, Optional
+
+# フィールドがないことを表す値（matches_value に渡す）
+MISSING = object()
+
+
+def _compare(op: str, value: Any, operand: Any) -> bool:
+    if op == "$exists":
+        return (value is not MISSING) == bool(operand)
+    if value is MISSING:
+        return op in ("$ne", "$nin")
+    if op == "$eq":
+        return value == operand
+    if op == "$ne":
+        return value != operand
+    if op == "$in":
+        return value in operand
+    if op == "$nin":
+        return value not in operand
+    try:
+        if op == "$gt":
+            return value > operand
+        if op == "$gte":
+            return value >= operand
+        if op == "$lt":
+            return value < operand
+        if op == "$lte":
+            return value <= operand
+    except TypeError:
+        return False
+    raise ValueError(f"Unsupported filter operator: {op}")
+
+
+def matches_value(value: Any, condition: Any) -> bool:
+    """1つのフィールドの値（ない場合は MISSING）が条件（{"$op": 値} または値そのもの）を満たすか"""
+    if not isinstance(condition, dict):
+        condition = {"$eq": condition}
+    return all(_compare(op, value, operand) for op, operand in condition.items())
+
+
+def matches_filter(metadata: Dict[str, Any], filter: Optional[Dict[str, Any]]) -> bool:
+    """metadata が filter の条件を満たすか"""
+    if not filter:
+        return True
+    for key, condition in filter.items():
+        if key == "$and":
+            if not all(matches_filter(metadata, sub) for sub in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_filter(metadata, sub) for sub in condition):
+                return False
+        elif not matches_value(metadata.get(key, MISSING), condition):
+            return False
+    return True
@@ -0,0 +1,287 @@
+"""
+Prometheus形式（text exposition format 0.0.4）のメトリクス
+依存ライブラリなしの最小実装。記録はロック1回と数値の加算だけなので本番でも常時有効にできる
+
+- Counter / Gauge / Histogram をモジュールのレジストリに登録し、render() でテキストにする
+- キャッシュのヒット数など、他のモジュールが持つ値は register_collector で出力時に読み取る
+- LLM呼び出しは LLMMetricsHandler（LangChainのコールバック）で、HTTPは MetricsMiddleware で計測する
+"""
+
+import asyncio
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# 秒単位のバケット（ベクトル検索の数十msからLLMの数十秒まで）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_LE_INF = 'le="+Inf"'
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels_text(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [f"{self.name}{_labels_text(self.labelnames, key)} {_number(value)}" for key, value in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(key, (list(entry[0]), entry[1], entry[2])) for key, entry in self._values.items()]
+        lines = self.header()
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = 'le="%s"' % _number(bound)
+                lines.append(f"{self.name}_bucket{_labels_text(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels_text(self.labelnames, key, _LE_INF)} {count}")
+            lines.append(f"{self.name}_sum{_labels_text(self.labelnames, key)} {_number(round(total, 6))}")
+            lines.append(f"{self.name}_count{_labels_text(self.labelnames, key)} {count}")
+        return lines
+
+
+_registry: List[_Metric] = []
+_collectors: List[Callable[[], Iterable[Tuple[str, str, str, Dict[str, str], float]]]] = []
+
+
+def _register(metric):
+    _registry.append(metric)
+    return metric
+
+
+def register_collector(collector: Callable[[], Iterable[Tuple[str, str, str, Dict[str, str], float]]]):
+    """出力時に呼ばれる関数を登録する。関数は (name, type, help, labels, value) を返す"""
+    _collectors.append(collector)
+
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    # コレクタの値は同じ名前ごとにまとめて出力する
+    families: Dict[str, Tuple[str, str, List[str]]] = {}
+    for collector in _collectors:
+        try:
+            samples = list(collector())
+        except Exception:
+            continue
+        for name, kind, help_text, labels, value in samples:
+            family = families.setdefault(name, (kind, help_text, []))
+            family[2].append(f"{name}{_labels_text(list(labels), list(labels.values()))} {_number(value)}")
+    for name, (kind, help_text, samples) in families.items():
+        lines.extend([f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"])
+        lines.extend(samples)
+    return "\n".join(lines) + "\n"
+
+
+# ----------------------------------------------------------------------
+# アプリケーションのメトリクス
+# ----------------------------------------------------------------------
+http_request_duration = _register(Histogram(
+    "http_request_duration_seconds", "HTTP request duration until the response body is complete",
+    ("route", "method", "status")))
+http_requests_in_flight = _register(Gauge(
+    "http_requests_in_flight", "HTTP requests currently being served", ("route",)))
+
+llm_calls = _register(Counter("llm_calls_total", "LLM calls", ("provider", "model")))
+llm_errors = _register(Counter("llm_errors_total", "LLM calls that raised an error", ("provider", "model")))
+llm_tokens = _register(Counter("llm_tokens_total", "LLM tokens reported by the provider", ("provider", "model", "type")))
+llm_duration = _register(Histogram("llm_request_duration_seconds", "LLM call duration", ("provider", "model")))
+llm_hedge_streams = _register(Counter(
+    "llm_hedge_streams_total", "Streaming LLM calls eligible for hedging", ("provider", "model")))
+llm_hedges = _register(Counter(
+    "llm_hedges_total", "Hedged streams by primary model and the model that started first", ("provider", "model", "winner")))
+llm_hedge_wasted_tokens = _register(Counter(
+    "llm_hedge_wasted_tokens_total", "Estimated tokens billed to cancelled hedge losers (prompt sent, completion streamed)",
+    ("provider", "model", "type")))
+llm_hedge_delay = _register(Histogram(
+    "llm_hedge_delay_seconds", "First-token deadline used before sending the hedge request", ("provider", "model")))
+
+matching_prompt_tokens = _register(Histogram(
+    "matching_prompt_tokens", "Input tokens of matching prompts counted before the call", ("mode",),
+    buckets=(500, 1000, 2000, 4000, 6000, 8000, 12000, 16000, 32000)))
+matching_candidates_dropped = _register(Counter(
+    "matching_candidates_dropped_total", "Retrieved candidates left out of matching prompts by the token budget", ("mode",)))
+
+dependency_duration = _register(Histogram(
+    "dependency_request_duration_seconds", "Latency of calls to external dependencies (GAS, vector store, embeddings)",
+    ("dependency", "operation")))
+stage_duration = _register(Histogram("stage_duration_seconds", "Duration of timed pipeline stages", ("stage",)))
+
+# timing.span の段階名 → (依存先, 操作)。ここにある段階は dependency_request_duration_seconds にも記録する
+_dependency_stages: Dict[str, Tuple[str, str]] = {}
+
+
+def map_dependency_stages(mapping: Dict[str, Tuple[str, str]]):
+    _dependency_stages.update(mapping)
+
+
+def observe_stage(name: str, ms: float):
+    """timing の段階の所要時間を記録する（timing.add_observer に登録して使う）"""
+    seconds = ms / 1000
+    stage_duration.observe(seconds, stage=name)
+    dependency = _dependency_stages.get(name)
+    if dependency is not None:
+        dependency_duration.observe(seconds, dependency=dependency[0], operation=dependency[1])
+
+
+class LLMMetricsHandler(BaseCallbackHandler):
+    """LLMクライアントの callbacks に渡し、呼び出し数・トークン数・エラー・所要時間を記録する"""
+
+    run_inline = True  # 非同期呼び出しでもスレッドに回さずその場で実行する
+
+    def __init__(self, provider: str, model: str):
+        self.provider = provider
+        self.model = model
+        self._started: Dict[object, float] = {}
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    def _finish(self, run_id):
+        started = self._started.pop(run_id, None)
+        llm_calls.inc(provider=self.provider, model=self.model)
+        if started is not None:
+            llm_duration.observe(time.perf_counter() - started, provider=self.provider, model=self.model)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._finish(run_id)
+        prompt_tokens, completion_tokens = token_usage(response)
+        if prompt_tokens:
+            llm_tokens.inc(prompt_tokens, provider=self.provider, model=self.model, type="prompt")
+        if completion_tokens:
+            llm_tokens.inc(completion_tokens, provider=self.provider, model=self.model, type="completion")
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id)
+        if isinstance(error, asyncio.CancelledError):
+            return  # ヘッジで負けた・クライアントが切断した呼び出し
+        llm_errors.inc(provider=self.provider, model=self.model)
+
+
+def token_usage(response) -> Tuple[int, int]:
+    """LLMResult からトークン数を取り出す（メッセージの usage_metadata → llm_output の token_usage の順）"""
+    prompt_tokens = completion_tokens = 0
+    for generations in response.generations or []:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                prompt_tokens += usage.get("input_tokens", 0)
+                completion_tokens += usage.get("output_tokens", 0)
+    if not prompt_tokens and not completion_tokens:
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        prompt_tokens = usage.get("prompt_tokens", 0)
+        completion_tokens = usage.get("completion_tokens", 0)
+    return prompt_tokens, completion_tokens
+
+
+class MetricsMiddleware:
+    """ASGIミドルウェア：ルートごとのリクエスト時間（ストリーミングは本文の送信完了まで）と処理中の件数
+
+    ルート名はアプリに登録されたパスのテンプレート（未登録のパスは "other"）
+    """
+
+    def __init__(self, app, route_resolver: Callable[[dict], Optional[str]]):
+        self.app = app
+        self.route_resolver = route_resolver
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        route = self.route_resolver(scope) or "other"
+        method = scope.get("method", "")
+        status = {"code": 500}
+        started = time.perf_counter()
+        http_requests_in_flight.inc(route=route)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_requests_in_flight.dec(route=route)
+            http_request_duration.observe(time.perf_counter() - started, route=route, method=method, status=str(status["code"]))
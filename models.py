@@ -1,20 +1,54 @@
 # Pydantic models for API requests and responses
 from pydantic import BaseModel
-from typing import Optional
+from typing import Any, Dict, List, Optional
 
 class WorkflowParams(BaseModel):
     start_date: Optional[str] = None
     end_date: Optional[str] = None
     limit: Optional[int] = None
     offset: Optional[int] = None
+    concurrency: Optional[int] = None
+    incremental: Optional[bool] = None
+    no_cache: Optional[bool] = None
 
 class MatchingRequest(BaseModel):
     anken: str
+    mode: Optional[str] = None  # quick（検索結果のみ）/ parallel（グループごとの並列採点）
+    include_accumulated: Optional[bool] = None  # ストリームの llm_chunk に累積テキストを付ける
+    provider: Optional[str] = None  # openai / ai_studio / bedrock（省略時は LLM_PROVIDER）
+    model: Optional[str] = None  # llm_config.LLM_MODELS のキー（gemini_flash など。省略時はプロバイダーの既定）
 
 class SuccessResponse(BaseModel):
     status: str
     message: str
 
+class JobAcceptedResponse(BaseModel):
+    status: str
+    message: str
+    job_id: str
+
+class JobResponse(BaseModel):
+    id: str
+    action: str
+    params: Dict[str, Any]
+    status: str  # queued / running / succeeded / failed / cancelled
+    phase: Optional[str] = None  # 実行中のフロー（format_yoin の後に index_yoin など）
+    processed: int
+    failed: int
+    total: Optional[int] = None  # 合計件数の見込み（不明な場合は None）
+    records_per_sec: Optional[float] = None
+    eta_sec: Optional[float] = None
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+    result: Optional[Any] = None
+    resumed: int = 0
+    cancel_requested: bool = False
+
+class JobListResponse(BaseModel):
+    jobs: List[JobResponse]
+
 class MatchingResponse(BaseModel):
     status: str
     result: dict
@@ -0,0 +1,312 @@
+"""
+マッチング前の事前フィルタ（MATCHING_PROMPT の STEP 1 / STEP 3 をルールで先に適用する）
+- 勤務形態: 常駐の案件にフルリモート希望の要員は除外
+- 地域: 常駐・リモート併用の案件で、要員の最寄駅の地域（関東圏・関西圏・都道府県）が異なれば除外
+- 単価: 要員の希望単価の下限が案件単価の上限を許容幅（既定15%）より上回れば除外
+判定に迷うもの（地域不明、許容幅内の単価超過など）は除外せず注記を付け、LLMの判断に任せる
+"""
+
+import re
+import unicodedata
+from typing import Any, Dict, List, Optional, Tuple
+
+from station_table import PREFECTURES, PREFECTURE_REGION, STATION_PREFECTURE
+
+RULES = ("work_style", "region", "price")
+
+FULL_REMOTE = "full_remote"
+HYBRID = "hybrid"
+ONSITE = "onsite"
+REMOTE = "remote"  # 「リモート希望」など、フルリモートか併用か読み取れないもの
+UNKNOWN = "unknown"
+# yoin_metadata の判定ロジックの版（勤務形態の分類を直したら上げる。古い版のベクトルは勤務形態で絞らない）
+METADATA_VERSION = 2
+
+# 「出社なし」「常駐不要」などの否定は、出社・常駐の語より先に取り除く
+_NO_ONSITE_PATTERN = re.compile(r"(出社|常駐|通勤)\s*(なし|無し|不要|ナシ|無)|(出社|常駐)しない")
+_HYBRID_PATTERN = re.compile(r"併用|ハイブリッド|一部(リモート|在宅)|出社可|常駐可|週\d.{0,3}(出社|リモート|在宅)|月\d.{0,3}出社")
+_FULL_REMOTE_PATTERN = re.compile(r"フルリモート|完全リモート|フル在宅|完全在宅|(リモート|在宅)のみ")
+_ONSITE_PATTERN = re.compile(r"常駐|出社|オンサイト|現場|客先")
+_REMOTE_PATTERN = re.compile(r"リモート|在宅|テレワーク")
+# 常駐・出社と並んだ「リモート可」は併用とみなす（「常駐（リモート可）」「リモート可（初日のみ出社）」）
+_REMOTE_ALLOWED_PATTERN = re.compile(r"(リモート|在宅|テレワーク)\s*(可|OK|ok|あり|有)")
+# 地域が違っても除外しない要員（移動・転居できる旨の記載）
+_RELOCATABLE_PATTERN = re.compile(r"全国|転居可|引越し?可|引っ越し可|出張可|どこでも")
+
+_FIELD_PATTERN = re.compile(r"【([^】]+)】")
+_NUMBER_PATTERN = re.compile(r"(\d+(?:\.\d+)?)\s*(万)?")
+_PRICE_NEGOTIABLE_PATTERN = re.compile(r"見合い|応相談|要相談|相談")
+_RANGE_PATTERN = re.compile(r"(?<=[\d万円])\s*[~〜ー－-]\s*|^\s*[~〜]|[~〜]\s*$")
+
+# 駅名は長いものから照合する（「新宿三丁目」を「新宿」より優先）
+_STATION_NAMES = sorted(STATION_PREFECTURE, key=len, reverse=True)
+_KANA_KANJI = re.compile(r"[\u3040-\u30ff\u3400-\u9fff]")
+
+
+def _normalize(text: Any) -> str:
+    return unicodedata.normalize("NFKC", str(text or "")).strip()
+
+
+def parse_rag_fields(text: str) -> Dict[str, str]:
+    """RAGテキスト（【項目】 値 の並び）を {項目: 値} に分解する"""
+    fields = {}
+    parts = _FIELD_PATTERN.split(text or "")
+    for i in range(1, len(parts) - 1, 2):
+        fields[parts[i].strip()] = parts[i + 1].strip()
+    return fields
+
+
+def normalize_work_style(text: Any) -> Optional[str]:
+    """勤務形態の表記を full_remote / hybrid / onsite / remote に正規化（判断できなければ None）
+
+    出社・常駐の否定（「リモート（出社なし）」）は出社ありと読まない。リモートと出社の両方に触れていて
+    どちらとも決められない表記は remote とし、除外ではなく注記にとどめる
+    """
+    text = _normalize(text)
+    if not text:
+        return None
+    negated = _NO_ONSITE_PATTERN.search(text)
+    text = _NO_ONSITE_PATTERN.sub(" ", text)
+    if _HYBRID_PATTERN.search(text):
+        return HYBRID
+    if _FULL_REMOTE_PATTERN.search(text):
+        return FULL_REMOTE
+    remote = _REMOTE_PATTERN.search(text)
+    if negated:
+        return FULL_REMOTE if remote else REMOTE
+    if _ONSITE_PATTERN.search(text):
+        if not remote:
+            return ONSITE
+        return HYBRID if _REMOTE_ALLOWED_PATTERN.search(text) else REMOTE
+    if remote:
+        return REMOTE
+    return None
+
+
+def infer_prefecture(text: Any) -> Optional[str]:
+    """住所・駅名から都道府県を類推する（都道府県名 → 駅名・地名の順、最初に現れたものを採用）"""
+    text = _normalize(text)
+    if not text:
+        return None
+    for prefecture in PREFECTURES:
+        if prefecture in text:
+            return prefecture
+    best = None
+    for name in _STATION_NAMES:
+        start = text.find(name)
+        while start >= 0:
+            end = start + len(name)
+            following = text[end:end + 1]
+            # 1文字の駅名（栄・津・柏など）は語の途中に現れたものを無視する
+            if len(name) > 1 or following in ("", "駅") or not _KANA_KANJI.match(following):
+                if best is None or start < best[0]:
+                    best = (start, name)
+                break
+            start = text.find(name, start + 1)
+    return STATION_PREFECTURE[best[1]] if best else None
+
+
+def region_of(prefecture: Optional[str]) -> Optional[str]:
+    """都道府県 → 地域（関東圏・関西圏、それ以外は都道府県）"""
+    return PREFECTURE_REGION.get(prefecture) if prefecture else None
+
+
+def _to_man_yen(value: str, has_man: bool) -> float:
+    number = float(value)
+    if has_man or number < 1000:
+        return number
+    return number / 10000  # 「650,000円」のような円表記
+
+
+def parse_price(text: Any) -> Optional[Tuple[Optional[float], Optional[float]]]:
+    """単価の表記を (下限, 上限) の万円に変換する
+
+    「60万」→ (60, 60)、「55〜65万円」→ (55, 65)、「〜80万」「80万以下」→ (None, 80)、
+    「60万〜」「60万以上」→ (60, None)。「スキル見合い」や数値のないものは None
+    """
+    text = _normalize(text).replace(",", "")
+    if not text or (_PRICE_NEGOTIABLE_PATTERN.search(text) and not _NUMBER_PATTERN.search(text)):
+        return None
+    has_man = "万" in text
+    parts = _RANGE_PATTERN.split(text, maxsplit=1)
+    if len(parts) == 2:
+        low_match = _NUMBER_PATTERN.search(parts[0])
+        high_match = _NUMBER_PATTERN.search(parts[1])
+        low = _to_man_yen(low_match.group(1), has_man) if low_match else None
+        high = _to_man_yen(high_match.group(1), has_man) if high_match else None
+        if low is None and high is None:
+            return None
+        return low, high
+    match = _NUMBER_PATTERN.search(text)
+    if not match:
+        return None
+    value = _to_man_yen(match.group(1), has_man)
+    if re.search(r"以下|まで|上限|MAX|max", text):
+        return None, value
+    if re.search(r"以上|から|下限|MIN|min", text):
+        return value, None
+    return value, value
+
+
+def parse_age(text: Any) -> Optional[int]:
+    """「35歳」「35」「30代」などから年齢（年代は下限）を取り出す"""
+    match = re.search(r"(\d{2})", _normalize(text))
+    return int(match.group(1)) if match else None
+
+
+def anken_conditions(anken_data: Dict[str, Any]) -> Dict[str, Any]:
+    """案件データからフィルタ条件（勤務形態・都道府県・地域・単価上限）を取り出す"""
+    work_style = normalize_work_style(anken_data.get("勤務形態", ""))
+    if work_style is None:
+        work_style = normalize_work_style(f"{anken_data.get('作業場所', '')} {anken_data.get('備考', '')}")
+    prefecture = infer_prefecture(anken_data.get("作業場所", ""))
+    price = parse_price(anken_data.get("単価", ""))
+    price_max = None
+    if price:
+        price_max = price[1] if price[1] is not None else price[0]
+    return {
+        "work_style": work_style,
+        "prefecture": prefecture,
+        "region": region_of(prefecture),
+        "price_max": price_max,
+    }
+
+
+def yoin_conditions(fields: Dict[str, str]) -> Dict[str, Any]:
+    """要員の項目（RAGテキストを分解したもの）から判定用の値を取り出す"""
+    prefecture = infer_prefecture(fields.get("最寄駅", ""))
+    price = parse_price(fields.get("単価（希望）", ""))
+    price_min = None
+    if price:
+        price_min = price[0] if price[0] is not None else price[1]
+    remarks = f"{fields.get('勤務形態（希望）', '')} {fields.get('備考', '')}"
+    return {
+        "work_style": normalize_work_style(fields.get("勤務形態（希望）", "")),
+        "prefecture": prefecture,
+        "region": region_of(prefecture),
+        "price_min": price_min,
+        "relocatable": bool(_RELOCATABLE_PATTERN.search(_normalize(remarks))),
+    }
+
+
+def yoin_metadata(record: Dict[str, Any]) -> Dict[str, Any]:
+    """RAG登録時に保存する要員の型付きメタデータ
+
+    Pineconeのメタデータは null を持てないため、不明な地域・勤務形態は "unknown"、
+    不明な単価・年齢は 0 とする（単価 0 は単価条件で除外されない）
+    """
+    yoin = yoin_conditions(record)
+    return {
+        "metadata_version": METADATA_VERSION,
+        "prefecture": yoin["prefecture"] or UNKNOWN,
+        "region": yoin["region"] or UNKNOWN,
+        "work_style": yoin["work_style"] or UNKNOWN,
+        "price_min": float(yoin["price_min"] or 0),
+        "age": parse_age(record.get("年齢", "")) or 0,
+        "relocatable": yoin["relocatable"],
+    }
+
+
+def _or_stale(condition: Dict[str, Any]) -> Dict[str, Any]:
+    # METADATA_VERSION より前に登録した要員の勤務形態は誤分類を含みうるため、条件で落とさず事前フィルタに任せる
+    return {"$or": [
+        condition,
+        {"metadata_version": {"$exists": False}},
+        {"metadata_version": {"$lt": METADATA_VERSION}},
+    ]}
+
+
+def _or_missing(field: str, condition: Dict[str, Any]) -> Dict[str, Any]:
+    # 型付きメタデータを持たない登録済みベクトル（このフィルタより前に登録したもの）は条件で落とさず、事前フィルタに任せる
+    return {"$or": [condition, {field: {"$exists": False}}]}
+
+
+def build_metadata_filter(anken: Dict[str, Any], price_tolerance: float) -> Dict[str, Any]:
+    """judge_candidate の除外ルールをPinecone形式のメタデータフィルタにする（案件側で決まらない条件は付けない）
+
+    各条件は、そのフィールドがないベクトルにも一致する（再登録前の要員を取りこぼさない）。
+    勤務形態は METADATA_VERSION より前に登録したベクトルにも一致する
+    """
+    conditions = []
+    if anken["work_style"] == ONSITE:
+        conditions.append(_or_stale({"work_style": {"$ne": FULL_REMOTE}}))
+    if anken["work_style"] in (ONSITE, HYBRID) and anken["region"]:
+        conditions.append(_or_missing("region", {"$or": [
+            {"region": {"$in": [anken["region"], UNKNOWN]}},
+            {"relocatable": {"$eq": True}},
+        ]}))
+    if anken["price_max"] is not None:
+        conditions.append(_or_missing(
+            "price_min", {"price_min": {"$lte": round(anken["price_max"] * (1 + price_tolerance), 2)}}
+        ))
+    return {"$and": conditions} if conditions else {}
+
+
+def _format_man(value: float) -> str:
+    return f"{value:g}万"
+
+
+def judge_candidate(anken: Dict[str, Any], yoin: Dict[str, Any], price_tolerance: float) -> Tuple[Optional[str], List[str]]:
+    """1件の要員を判定する。Returns: (除外したルール名 or None, 注記のリスト)"""
+    notes = []
+    needs_location = anken["work_style"] in (ONSITE, HYBRID)
+
+    # STEP 1: 勤務形態
+    if anken["work_style"] == ONSITE and yoin["work_style"] == FULL_REMOTE:
+        return "work_style", notes
+    if needs_location and yoin["work_style"] in (FULL_REMOTE, REMOTE):
+        notes.append("リモート希望だが案件は出社あり")
+
+    # STEP 1: 地域（案件が常駐・リモート併用の場合のみ）
+    if needs_location and anken["region"]:
+        if yoin["region"] is None:
+            notes.append("最寄駅から都道府県を判定できず")
+        elif yoin["region"] != anken["region"]:
+            if not yoin["relocatable"]:
+                return "region", notes
+            notes.append(f"地域が異なる（{yoin['region']}）が移動・転居可の記載あり")
+
+    # STEP 3: 単価
+    if anken["price_max"] is not None and yoin["price_min"] is not None:
+        if yoin["price_min"] > anken["price_max"] * (1 + price_tolerance):
+            return "price", notes
+        if yoin["price_min"] > anken["price_max"]:
+            notes.append(
+                f"希望単価{_format_man(yoin['price_min'])}が案件単価{_format_man(anken['price_max'])}を上回る"
+                f"（+{price_tolerance:.0%}以内）"
+            )
+    return None, notes
+
+
+def prefilter_candidates(anken_data: Dict[str, Any], docs, price_tolerance: float = 0.15):
+    """検索結果 [(Document, score)] から明らかに条件の合わない要員を除く
+
+    Returns:
+        (kept_docs, report): report は
+        {"anken": 案件の判定条件, "removed": {ルール: 件数}, "removed_ids": {ルール: [ID]},
+         "notes": {ID: [注記]}, "before": 件数, "after": 件数}
+    """
+    anken = anken_conditions(anken_data)
+    removed = {rule: 0 for rule in RULES}
+    removed_ids = {rule: [] for rule in RULES}
+    notes = {}
+    kept = []
+    for doc, score in docs:
+        yoin = yoin_conditions(parse_rag_fields(doc.page_content))
+        rule, doc_notes = judge_candidate(anken, yoin, price_tolerance)
+        if rule:
+            removed[rule] += 1
+            removed_ids[rule].append(doc.id)
+            continue
+        if doc_notes:
+            notes[doc.id] = doc_notes
+        kept.append((doc, score))
+    report = {
+        "anken": anken,
+        "removed": removed,
+        "removed_ids": removed_ids,
+        "notes": notes,
+        "before": len(docs),
+        "after": len(kept),
+    }
+    return kept, report
@@ -0,0 +1,117 @@
+"""
+マッチングプロンプトの入力トークン数の見積もりと、予算に合わせた候補の整形・選択
+
+- TokenCounter: OpenAI のモデルは tiktoken で数え、それ以外（tiktoken の語彙を取得できない場合も）は
+  ratelimit.estimate_tokens（UTF-8のバイト数 / 4）で概算する
+- compact_candidate: RAG登録テキスト（【項目】 値）を1項目1行に整形し、スキルは先頭から max_skills 件、
+  備考・メールタイトルは max_chars 文字に切り詰める（同じ入力なら常に同じ出力）
+- fit_to_budget: 検索順に、予算に収まる候補だけを残す
+"""
+
+import re
+import threading
+from typing import Any, Dict, List, Sequence, Tuple
+
+from ratelimit import estimate_tokens
+
+# RAG登録テキストの項目（build_yoin_rag_text と同じ順）。メールタイトル中の【要員】などを項目と誤認しないよう列挙する
+CANDIDATE_FIELDS = ("要員ID", "受信日時", "氏名", "年齢", "スキル", "最寄駅", "勤務形態（希望）", "単価（希望）", "備考", "メールタイトル")
+# 見出しの「■ 要員ID:」と重複するため省く項目
+_DROPPED_FIELDS = {"要員ID"}
+# 文字数で切り詰める自由記述の項目
+_TRIMMED_FIELDS = {"備考", "メールタイトル"}
+_FIELD_PATTERN = re.compile("【(" + "|".join(re.escape(field) for field in CANDIDATE_FIELDS) + ")】")
+_SKILL_SEPARATORS = re.compile(r"[\n、,]")
+
+_encodings: Dict[str, Any] = {}
+_encodings_lock = threading.Lock()
+
+
+def _encoding(model: str):
+    """モデルの tiktoken エンコーディング（未インストール・語彙ファイルを取得できない場合は None）"""
+    with _encodings_lock:
+        if model not in _encodings:
+            try:
+                import tiktoken
+                try:
+                    _encodings[model] = tiktoken.encoding_for_model(model)
+                except KeyError:
+                    _encodings[model] = tiktoken.get_encoding("o200k_base")
+            except Exception as e:
+                print(f"Warning: tiktoken is unavailable for {model} ({e}); estimating prompt tokens")
+                _encodings[model] = None
+        return _encodings[model]
+
+
+class TokenCounter:
+    """プロバイダー・モデルに応じてテキストのトークン数を数える"""
+
+    def __init__(self, provider: str, model: str):
+        self.encoding = _encoding(model) if provider == "openai" else None
+        self.name = "tiktoken" if self.encoding is not None else "estimate"
+
+    def __call__(self, text: str) -> int:
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        return estimate_tokens(text)
+
+
+def _trim(text: str, max_chars: int) -> str:
+    return text if len(text) <= max_chars else text[:max_chars].rstrip() + "…"
+
+
+def _compact_skills(value: str, max_skills: int) -> str:
+    skills = []
+    for item in _SKILL_SEPARATORS.split(value):
+        item = " ".join(item.strip().lstrip("-・*").split())
+        if item and item not in skills:
+            skills.append(item)
+    text = " / ".join(skills[:max_skills])
+    if len(skills) > max_skills:
+        text += f" ほか{len(skills) - max_skills}件"
+    return text
+
+
+def compact_candidate(text: str, max_skills: int, max_chars: int) -> str:
+    """RAG登録テキストをプロンプト用に詰める（項目が見つからないテキストは空白の連続だけをまとめる）"""
+    parts = _FIELD_PATTERN.split(text)
+    if len(parts) < 3:
+        return " ".join(text.split())
+    lines = []
+    for field, value in zip(parts[1::2], parts[2::2]):
+        if field in _DROPPED_FIELDS:
+            continue
+        if field == "スキル":
+            value = _compact_skills(value, max_skills)
+        else:
+            value = " ".join(value.split())
+            if field in _TRIMMED_FIELDS:
+                value = _trim(value, max_chars)
+        if value:
+            lines.append(f"【{field}】 {value}")
+    return "\n".join(lines)
+
+
+def fit_to_budget(costs: Sequence[int], budget: int, min_items: int = 1) -> Tuple[List[int], int]:
+    """先頭から順に、合計が budget に収まる要素のインデックスを選ぶ（収まらない要素は飛ばして次を試す）
+
+    先頭の min_items 件は予算を超えても残す。Returns: (選んだインデックス, 合計)
+    """
+    kept, used = [], 0
+    for index, cost in enumerate(costs):
+        if used + cost <= budget or len(kept) < min_items:
+            kept.append(index)
+            used += cost
+    return kept, used
+
+
+def context_report(counter: TokenCounter, retrieved: int, kept: int, budget: int, prompt_tokens: int) -> Dict[str, Any]:
+    """リクエストごとに返すプロンプトの内訳"""
+    return {
+        "retrieved": retrieved,
+        "candidates": kept,
+        "dropped": retrieved - kept,
+        "prompt_tokens": prompt_tokens,
+        "budget": budget,
+        "tokenizer": counter.name,
+    }
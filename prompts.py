@@ -91,4 +91,43 @@ MATCHING_PROMPT = """
 - nameはA,B,C,ではなく要員のイニシャルとしてください
 - actionsは、候補者ごとに、担当者として検討すべき項目や行動を示してください
 - comparisionは、要員ごとに「スキル」「勤務形態」「単価」のマッチ度を「◎」、「⚪」、「△」、「×」で表してください
-"""
\ No newline at end of file
+"""
+# 並列スコアリング（mode=parallel）: 候補の小グループごとに採点する。上位5名の選定・比較チャート・推奨アクションはPython側で組み立てる
+GROUP_SCORING_PROMPT = """
+あなたは案件と要員のマッチングアドバイザーです。
+以下の案件情報と候補者（全員）を採点し、JSON形式で出力してください。
+
+【出力ルール】
+- JSON 以外の文字(文章・説明・```など)は絶対に出力しない
+- 候補者は全員、入力と同じ「要員ID」で出力する
+- 点数は文字列ではなく number として返す
+
+【出力形式（厳守）】
+{{
+  "scores": [
+    {{
+      "要員ID": "...",
+      "マッチ度": 0,
+      "スキルのマッチ度": "◎",
+      "勤務形態のマッチ度": "⚪",
+      "単価のマッチ度": "△",
+      "理由コメント": "（60字以内）",
+      "推奨アクション": "（担当者として検討すべき項目や行動を40字以内）"
+    }}
+  ]
+}}
+
+【案件情報】
+{anken_formatted}
+
+【候補者】
+{matches_text}
+
+## 採点基準（マッチ度は100点満点）
+- 勤務形態: 案件が常駐・リモート併用・ハイブリッドの場合、案件と要員の地域（東京・神奈川・埼玉・千葉は「関東圏」、大阪・兵庫・京都は「関西圏」、それ以外は都道府県。要員は最寄駅から類推）が異なれば大きく減点する
+- スキル: 「重点キーワード」に完全一致・部分一致・類似技術を持つ要員を大幅に加点する（+20〜30点）。関連スキル（例：Python→Django/Flask、React→JavaScript/TypeScript）も高く評価する
+- 受信日時が概ね4週間以内で、日時が近いほど加点する
+- 単価: 要員の希望単価が案件単価以下なら加点、15%を超えて上回る場合は減点する
+- 【事前判定】の注記がある場合は考慮する
+- 各マッチ度の記号は「◎」「⚪」「△」「×」のいずれか
+"""
@@ -0,0 +1,358 @@
+"""
+LLM・埋め込みの呼び出しスケジューラ（プロバイダーごとのレート制限と優先度）
+
+- プロバイダー（llm_config.RATE_LIMITS のキー）ごとに requests/min と tokens/min のトークンバケットを持つ
+- 待っている呼び出しは優先度（INTERACTIVE → BATCH）、同じ優先度では到着順に通す。
+  マッチングの呼び出しは、先に並んでいた構造化の呼び出しより先に通る
+- チャットモデルは ProviderRateLimiter を rate_limiter に渡して呼び出しの直前に待ち、
+  使ったトークン数は SchedulerHandler（LangChainのコールバック）で tokens/min から差し引く
+- 429（レート制限）を受けたプロバイダーは retry-after の間（なければバックオフの間）止め、
+  call / acall はジッター付きの指数バックオフで再試行する
+- 優先度は contextvar で渡す（with priority(BATCH): ...。スレッドプールには timing.submit_with_context で引き継ぐ）
+"""
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import random
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.embeddings import Embeddings
+from langchain_core.rate_limiters import BaseRateLimiter
+
+from metrics import token_usage
+
+INTERACTIVE = 0
+BATCH = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BATCH: "batch"}
+
+# バケットに溜められる量（秒数分）。1分の上限を一度に使い切らないようにする
+BURST_SECONDS = 10
+# 順番待ち（先頭でない）の非同期の呼び出しが自分の番を確認する間隔（秒）
+_POLL_INTERVAL = 0.05
+
+_priority: contextvars.ContextVar = contextvars.ContextVar("llm_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def priority(level: int):
+    """このブロック内（と引き継いだスレッド）のモデル呼び出しの優先度"""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def estimate_tokens(text: str) -> int:
+    """トークン数の概算（UTF-8で4バイト ≒ 1トークン。日本語は1文字 ≒ 0.75トークン）"""
+    return max(1, len(text.encode("utf-8")) // 4)
+
+
+def is_rate_limited(error: BaseException) -> bool:
+    """429 / クォータ超過（OpenAI・Gemini・Bedrock）かどうか"""
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    if status == 429:
+        return True
+    code = getattr(error, "code", None)
+    if code == 429:
+        return True
+    response = getattr(error, "response", None)
+    if isinstance(response, dict) and response.get("Error", {}).get("Code") in ("ThrottlingException", "TooManyRequestsException"):
+        return True
+    name = type(error).__name__
+    return name in ("RateLimitError", "ResourceExhausted", "ThrottlingException", "TooManyRequests")
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """応答ヘッダの retry-after-ms / retry-after（秒または日時）から待つ秒数を取り出す"""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        value = headers.get("retry-after-ms")
+        if value is not None:
+            return max(0.0, float(value) / 1000)
+        value = headers.get("retry-after")
+        if value is None:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """1分あたり per_minute を補充するバケット（tokens/min は実際の使用量を後から差し引くので負になりうる）"""
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60
+        self.capacity = max(1.0, self.rate * BURST_SECONDS)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+
+class _Lane:
+    def __init__(self, limits: Dict[str, float]):
+        self.requests = TokenBucket(limits["rpm"]) if limits.get("rpm") else None
+        self.tokens = TokenBucket(limits["tpm"]) if limits.get("tpm") else None
+        self.waiting: List = []  # (priority, seq) のヒープ
+        self.blocked_until = 0.0
+        self.granted = {level: 0 for level in PRIORITY_NAMES}
+        self.wait_seconds = {level: 0.0 for level in PRIORITY_NAMES}
+        self.rate_limited = 0
+        self.retries = 0
+
+    def buckets(self):
+        return [bucket for bucket in (self.requests, self.tokens) if bucket is not None]
+
+
+class Scheduler:
+    """プロバイダーごとのレート制限と順番待ち（スレッド・イベントループの両方から使える）
+
+    limits: {provider: {"rpm": 1分あたりのリクエスト数, "tpm": 1分あたりのトークン数}}。ないプロバイダーは待たない
+    """
+
+    def __init__(self, limits: Dict[str, Dict[str, float]], max_retries: int = 5, backoff_base: float = 1.0,
+                 backoff_max: float = 60.0):
+        self._lanes = {provider: _Lane(config) for provider, config in limits.items()}
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+
+    def _try_take(self, lane: _Lane, ticket, tokens: float) -> float:
+        """先頭の呼び出しなら枠を取る。Returns: 0（通ってよい）または次に確認するまでの秒数"""
+        if lane.waiting[0] != ticket:
+            return _POLL_INTERVAL
+        now = time.monotonic()
+        if now < lane.blocked_until:
+            return lane.blocked_until - now
+        for bucket in lane.buckets():
+            bucket.refill(now)
+        wait = max(lane.requests.wait_time(1) if lane.requests else 0.0,
+                   lane.tokens.wait_time(tokens) if lane.tokens else 0.0)
+        if wait > 0:
+            return wait
+        if lane.requests:
+            lane.requests.level -= 1
+        if lane.tokens:
+            lane.tokens.level -= tokens
+        heapq.heappop(lane.waiting)
+        return 0.0
+
+    def _leave(self, lane: _Lane, ticket):
+        if ticket in lane.waiting:
+            lane.waiting.remove(ticket)
+            heapq.heapify(lane.waiting)
+        self._cond.notify_all()
+
+    def _granted(self, lane: _Lane, level: int, started: float):
+        lane.granted[level] += 1
+        lane.wait_seconds[level] += time.monotonic() - started
+
+    def acquire(self, provider: str, tokens: float = 0):
+        """順番と枠が来るまで待つ（スレッド用）"""
+        lane = self._lanes.get(provider)
+        if lane is None:
+            return
+        level = _priority.get()
+        ticket = (level, next(self._seq))
+        started = time.monotonic()
+        with self._cond:
+            heapq.heappush(lane.waiting, ticket)
+            try:
+                while True:
+                    wait = self._try_take(lane, ticket, tokens)
+                    if wait == 0:
+                        break
+                    self._cond.wait(min(wait, 1.0))
+            finally:
+                self._leave(lane, ticket)
+            self._granted(lane, level, started)
+
+    async def aacquire(self, provider: str, tokens: float = 0):
+        """順番と枠が来るまで待つ（イベントループ用。スレッドは止めない）"""
+        lane = self._lanes.get(provider)
+        if lane is None:
+            return
+        level = _priority.get()
+        ticket = (level, next(self._seq))
+        started = time.monotonic()
+        with self._cond:
+            heapq.heappush(lane.waiting, ticket)
+        try:
+            while True:
+                with self._cond:
+                    wait = self._try_take(lane, ticket, tokens)
+                    if wait == 0:
+                        self._granted(lane, level, started)
+                        break
+                await asyncio.sleep(min(wait, 1.0))
+        finally:
+            with self._cond:
+                self._leave(lane, ticket)
+
+    def debit(self, provider: str, tokens: float):
+        """実際に使ったトークン数を tokens/min から差し引く"""
+        lane = self._lanes.get(provider)
+        if lane is None or lane.tokens is None or not tokens:
+            return
+        with self._cond:
+            lane.tokens.refill(time.monotonic())
+            lane.tokens.level -= tokens
+
+    def penalize(self, provider: str, error: BaseException, attempt: int = 0) -> float:
+        """レート制限を受けたプロバイダーを止める。Returns: 止める秒数（retry-after、なければバックオフ）"""
+        delay = retry_after(error)
+        if delay is None:
+            delay = self.backoff(attempt)
+        lane = self._lanes.get(provider)
+        if lane is not None:
+            with self._cond:
+                lane.rate_limited += 1
+                lane.blocked_until = max(lane.blocked_until, time.monotonic() + delay)
+                self._cond.notify_all()
+        print(f"Rate limited by {provider}; pausing {delay:.1f}s: {str(error)[:200]}")
+        return delay
+
+    def backoff(self, attempt: int) -> float:
+        """ジッター付きの指数バックオフ（0 〜 base * 2^attempt 秒、上限 backoff_max）"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _retry_delay(self, provider: str, error: BaseException, attempt: int, penalized: bool) -> float:
+        lane = self._lanes.get(provider)
+        if lane is not None:
+            with self._cond:
+                lane.retries += 1
+        if not penalized:
+            self.penalize(provider, error, attempt)
+        delay = retry_after(error)
+        # retry-after があれば守りつつ、同時に止められた呼び出しが一斉に再開しないように少しずらす
+        return delay + random.uniform(0, self.backoff_base) if delay is not None else self.backoff(attempt)
+
+    def call(self, provider: str, fn: Callable[[], Any], tokens: float = 0, acquire: bool = True,
+             max_retries: int = None, penalized: bool = False) -> Any:
+        """fn() をレート制限の枠内で呼び、429 ならバックオフして再試行する（スレッド用）
+
+        acquire=False は fn の中で待つ場合（ProviderRateLimiter を持つチャットモデル）。
+        penalized=True は 429 を SchedulerHandler がすでに記録している場合
+        """
+        max_retries = self.max_retries if max_retries is None else max_retries
+        for attempt in itertools.count():
+            if acquire:
+                self.acquire(provider, tokens)
+            try:
+                return fn()
+            except Exception as e:
+                if not is_rate_limited(e) or attempt >= max_retries:
+                    raise
+                time.sleep(self._retry_delay(provider, e, attempt, penalized))
+
+    async def acall(self, provider: str, fn: Callable[[], Awaitable[Any]], tokens: float = 0, acquire: bool = True,
+                    max_retries: int = None, penalized: bool = False) -> Any:
+        """call の非同期版（fn はコルーチンを返す関数）"""
+        max_retries = self.max_retries if max_retries is None else max_retries
+        for attempt in itertools.count():
+            if acquire:
+                await self.aacquire(provider, tokens)
+            try:
+                return await fn()
+            except Exception as e:
+                if not is_rate_limited(e) or attempt >= max_retries:
+                    raise
+                await asyncio.sleep(self._retry_delay(provider, e, attempt, penalized))
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """プロバイダー・優先度ごとの待ち件数と累計（/metrics 用）"""
+        now = time.monotonic()
+        result = []
+        with self._cond:
+            for provider, lane in self._lanes.items():
+                for bucket in lane.buckets():
+                    bucket.refill(now)
+                for level, name in PRIORITY_NAMES.items():
+                    result.append({
+                        "provider": provider,
+                        "priority": name,
+                        "queue_depth": sum(1 for ticket in lane.waiting if ticket[0] == level),
+                        "granted": lane.granted[level],
+                        "wait_seconds": lane.wait_seconds[level],
+                        "rate_limited": lane.rate_limited,
+                        "retries": lane.retries,
+                        "blocked_sec": max(0.0, lane.blocked_until - now),
+                        "requests_available": lane.requests.level if lane.requests else None,
+                        "tokens_available": lane.tokens.level if lane.tokens else None,
+                    })
+        return result
+
+
+class ProviderRateLimiter(BaseRateLimiter):
+    """チャットモデルの rate_limiter に渡し、API呼び出しの直前に Scheduler の枠を待つ"""
+
+    def __init__(self, scheduler: Scheduler, provider: str):
+        self.scheduler = scheduler
+        self.provider = provider
+
+    def acquire(self, *, blocking: bool = True) -> bool:
+        self.scheduler.acquire(self.provider)
+        return True
+
+    async def aacquire(self, *, blocking: bool = True) -> bool:
+        await self.scheduler.aacquire(self.provider)
+        return True
+
+
+class SchedulerHandler(BaseCallbackHandler):
+    """使ったトークン数を tokens/min から差し引き、429 を受けたらプロバイダーを止める"""
+
+    run_inline = True
+
+    def __init__(self, scheduler: Scheduler, provider: str):
+        self.scheduler = scheduler
+        self.provider = provider
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        prompt_tokens, completion_tokens = token_usage(response)
+        self.scheduler.debit(self.provider, prompt_tokens + completion_tokens)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        if is_rate_limited(error):
+            self.scheduler.penalize(self.provider, error)
+
+
+class ScheduledEmbeddings(Embeddings):
+    """埋め込みの呼び出しを Scheduler の枠内で行う（トークン数は文字列から概算）"""
+
+    def __init__(self, underlying: Embeddings, scheduler: Scheduler, provider: str):
+        self.underlying = underlying
+        self.scheduler = scheduler
+        self.provider = provider
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        tokens = sum(estimate_tokens(text) for text in texts)
+        return self.scheduler.call(self.provider, lambda: self.underlying.embed_documents(texts), tokens)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.scheduler.call(self.provider, lambda: self.underlying.embed_query(text), estimate_tokens(text))
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self.scheduler.acall(self.provider, lambda: self.underlying.aembed_query(text),
+                                          estimate_tokens(text))
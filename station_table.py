@@ -0,0 +1,99 @@
+"""
+駅名・地名 → 都道府県 → 地域 の対応表（事前フィルタ用）
+MATCHING_PROMPT の STEP 1 と同じく、関東圏（東京・神奈川・埼玉・千葉）と関西圏（大阪・兵庫・京都）は
+それぞれ一つの地域として扱い、それ以外は都道府県そのものを地域とする
+"""
+
+PREFECTURES = [
+    "北海道", "青森県", "岩手県", "宮城県", "秋田県", "山形県", "福島県",
+    "茨城県", "栃木県", "群馬県", "埼玉県", "千葉県", "東京都", "神奈川県",
+    "新潟県", "富山県", "石川県", "福井県", "山梨県", "長野県", "岐阜県", "静岡県", "愛知県",
+    "三重県", "滋賀県", "京都府", "大阪府", "兵庫県", "奈良県", "和歌山県",
+    "鳥取県", "島根県", "岡山県", "広島県", "山口県",
+    "徳島県", "香川県", "愛媛県", "高知県",
+    "福岡県", "佐賀県", "長崎県", "熊本県", "大分県", "宮崎県", "鹿児島県", "沖縄県",
+]
+
+REGIONS = {
+    "関東圏": ["東京都", "神奈川県", "埼玉県", "千葉県"],
+    "関西圏": ["大阪府", "兵庫県", "京都府"],
+}
+
+PREFECTURE_REGION = {pref: pref for pref in PREFECTURES}
+for _region, _prefs in REGIONS.items():
+    for _pref in _prefs:
+        PREFECTURE_REGION[_pref] = _region
+
+# 駅名・区市町村名 → 都道府県（「駅」は付けない。京橋・中央区のように複数にある名前は先に載せた方を採用）
+_PLACES = {
+    "東京都": [
+        "東京", "新宿", "渋谷", "池袋", "品川", "大崎", "五反田", "目黒", "恵比寿", "原宿", "代々木", "新大久保",
+        "高田馬場", "目白", "大塚", "巣鴨", "駒込", "田端", "西日暮里", "日暮里", "鶯谷", "上野", "御徒町",
+        "秋葉原", "神田", "有楽町", "新橋", "浜松町", "田町", "高輪ゲートウェイ", "大井町", "蒲田", "大森",
+        "大手町", "日本橋", "京橋", "銀座", "築地", "八丁堀", "茅場町", "人形町", "水天宮前", "三越前",
+        "虎ノ門", "霞ケ関", "霞が関", "溜池山王", "赤坂", "赤坂見附", "六本木", "麻布十番", "表参道", "青山一丁目",
+        "外苑前", "神保町", "九段下", "飯田橋", "市ケ谷", "市ヶ谷", "四ツ谷", "四谷", "御茶ノ水", "水道橋", "後楽園",
+        "春日", "本郷三丁目", "湯島", "早稲田", "神楽坂", "中野", "高円寺", "阿佐ケ谷", "阿佐ヶ谷", "荻窪",
+        "西荻窪", "吉祥寺", "三鷹", "武蔵境", "国分寺", "国立", "立川", "八王子", "町田", "府中", "調布",
+        "多摩センター", "聖蹟桜ヶ丘", "錦糸町", "両国", "亀戸", "押上", "浅草", "北千住", "綾瀬", "赤羽",
+        "王子", "板橋", "成増", "練馬", "大泉学園", "石神井公園", "中目黒", "自由が丘", "二子玉川", "三軒茶屋",
+        "下北沢", "明大前", "笹塚", "初台", "豊洲", "門前仲町", "木場", "東陽町", "新木場", "お台場", "天王洲アイル",
+        "大門", "芝公園", "三田", "白金高輪", "戸越", "武蔵小山", "西新宿", "都庁前", "新宿三丁目", "曙橋",
+        "千代田区", "中央区", "港区", "新宿区", "文京区", "台東区", "墨田区", "江東区", "品川区", "目黒区",
+        "大田区", "世田谷区", "渋谷区", "中野区", "杉並区", "豊島区", "北区", "荒川区", "板橋区", "練馬区",
+        "足立区", "葛飾区", "江戸川区", "都内", "23区",
+    ],
+    "神奈川県": [
+        "横浜", "新横浜", "桜木町", "関内", "みなとみらい", "川崎", "武蔵小杉", "溝の口", "登戸", "新百合ヶ丘",
+        "鶴見", "戸塚", "大船", "藤沢", "茅ケ崎", "茅ヶ崎", "平塚", "小田原", "海老名", "本厚木", "厚木",
+        "相模大野", "橋本", "鎌倉", "横須賀", "センター北", "センター南", "たまプラーザ", "あざみ野",
+        "青葉台", "長津田", "中山", "二俣川", "上大岡", "日吉", "綱島", "菊名", "大和", "相模原",
+    ],
+    "埼玉県": [
+        "大宮", "さいたま新都心", "浦和", "南浦和", "武蔵浦和", "川口", "西川口", "蕨", "戸田公園", "所沢",
+        "川越", "越谷", "南越谷", "新越谷", "春日部", "草加", "朝霞", "和光市", "志木", "上尾", "熊谷",
+        "久喜", "狭山", "入間", "新座", "ふじみ野", "三郷", "八潮", "さいたま",
+    ],
+    "千葉県": [
+        "千葉", "海浜幕張", "幕張", "幕張本郷", "津田沼", "船橋", "西船橋", "市川", "本八幡", "浦安", "舞浜",
+        "新浦安", "松戸", "柏", "我孫子", "流山おおたかの森", "成田", "蘇我", "稲毛", "木更津", "八千代",
+        "新鎌ヶ谷", "新松戸",
+    ],
+    "茨城県": ["水戸", "つくば", "土浦", "取手", "守谷", "日立"],
+    "栃木県": ["宇都宮", "小山"],
+    "群馬県": ["高崎", "前橋"],
+    "大阪府": [
+        "大阪", "梅田", "北新地", "東梅田", "西梅田", "中之島", "淀屋橋", "本町", "心斎橋", "なんば", "難波",
+        "天王寺", "新大阪", "天満橋", "北浜", "堺筋本町", "谷町四丁目", "森ノ宮", "弁天町",
+        "江坂", "千里中央", "豊中", "吹田", "茨木", "高槻", "枚方", "堺", "なかもず", "岸和田", "東大阪",
+        "布施", "守口", "門真",
+    ],
+    "兵庫県": ["神戸", "三宮", "三ノ宮", "元町", "西宮", "西宮北口", "尼崎", "芦屋", "姫路", "明石", "宝塚", "伊丹"],
+    "京都府": ["京都", "四条", "烏丸", "河原町", "烏丸御池", "山科", "宇治", "長岡京"],
+    "奈良県": ["奈良", "生駒", "大和西大寺"],
+    "滋賀県": ["大津", "草津", "南草津"],
+    "和歌山県": ["和歌山"],
+    "愛知県": ["名古屋", "名駅", "栄", "伏見", "金山", "千種", "今池", "大曽根", "豊田", "岡崎", "豊橋", "刈谷", "一宮", "春日井"],
+    "静岡県": ["静岡", "浜松", "沼津", "三島"],
+    "岐阜県": ["岐阜", "大垣"],
+    "三重県": ["四日市", "津", "鈴鹿"],
+    "福岡県": ["福岡", "博多", "天神", "中洲川端", "赤坂門", "薬院", "大橋", "小倉", "北九州", "久留米"],
+    "北海道": ["札幌", "大通", "すすきの", "新札幌", "旭川", "函館"],
+    "宮城県": ["仙台", "長町", "泉中央"],
+    "広島県": ["広島", "福山", "紙屋町"],
+    "岡山県": ["岡山", "倉敷"],
+    "新潟県": ["新潟", "長岡"],
+    "石川県": ["金沢"],
+    "富山県": ["富山"],
+    "長野県": ["長野", "松本"],
+    "熊本県": ["熊本"],
+    "鹿児島県": ["鹿児島中央", "鹿児島"],
+    "沖縄県": ["那覇", "県庁前", "おもろまち"],
+    "香川県": ["高松"],
+    "愛媛県": ["松山"],
+}
+
+STATION_PREFECTURE = {}
+for _pref, _places in _PLACES.items():
+    for _place in _places:
+        STATION_PREFECTURE.setdefault(_place, _pref)
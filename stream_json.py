@@ -0,0 +1,117 @@
+"""
+ストリーミング中のLLM出力（JSON）を少しずつ読み進めるパーサ
+指定したパスのオブジェクト・配列が閉じた時点で、その値を取り出して返す
+
+例: watch={("candidates", "*"): "candidate"} なら candidates 配列の各要素が閉じるたびに
+    ("candidate", インデックス, 値) を返す
+"""
+
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+# 末尾のカンマ（ "a": 1, } ）と、改行をまたいだカンマ抜け（ "a": "x"\n "b": ... ）の補正
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_MISSING_COMMA = re.compile(r'(["\d}\]]|true|false|null)(\s*\n\s*)(")')
+
+
+def lenient_loads(text: str) -> Any:
+    """json.loads が失敗したら、LLMが出しがちな崩れ（末尾カンマ・カンマ抜け）を補正して読み直す"""
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+    fixed = _TRAILING_COMMA.sub(r"\1", text)
+    fixed = _MISSING_COMMA.sub(r"\1,\2\3", fixed)
+    return json.loads(fixed)
+
+
+class _Frame:
+    __slots__ = ("kind", "path", "start", "key", "index", "expect_key")
+
+    def __init__(self, kind: str, path: Tuple, start: int):
+        self.kind = kind  # "obj" / "arr"
+        self.path = path
+        self.start = start
+        self.key: Optional[str] = None
+        self.index = 0
+        self.expect_key = kind == "obj"
+
+    def child_path(self) -> Tuple:
+        return self.path + ((self.key,) if self.kind == "obj" else (self.index,))
+
+
+class IncrementalJsonParser:
+    """トップレベルの最初のオブジェクトを文字単位で追跡する
+
+    - JSONより前の文字（```json など）は読み飛ばす
+    - 文字列中の括弧・エスケープを考慮する
+    - 監視対象のパスの値が閉じたら feed() の戻り値として (名前, インデックス, 値) を返す
+      （値の読み込みに失敗した場合は返さない）
+    """
+
+    def __init__(self, watch: Dict[Tuple, str]):
+        self.watch = watch
+        self.text = ""
+        self.done = False
+        self._pos = 0
+        self._stack: List[_Frame] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+
+    def _watched(self, path: Tuple) -> Optional[str]:
+        for pattern, name in self.watch.items():
+            if len(pattern) == len(path) and all(p == "*" and isinstance(v, int) or p == v for p, v in zip(pattern, path)):
+                return name
+        return None
+
+    def feed(self, chunk: str) -> List[Tuple[str, Optional[int], Any]]:
+        events = []
+        self.text += chunk
+        text = self.text
+        while self._pos < len(text) and not self.done:
+            ch = text[self._pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    frame = self._stack[-1]
+                    if frame.kind == "obj" and frame.expect_key:
+                        try:
+                            frame.key = json.loads(text[self._string_start:self._pos + 1])
+                        except json.JSONDecodeError:
+                            frame.key = text[self._string_start + 1:self._pos]
+                        frame.expect_key = False
+            elif not self._stack:
+                if ch == "{":
+                    self._stack.append(_Frame("obj", (), self._pos))
+            elif ch == '"':
+                self._in_string = True
+                self._string_start = self._pos
+            elif ch in "{[":
+                parent = self._stack[-1]
+                self._stack.append(_Frame("obj" if ch == "{" else "arr", parent.child_path(), self._pos))
+            elif ch in "}]":
+                frame = self._stack.pop()
+                name = self._watched(frame.path)
+                if name is not None:
+                    try:
+                        value = lenient_loads(text[frame.start:self._pos + 1])
+                        index = frame.path[-1] if frame.path and isinstance(frame.path[-1], int) else None
+                        events.append((name, index, value))
+                    except json.JSONDecodeError:
+                        pass
+                if not self._stack:
+                    self.done = True
+            elif ch == ",":
+                frame = self._stack[-1]
+                if frame.kind == "arr":
+                    frame.index += 1
+                else:
+                    frame.expect_key = True
+            self._pos += 1
+        return events
@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding, Embeddings
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+
+from cassette import Cassette, CassetteChatModel, CassetteEmbeddings, CassetteMissError
+
+IDENTITY = {"provider": "openai", "model": "gpt-test"}
+
+
+class Unreachable(Embeddings):
+    """再生時に呼ばれたら失敗する（API を呼ばないことの確認）"""
+
+    def embed_documents(self, texts):
+        raise AssertionError(f"embed_documents called with {texts}")
+
+    def embed_query(self, text):
+        raise AssertionError(f"embed_query called with {text}")
+
+
+def chat(cassette, *responses):
+    return CassetteChatModel(underlying=GenericFakeChatModel(messages=iter(responses)), cassette=cassette,
+                             identity=IDENTITY)
+
+
+def test_stream_recorded_then_replayed_via_invoke(tmp_path):
+    path = str(tmp_path / "llm.jsonl.gz")
+    recorder = chat(Cassette(path, mode="record"), "マッチ度 は 85 点")
+    streamed = [chunk.content for chunk in recorder.stream("要員を採点して")]
+    assert len(streamed) > 1
+
+    replayer = chat(Cassette(path, mode="replay", speed=0))
+    assert replayer.invoke("要員を採点して").content == "".join(streamed)
+    replayed = [chunk.content for chunk in replayer.stream("要員を採点して")]
+    assert [text for text in replayed if text] == [text for text in streamed if text]
+    assert asyncio.run(replayer.ainvoke("要員を採点して")).content == "".join(streamed)
+    assert replayer.cassette.stats()["hits"] == 3
+
+
+def test_replay_mode_raises_on_unrecorded_request(tmp_path):
+    path = str(tmp_path / "llm.jsonl.gz")
+    chat(Cassette(path, mode="record"), "OK").invoke("recorded")
+    replayer = chat(Cassette(path, mode="replay", speed=0))
+    with pytest.raises(CassetteMissError):
+        replayer.invoke("not recorded")
+    assert replayer.cassette.stats()["misses"] == 1
+
+
+def test_embeddings_replay_with_different_batches(tmp_path):
+    path = str(tmp_path / "embeddings.jsonl.gz")
+    texts = ["Java", "Python", "AWS", "Go"]
+    underlying = DeterministicFakeEmbedding(size=8)
+    recorded = CassetteEmbeddings(underlying, "fake", Cassette(path, mode="record")).embed_documents(texts)
+
+    replayer = CassetteEmbeddings(Unreachable(), "fake", Cassette(path, mode="replay", speed=0))
+    replayed = replayer.embed_documents(texts[2:]) + replayer.embed_documents(texts[:2])
+    for got, want in zip(replayed, recorded[2:] + recorded[:2]):
+        assert got == pytest.approx(want, rel=1e-6)
+    assert replayer.embed_query("Python") == pytest.approx(recorded[1], rel=1e-6)
+    with pytest.raises(CassetteMissError):
+        replayer.embed_documents(["Java", "Rust"])
+
+
+def test_auto_mode_records_only_missing_texts(tmp_path):
+    path = str(tmp_path / "embeddings.jsonl.gz")
+    cassette = Cassette(path, mode="auto", speed=0)
+    embeddings = CassetteEmbeddings(DeterministicFakeEmbedding(size=8), "fake", cassette)
+    embeddings.embed_documents(["Java", "Python"])
+    embeddings.embed_documents(["Python", "Go"])
+    assert cassette.stats()["recorded"] == 3
+    assert Cassette(path).stats()["entries"] == 3
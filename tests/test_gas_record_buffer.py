@@ -0,0 +1,81 @@
+import pytest
+import requests
+
+import job_matching_flow
+import timing
+from job_matching_flow import GasRecordBuffer, record_post_results
+
+
+@pytest.fixture
+def posts(monkeypatch):
+    """post_records_to_gas の代わりに、outcomes を先頭から順に返す（例外なら送出する）"""
+    calls = []
+    outcomes = []
+
+    def post(type_, records):
+        calls.append([record["id"] for record in records])
+        outcome = outcomes.pop(0) if outcomes else {"status": "success", "appended": len(records)}
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    monkeypatch.setattr(job_matching_flow, "post_records_to_gas", post)
+    monkeypatch.setattr("time.sleep", lambda seconds: None)
+    return calls, outcomes
+
+
+def test_flushes_every_batch_size_and_on_exit(posts):
+    calls, _ = posts
+    with GasRecordBuffer("yoin", batch_size=2) as buffer:
+        for i in range(5):
+            buffer.add({"id": f"Y{i}"})
+    assert calls == [["Y0", "Y1"], ["Y2", "Y3"], ["Y4"]]
+    assert buffer.posted == 5
+    assert buffer.failed == 0
+
+
+def test_retries_failed_posts(posts):
+    calls, outcomes = posts
+    outcomes.extend([requests.ConnectionError("reset"), {"status": "error", "message": "busy"}])
+    with GasRecordBuffer("yoin", batch_size=2, max_retries=3) as buffer:
+        buffer.add({"id": "Y0"})
+        buffer.add({"id": "Y1"})
+    assert len(calls) == 3
+    assert buffer.posted == 2
+    assert buffer.failed == 0
+
+
+def test_counts_records_that_could_not_be_posted(posts):
+    calls, outcomes = posts
+    outcomes.extend([requests.HTTPError("503")] * 2)
+    with GasRecordBuffer("anken", batch_size=2, max_retries=2) as buffer:
+        for i in range(3):
+            buffer.add({"id": f"A{i}"})
+    assert buffer.posted == 1
+    assert buffer.failed == 2
+    assert buffer.failed_ids == ["A0", "A1"]
+
+    stats = {"processed": 3, "succeeded": 3, "failed": 0}
+    record_post_results(stats, buffer)
+    assert stats["failed"] == 2
+    assert stats["succeeded"] == 1
+    assert stats["posted"] == 1
+    assert stats["post_failed_ids"] == ["A0", "A1"]
+
+
+def test_post_records_to_gas_is_timed(monkeypatch):
+    class Response:
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return {"status": "success"}
+
+    class Session:
+        def post(self, url, json, timeout):
+            return Response()
+
+    monkeypatch.setattr(job_matching_flow, "get_gas_session", lambda: Session())
+    timings = timing.start()
+    assert job_matching_flow.post_records_to_gas("yoin", [{"id": "Y0"}]) == {"status": "success"}
+    assert timings.get("gas_post") is not None
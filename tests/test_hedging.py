@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+from langchain_core.messages import AIMessageChunk
+
+from hedging import hedged_astream
+
+PRIMARY, BACKUP = ("openai", "primary"), ("bedrock", "backup")
+
+
+def make_open_stream(plans):
+    """route → (最初のトークンまでの秒数, チャンクの文字列, 最初のトークンの前に送出する例外)"""
+    cancelled = []
+
+    async def stream(route):
+        delay, pieces, error = plans[route]
+        try:
+            await asyncio.sleep(delay)
+            if error is not None:
+                raise error
+            for piece in pieces:
+                yield AIMessageChunk(content=piece)
+                await asyncio.sleep(0.01)
+        except asyncio.CancelledError:
+            cancelled.append(route)
+            raise
+
+    return stream, cancelled
+
+
+def run(plans, backup=BACKUP, delay=0.05, prompt_tokens=0):
+    open_stream, cancelled = make_open_stream(plans)
+
+    async def collect():
+        events = []
+        async for kind, value in hedged_astream(open_stream, PRIMARY, backup, delay, prompt_tokens=prompt_tokens):
+            events.append((kind, value.content if kind == "chunk" else value))
+        await asyncio.sleep(0)
+        return events
+
+    return asyncio.run(collect()), cancelled
+
+
+def test_fast_primary_is_not_hedged():
+    events, _ = run({PRIMARY: (0, ["ab", "cd"], None)}, delay=0.5)
+    assert events[0] == ("winner", {"route": PRIMARY, "hedged": False, "wasted_tokens": 0,
+                                    "wasted_prompt_tokens": 0, "wasted_completion_tokens": 0})
+    assert [value for kind, value in events if kind == "chunk"] == ["ab", "cd"]
+
+
+def test_slow_primary_is_hedged_and_cancelled():
+    events, cancelled = run({PRIMARY: (1.0, ["late"], None), BACKUP: (0, ["ok"], None)}, prompt_tokens=1200)
+    assert events[0] == ("hedge", "timeout")
+    kind, winner = events[1]
+    assert kind == "winner" and winner["route"] == BACKUP and winner["hedged"]
+    # 取り消した方にも入力は送っているので、その分を無駄として数える
+    assert winner["wasted_prompt_tokens"] == 1200
+    assert winner["wasted_completion_tokens"] == 0
+    assert winner["wasted_tokens"] == 1200
+    assert [value for kind, value in events if kind == "chunk"] == ["ok"]
+    assert PRIMARY in cancelled
+
+
+def test_primary_wins_after_hedge():
+    events, cancelled = run({PRIMARY: (0.1, ["p"], None), BACKUP: (1.0, ["b"], None)}, prompt_tokens=500)
+    winner = next(value for kind, value in events if kind == "winner")
+    assert winner["route"] == PRIMARY and winner["hedged"]
+    assert winner["wasted_prompt_tokens"] == 500
+    assert BACKUP in cancelled
+
+
+def test_primary_error_hedges_immediately():
+    events, _ = run({PRIMARY: (0, [], RuntimeError("boom")), BACKUP: (0, ["ok"], None)}, delay=5, prompt_tokens=100)
+    assert events[0] == ("hedge", "error")
+    winner = events[1][1]
+    assert winner["route"] == BACKUP
+    # 失敗した呼び出しは取り消しではないので数えない
+    assert winner["wasted_tokens"] == 0
+
+
+def test_both_failing_raises_last_error():
+    with pytest.raises(ValueError):
+        run({PRIMARY: (0, [], RuntimeError("boom")), BACKUP: (0, [], ValueError("also down"))})
+
+
+def test_without_backup_errors_propagate():
+    with pytest.raises(RuntimeError):
+        run({PRIMARY: (0, [], RuntimeError("boom"))}, backup=None)
@@ -0,0 +1,96 @@
+import json
+from datetime import datetime
+
+from index_checkpoint import JST, IndexCheckpoint, parse_received_at
+
+
+def at(hour, minute=0):
+    return datetime(2026, 1, 9, hour, minute, tzinfo=JST)
+
+
+def test_parse_received_at():
+    assert parse_received_at("2026-01-09T01:30:00.000Z") == at(10, 30)
+    assert parse_received_at("2026/01/09 10:30") == at(10, 30)
+    assert parse_received_at("not a date") is None
+    assert parse_received_at("") is None
+
+
+def test_full_run_advances_high_water(tmp_path):
+    path = str(tmp_path / "checkpoint.json")
+    checkpoint = IndexCheckpoint(path)
+    checkpoint.mark_done([("Y1", at(9)), ("Y2", at(10)), ("Y3", at(10))])
+    checkpoint.advance()
+
+    reloaded = IndexCheckpoint(path)
+    assert reloaded.high_water == at(10)
+    assert reloaded.ids_at_high_water == {"Y2", "Y3"}
+    assert not reloaded.resuming
+    assert not reloaded.is_pending("Y1", at(9))
+    assert not reloaded.is_pending("Y2", at(10))
+    assert reloaded.is_pending("Y4", at(10))
+    assert reloaded.start_date() == "20260109"
+
+
+def test_crashed_run_resumes_from_journal(tmp_path):
+    path = str(tmp_path / "checkpoint.json")
+    IndexCheckpoint(path).mark_done([("Y1", at(9)), ("Y2", at(10))])
+    with open(f"{path}.run", "a", encoding="utf-8") as f:
+        f.write('{"id": "Y3", "rec')  # 書き込み途中で落ちた行
+
+    resumed = IndexCheckpoint(path)
+    assert resumed.resuming
+    assert not resumed.is_pending("Y2", at(10))
+    assert resumed.is_pending("Y3", at(11))
+
+
+def test_mark_done_does_not_rewrite_the_checkpoint(tmp_path):
+    path = tmp_path / "checkpoint.json"
+    checkpoint = IndexCheckpoint(str(path))
+    checkpoint.mark_done([("Y1", at(9))])
+    checkpoint.mark_done([("Y2", at(10))])
+    assert not path.exists()
+    assert len((tmp_path / "checkpoint.json.run").read_text(encoding="utf-8").splitlines()) == 2
+    checkpoint.advance()
+    assert path.exists()
+    assert not (tmp_path / "checkpoint.json.run").exists()
+
+
+def test_poison_ids_do_not_hold_back_high_water(tmp_path):
+    path = str(tmp_path / "checkpoint.json")
+    checkpoint = IndexCheckpoint(path)
+    checkpoint.mark_done([("Y1", at(9)), ("Y3", at(11))])
+    checkpoint.mark_poison("Y2", "build failed: boom")
+    checkpoint.advance()
+
+    reloaded = IndexCheckpoint(path)
+    assert reloaded.high_water == at(11)
+    assert reloaded.poison == {"Y2": "build failed: boom"}
+    assert not reloaded.resuming
+
+
+def test_poison_id_is_cleared_once_indexed(tmp_path):
+    checkpoint = IndexCheckpoint(str(tmp_path / "checkpoint.json"))
+    checkpoint.mark_poison("Y2", "build failed: boom")
+    checkpoint.mark_done([("Y2", at(12))])
+    assert checkpoint.poison == {}
+
+
+def test_failed_batch_caps_high_water_below_oldest_failure(tmp_path):
+    path = str(tmp_path / "checkpoint.json")
+    checkpoint = IndexCheckpoint(path)
+    checkpoint.mark_done([("Y1", at(9)), ("Y2", at(10)), ("Y4", at(12)), ("Y5", at(13))])
+    checkpoint.advance(retry_from=at(11))
+
+    reloaded = IndexCheckpoint(path)
+    assert reloaded.high_water == at(10)
+    assert reloaded.ids_at_high_water == {"Y2"}
+    # 失敗より新しい登録済みIDだけを残す
+    assert set(reloaded.run_done) == {"Y4", "Y5"}
+    assert reloaded.is_pending("Y3", at(11))
+    assert not reloaded.is_pending("Y4", at(12))
+
+    # 次回に失敗分が成功すれば、残していたIDも含めて進める
+    reloaded.mark_done([("Y3", at(11))])
+    reloaded.advance()
+    assert reloaded.high_water == at(13)
+    assert reloaded.run_done == {}
@@ -0,0 +1,62 @@
+import pytest
+
+import job_matching_flow
+from job_matching_flow import iter_gas_records
+
+
+@pytest.fixture
+def gas(monkeypatch):
+    """get_data_from_gas の代わりに、シートの rows を offset / limit で返す（max_records 件を超えるページは打ち切る）"""
+    state = {"rows": [], "max_records": None, "calls": []}
+
+    def get_data_from_gas(type_, params):
+        offset, limit = int(params["offset"]), int(params["limit"])
+        state["calls"].append((offset, limit))
+        rows = state["rows"]
+        page = rows[offset:offset + limit]
+        truncated = state["max_records"] is not None and len(page) > state["max_records"]
+        if truncated:
+            page = page[:state["max_records"]]
+        return {"records": page, "next_offset": offset + len(page), "truncated": truncated,
+                "count_matched": len(rows)}
+
+    monkeypatch.setattr(job_matching_flow, "get_data_from_gas", get_data_from_gas)
+    monkeypatch.setattr(job_matching_flow, "GAS_PAGE_SIZE", 4)
+    return state
+
+
+def rows(count):
+    return [{"ID": f"Y{i}"} for i in range(count)]
+
+
+def test_reads_all_pages(gas):
+    gas["rows"] = rows(10)
+    stats = {}
+    assert [r["ID"] for r in iter_gas_records("yoin", {}, stats)] == [f"Y{i}" for i in range(10)]
+    assert gas["calls"] == [(0, 4), (4, 4), (8, 4)]
+    assert stats == {"pages": 3, "records": 10, "truncated_pages": 0, "total": 10}
+
+
+def test_truncated_pages_continue_from_next_offset(gas):
+    gas["rows"] = rows(7)
+    gas["max_records"] = 3
+    stats = {}
+    assert [r["ID"] for r in iter_gas_records("yoin", {}, stats)] == [f"Y{i}" for i in range(7)]
+    assert gas["calls"] == [(0, 4), (3, 4), (6, 4)]
+    assert stats["truncated_pages"] == 2
+
+
+def test_limit_spanning_pages(gas):
+    gas["rows"] = rows(20)
+    stats = {}
+    assert [r["ID"] for r in iter_gas_records("yoin", {"limit": 6, "offset": 2}, stats)] == [f"Y{i}" for i in range(2, 8)]
+    assert gas["calls"] == [(2, 4), (6, 2)]
+    assert stats["total"] == 6
+
+
+def test_skips_duplicate_ids_at_page_boundaries(gas):
+    # 取得中にシートの先頭へ行が追加され、2ページ目が1ページ目の最後の行から始まる
+    gas["rows"] = rows(4) + [{"ID": "Y3"}, {"ID": "Y4"}, {"ID": ""}, {"ID": ""}]
+    stats = {}
+    assert [r["ID"] for r in iter_gas_records("yoin", {}, stats)] == ["Y0", "Y1", "Y2", "Y3", "Y4", "", ""]
+    assert stats["records"] == 8
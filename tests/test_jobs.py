@@ -0,0 +1,138 @@
+import pytest
+
+import jobs
+from jobs import CANCELLED, FAILED, QUEUED, SUCCEEDED, JobCancelled, JobManager, JobStore
+
+
+class InThreadExecutor:
+    """submit されたジョブを run() を呼ぶまで溜めておき、呼び出し元のスレッドで順に実行する"""
+
+    def __init__(self):
+        self.pending = []
+
+    def submit(self, fn, *args):
+        self.pending.append((fn, args))
+
+    def run(self):
+        while self.pending:
+            fn, args = self.pending.pop(0)
+            fn(*args)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / "jobs.sqlite3"))
+
+
+def test_submit_runs_flow_and_records_progress(store):
+    def flow(params):
+        jobs.start_phase("format_yoin")
+        jobs.report_total(3)
+        jobs.report_progress(3, failed=1)
+        return {"processed": 3, "limit": params["limit"]}
+
+    executor = InThreadExecutor()
+    manager = JobManager(store, {"format_yoin": flow}, executor)
+    job = manager.submit("format_yoin", {"limit": 3})
+    assert manager.get(job.id).status == QUEUED
+    executor.run()
+
+    saved = store.load(job.id).to_dict()
+    assert saved["status"] == SUCCEEDED
+    assert saved["result"] == {"processed": 3, "limit": 3}
+    assert (saved["phase"], saved["processed"], saved["failed"], saved["total"]) == ("format_yoin", 3, 1, 3)
+    assert job.id not in manager.jobs
+    # ジョブの外では進捗の報告は何もしない
+    assert jobs.current() is None
+    jobs.report_progress(1)
+
+
+def test_unknown_action_and_failure(store):
+    def flow(params):
+        raise RuntimeError("GAS unavailable")
+
+    executor = InThreadExecutor()
+    manager = JobManager(store, {"index_yoin": flow}, executor)
+    with pytest.raises(ValueError):
+        manager.submit("format_anken", {})
+    job = manager.submit("index_yoin", {})
+    executor.run()
+    assert store.load(job.id).status == FAILED
+    assert store.load(job.id).error == "GAS unavailable"
+
+
+def test_cancel_while_queued_never_runs(store):
+    calls = []
+    executor = InThreadExecutor()
+    manager = JobManager(store, {"format_yoin": calls.append}, executor)
+    job = manager.submit("format_yoin", {})
+    assert manager.cancel(job.id).status == CANCELLED
+    executor.run()
+    assert calls == []
+    assert store.load(job.id).status == CANCELLED
+
+
+def test_cancel_while_running_stops_at_next_progress(store):
+    executor = InThreadExecutor()
+    processed = []
+
+    def flow(params):
+        jobs.start_phase("format_yoin")
+        for i in range(1, 4):
+            jobs.report_progress(i)
+            processed.append(i)
+            if i == 1:
+                manager.cancel(jobs.current().id)
+
+    manager = JobManager(store, {"format_yoin": flow}, executor)
+    job = manager.submit("format_yoin", {})
+    executor.run()
+    assert processed == [1]
+    saved = store.load(job.id)
+    assert saved.status == CANCELLED
+    assert saved.cancel_requested
+
+
+def test_report_progress_raises_when_cancel_requested(store):
+    executor = InThreadExecutor()
+    raised = []
+
+    def flow(params):
+        jobs.current().cancel_requested = True
+        try:
+            jobs.report_progress(1)
+        except JobCancelled as e:
+            raised.append(e)
+            raise
+
+    manager = JobManager(store, {"format_yoin": flow}, executor)
+    job = manager.submit("format_yoin", {})
+    executor.run()
+    assert [str(e) for e in raised] == [job.id]
+
+
+def test_resume_requeues_unfinished_jobs_from_sqlite(store, tmp_path):
+    # 前回の起動：待機中・実行中・取り消し要求済みのまま終了した
+    previous = JobManager(store, {"format_yoin": lambda params: None}, InThreadExecutor())
+    queued = previous.submit("format_yoin", {"limit": 1})
+    running = previous.submit("format_yoin", {"limit": 2})
+    running.status, running.processed = jobs.RUNNING, 5
+    running.save()
+    cancelling = previous.submit("format_yoin", {"limit": 3})
+    cancelling.cancel_requested = True
+    cancelling.status = jobs.RUNNING
+    cancelling.save()
+    finished = previous.submit("format_yoin", {"limit": 4})
+    finished.status = SUCCEEDED
+    finished.save()
+
+    seen = []
+    executor = InThreadExecutor()
+    manager = JobManager(JobStore(str(tmp_path / "jobs.sqlite3")), {"format_yoin": seen.append}, executor)
+    resumed = manager.resume()
+    assert [job.id for job in resumed] == [queued.id, running.id]
+    assert all(job.resumed == 1 and job.processed == 0 for job in resumed)
+    assert manager.store.load(cancelling.id).status == CANCELLED
+    executor.run()
+    assert seen == [{"limit": 1}, {"limit": 2}]
+    assert manager.store.load(running.id).status == SUCCEEDED
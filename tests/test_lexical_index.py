@@ -0,0 +1,47 @@
+from lexical_index import LexicalIndex, reciprocal_rank_fusion, tokenize
+
+
+def doc(doc_id, skill, work_style="フルリモート"):
+    return {"id": doc_id, "lexical_text": skill, "text": f"【スキル】 {skill}",
+            "metadata": {"work_style": work_style}}
+
+
+def test_tokenize_keeps_tech_terms_and_splits_japanese():
+    assert tokenize("C# / Node.js 設計経験") == ["c#", "node.js", "設計", "計経", "経験"]
+
+
+def test_reciprocal_rank_fusion():
+    fused = dict(reciprocal_rank_fusion([["a", "b"], ["b", "c"]], k=60))
+    assert fused["b"] > fused["a"] > fused["c"]
+    assert fused["b"] == 1 / 62 + 1 / 61
+
+
+def test_search_ranks_and_filters(tmp_path):
+    index = LexicalIndex(str(tmp_path / "yoin.pkl"))
+    index.upsert([doc("Y1", "Java Spring"), doc("Y2", "Python Django", "常駐"), doc("Y3", "Python AWS")])
+    assert [doc_id for doc_id, _ in index.search("python")] in (["Y2", "Y3"], ["Y3", "Y2"])
+    assert [doc_id for doc_id, _ in index.search("python", filter={"work_style": {"$eq": "フルリモート"}})] == ["Y3"]
+
+
+def test_deferred_save_writes_once(tmp_path):
+    path = tmp_path / "yoin.pkl"
+    index = LexicalIndex(str(path))
+    index.upsert([doc("Y1", "Java")], save=False)
+    index.upsert([doc("Y2", "Python")], save=False)
+    assert not path.exists()
+    assert [doc_id for doc_id, _ in index.search("python")] == ["Y2"]
+    index.save()
+    assert len(LexicalIndex(str(path))) == 2
+
+
+def test_unsaved_changes_survive_reload_check(tmp_path):
+    path = str(tmp_path / "yoin.pkl")
+    index = LexicalIndex(path)
+    other = LexicalIndex(path)
+    other.upsert([doc("Y9", "Go")])
+    index.upsert([doc("Y1", "Java")], save=False)
+    # 保存前の更新があるうちは、別プロセスの書き込みで読み直さない
+    other.upsert([doc("Y8", "Rust")])
+    assert index.get("Y1") is not None
+    index.save()
+    assert LexicalIndex(path).get("Y1") is not None
@@ -0,0 +1,155 @@
+import pytest
+
+import llm_router
+from llm_router import CLOSED, HALF_OPEN, OPEN, LLMRouter
+
+A, B, C, D = ("openai", "a"), ("openai", "b"), ("bedrock", "c"), ("ai_studio", "d")
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(llm_router.time, "monotonic", clock)
+    return clock
+
+
+def make_router(routes=(A, B, C, D), **kwargs):
+    kwargs.setdefault("failure_threshold", 3)
+    kwargs.setdefault("cooldown_sec", 30)
+    return LLMRouter(list(routes), {route: 3 for route in routes}, **kwargs)
+
+
+def measure(router, latencies):
+    for route, latency_ms in latencies.items():
+        router.record_success(route, latency_ms, ttft_ms=latency_ms / 2)
+
+
+def test_unmeasured_routes_keep_configured_order(clock):
+    assert make_router().ranked() == [A, B, C, D]
+
+
+def test_measured_routes_are_ranked_by_speed(clock):
+    router = make_router()
+    measure(router, {A: 900, B: 300, C: 600, D: 100})
+    assert router.ranked() == [D, B, C, A]
+
+
+def test_streaming_ranks_by_ttft(clock):
+    router = make_router(routes=(A, B))
+    router.record_success(A, 1000, ttft_ms=100)
+    router.record_success(B, 500, ttft_ms=400)
+    assert router.ranked(streaming=True) == [A, B]
+    assert router.ranked(streaming=False) == [B, A]
+
+
+def test_min_quality_filters_routes(clock):
+    router = LLMRouter([A, B], {A: 1, B: 3})
+    assert router.ranked(min_quality=2) == [B]
+
+
+def test_high_error_rate_goes_behind_healthy_routes(clock):
+    router = make_router(routes=(A, B), failure_threshold=10)
+    measure(router, {A: 100, B: 500})
+    for _ in range(3):
+        router.record_failure(A, "boom")
+    assert router.ranked() == [B, A]
+
+
+def test_circuit_opens_after_consecutive_failures(clock):
+    router = make_router()
+    measure(router, {A: 100, B: 200, C: 300, D: 400})
+    for _ in range(3):
+        router.record_failure(A, "boom")
+    assert router.describe(A)["circuit"] == OPEN
+    assert A not in router.ranked()
+
+
+def test_success_resets_consecutive_failures(clock):
+    router = make_router(routes=(A,))
+    router.record_failure(A)
+    router.record_failure(A)
+    router.record_success(A, 100)
+    router.record_failure(A)
+    assert router.describe(A)["circuit"] == CLOSED
+
+
+def test_half_open_route_is_probed_first_once(clock):
+    router = make_router()
+    measure(router, {A: 100, B: 200, C: 300, D: 400})
+    for _ in range(3):
+        router.record_failure(A, "boom")
+    clock.now += 31
+    assert router.describe(A)["circuit"] == HALF_OPEN
+    # 最速のモデルが復帰できるよう、LLM_ROUTING_MAX_ATTEMPTS（3）で切られる位置より前に置く
+    assert router.ranked()[:3][0] == A
+    # 試行の結果が出るまで、ほかのリクエストには出さない
+    assert A not in router.ranked()
+
+
+def test_successful_probe_closes_the_circuit(clock):
+    router = make_router()
+    measure(router, {A: 100, B: 200, C: 300, D: 400})
+    for _ in range(3):
+        router.record_failure(A, "boom")
+    clock.now += 31
+    router.ranked()
+    router.record_success(A, 100)
+    assert router.describe(A)["circuit"] == CLOSED
+    assert router.ranked()[0] == A
+    assert router.ranked()[0] == A
+
+
+def test_failed_probe_reopens_the_circuit(clock):
+    router = make_router(routes=(A, B))
+    measure(router, {A: 100, B: 200})
+    for _ in range(3):
+        router.record_failure(A, "boom")
+    clock.now += 31
+    router.ranked()
+    router.record_failure(A, "still down")
+    assert router.describe(A)["circuit"] == OPEN
+    assert A not in router.ranked()
+    clock.now += 31
+    assert router.ranked()[0] == A
+
+
+def test_unanswered_probe_is_retried_after_cooldown(clock):
+    router = make_router(routes=(A, B))
+    measure(router, {A: 100, B: 200})
+    for _ in range(3):
+        router.record_failure(A, "boom")
+    clock.now += 31
+    assert router.ranked()[0] == A
+    clock.now += 10
+    assert router.ranked() == [B]
+    clock.now += 30
+    assert router.ranked()[0] == A
+
+
+def test_stale_routes_are_probed_first(clock):
+    router = make_router(routes=(A, B), probe_interval_sec=600)
+    measure(router, {A: 100})
+    clock.now += 1
+    measure(router, {B: 500})
+    clock.now += 599.5
+    assert router.ranked() == [A, B]
+    clock.now += 1
+    measure(router, {B: 500})
+    assert router.ranked() == [A, B]
+
+
+def test_ttft_quantile_needs_min_samples(clock):
+    router = make_router(routes=(A,))
+    for ms in range(1, 11):
+        router.record_success(A, 1000, ttft_ms=ms * 100)
+    assert router.ttft_quantile(A, 0.9, min_samples=20) is None
+    assert router.ttft_quantile(A, 0.9, min_samples=10) == 1000
+    assert router.ttft_quantile(A, 0.5, min_samples=10) == 600
@@ -0,0 +1,123 @@
+import random
+
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from local_vectorstore import LocalVectorStore
+from metadata_filter import matches_filter
+
+WORK_STYLES = ["フルリモート", "リモート併用", "常駐"]
+REGIONS = ["関東", "関西", "東海"]
+
+FILTERS = [
+    {"work_style": "常駐"},
+    {"work_style": {"$in": ["フルリモート", "リモート併用"]}},
+    {"price_min": {"$lte": 60}},
+    {"recieved_at": {"$gte": 20260105}},
+    {"region": {"$exists": False}},
+    {"region": {"$ne": "関西"}},
+    {"$or": [{"region": {"$nin": ["関西"]}}, {"region": {"$exists": False}}]},
+    {"$and": [
+        {"$or": [{"work_style": {"$in": ["フルリモート"]}}, {"work_style": {"$exists": False}}]},
+        {"$or": [{"price_min": {"$lte": 70}}, {"price_min": {"$exists": False}}]},
+        {"recieved_at": {"$gte": 20260103}},
+    ]},
+    {"tags": {"$eq": ["java"]}},
+    {"unknown": {"$exists": False}},
+]
+
+
+def make_metadata(rng, i):
+    metadata = {"recieved_at": 20260101 + rng.randint(0, 8)}
+    # 型付きメタデータのない古いベクトルも混ぜる
+    if rng.random() < 0.8:
+        metadata["work_style"] = rng.choice(WORK_STYLES)
+        metadata["price_min"] = rng.choice([40, 50, 60, 70, 80])
+    if rng.random() < 0.6:
+        metadata["region"] = rng.choice(REGIONS)
+    if rng.random() < 0.2:
+        metadata["tags"] = ["java"] if rng.random() < 0.5 else ["go"]
+    return metadata
+
+
+@pytest.fixture
+def store(tmp_path):
+    rng = random.Random(0)
+    store = LocalVectorStore(str(tmp_path / "vectors"), DeterministicFakeEmbedding(size=16))
+    metadatas = [make_metadata(rng, i) for i in range(200)]
+    store.add_texts([f"要員{i}" for i in range(200)], metadatas=metadatas, ids=[f"Y{i}" for i in range(200)])
+    return store, dict(zip([f"Y{i}" for i in range(200)], metadatas))
+
+
+@pytest.mark.parametrize("filter", FILTERS)
+def test_filtered_search_matches_metadata_filter(store, filter):
+    store, metadatas = store
+    expected = {doc_id for doc_id, metadata in metadatas.items() if matches_filter(metadata, filter)}
+    found = store.similarity_search_by_vector_with_score([0.1] * 16, k=1000, filter=filter)
+    assert {doc.id for doc, _ in found} == expected
+
+
+def test_filter_sees_writes_and_deletes(store):
+    store, _ = store
+    filter = {"work_style": "出張"}
+    assert store.similarity_search("x", k=10, filter=filter) == []
+    store.add_texts(["新規"], metadatas=[{"work_style": "出張"}], ids=["Y1"])
+    assert [doc.id for doc in store.similarity_search("x", k=10, filter=filter)] == ["Y1"]
+    store.delete(["Y1"])
+    assert store.similarity_search("x", k=10, filter=filter) == []
+
+
+def test_search_returns_cosine_order(tmp_path):
+    embedding = DeterministicFakeEmbedding(size=16)
+    store = LocalVectorStore(str(tmp_path / "vectors"), embedding)
+    store.add_texts(["a", "b", "c"], ids=["A", "B", "C"])
+    results = store.similarity_search_by_vector_with_score(embedding.embed_query("b"), k=2)
+    assert results[0][0].id == "B"
+    assert results[0][1] == pytest.approx(1.0, abs=1e-5)
+    assert results[0][1] >= results[1][1]
+
+
+
+def test_batches_append_to_log_instead_of_rewriting_columns(tmp_path, monkeypatch):
+    import local_vectorstore
+
+    snapshots = []
+    replace = local_vectorstore.os.replace
+    monkeypatch.setattr(local_vectorstore.os, "replace", lambda src, dst: (snapshots.append(dst), replace(src, dst)))
+    directory = str(tmp_path / "vectors")
+    store = LocalVectorStore(directory, DeterministicFakeEmbedding(size=16))
+    reader = LocalVectorStore(directory, DeterministicFakeEmbedding(size=16))
+    for batch in range(64):
+        ids = [f"Y{batch}-{i}" for i in range(10)]
+        store.add_texts(ids, metadatas=[{"batch": batch} for _ in ids], ids=ids)
+    # columns.pkl はログが columns.pkl より大きくなった時だけ書き直す（バッチ数に比例しない）
+    assert len(snapshots) <= 16
+    # 別インスタンスは columns.pkl とログを重ねて読み直す
+    found = reader.similarity_search("x", k=20, filter={"batch": 63})
+    assert {doc.id for doc in found} == {f"Y63-{i}" for i in range(10)}
+    assert len(LocalVectorStore(directory, DeterministicFakeEmbedding(size=16))) == 640
+
+
+def test_log_replay_keeps_rows_and_deletes(tmp_path):
+    embedding = DeterministicFakeEmbedding(size=16)
+    directory = str(tmp_path / "vectors")
+    store = LocalVectorStore(directory, embedding)
+    store.add_texts(["a", "b", "c"], ids=["A", "B", "C"])
+    store.add_texts(["b2", "d"], metadatas=[{"v": 2}, {"v": 1}], ids=["B", "D"])
+    store.delete(["A"])
+    store.add_texts(["e"], ids=["E"])
+    reopened = LocalVectorStore(directory, embedding)
+    assert {doc.id: doc.page_content for doc in reopened.get_by_ids(["A", "B", "C", "D", "E"])} == {
+        "B": "b2", "C": "c", "D": "d", "E": "e"}
+    for text, doc_id in [("b2", "B"), ("d", "D"), ("e", "E")]:
+        assert reopened.similarity_search_by_vector_with_score(embedding.embed_query(text), k=1)[0][0].id == doc_id
+
+
+def test_ignores_truncated_log_tail(tmp_path):
+    directory = tmp_path / "vectors"
+    store = LocalVectorStore(str(directory), DeterministicFakeEmbedding(size=16))
+    store.add_texts(["a", "b"], ids=["A", "B"])
+    store.add_texts(["c"], ids=["C"])
+    with open(directory / "columns.log", "ab") as f:
+        f.write(b"\x80\x05\x95")
+    assert {doc.id for doc in LocalVectorStore(str(directory), DeterministicFakeEmbedding(size=16)).get_by_ids(["A", "B", "C"])} == {"A", "B", "C"}
@@ -0,0 +1,107 @@
+import asyncio
+import re
+
+import pytest
+from langchain_core.documents import Document
+
+import job_matching_flow
+from job_matching_flow import amatching_yoin_parallel, as_score, matching_yoin_parallel_stream, merge_group_scores
+
+
+def make_docs(*ids):
+    return [(Document(id=doc_id, page_content=f"【要員ID】 {doc_id}\n【氏名】 {doc_id}さん\n【最寄駅】 柏"), 0.9 - i / 100)
+            for i, doc_id in enumerate(ids)]
+
+
+def test_as_score_accepts_strings():
+    assert as_score(85) == 85
+    assert as_score("85点") == 85
+    assert as_score("マッチ度 72.5") == 72.5
+    assert as_score("不明") == 0
+    assert as_score(None) == 0
+
+
+def test_merge_breaks_ties_by_retrieval_order():
+    docs = make_docs("Y1", "Y2", "Y3")
+    scores = [{"要員ID": "Y3", "マッチ度": 80}, {"要員ID": "Y2", "マッチ度": "80点"}, {"要員ID": "Y1", "マッチ度": 70}]
+    result = merge_group_scores(docs, scores, top_n=5)
+    assert [c["要員ID"] for c in result["candidates"]] == ["Y2", "Y3", "Y1"]
+    assert result["candidates"][0]["マッチ度"] == 80
+    assert result["candidates"][0]["要員情報"]["都道府県"] == "千葉県"
+
+
+def test_merge_ignores_duplicate_and_unknown_ids():
+    docs = make_docs("Y1", "Y2")
+    scores = [
+        {"要員ID": " Y1 ", "マッチ度": 60, "推奨アクション": "面談を打診"},
+        {"要員ID": "Y1", "マッチ度": 99},
+        {"要員ID": "Y9", "マッチ度": 100},
+        {"マッチ度": 100},
+        {"要員ID": "Y2", "マッチ度": 50},
+    ]
+    result = merge_group_scores(docs, scores, top_n=1)
+    assert [c["要員ID"] for c in result["candidates"]] == ["Y1"]
+    assert result["candidates"][0]["マッチ度"] == 60
+    assert result["推奨アクション"] == ["Y1さんは面談を打診"]
+    assert result["比較チャート"] == [{"Y1さん": {"スキルのマッチ度": "", "勤務形態のマッチ度": "", "単価のマッチ度": ""}}]
+
+
+@pytest.fixture
+def scoring(monkeypatch):
+    """グループの採点を、要員IDに "x" を含むグループだけ失敗するフェイクに置き換える"""
+    calls = []
+
+    class Chain:
+        async def ainvoke(self, inputs):
+            ids = re.findall(r"■ 要員ID: (\S+)", inputs["matches_text"])
+            calls.append(ids)
+            if any("x" in doc_id for doc_id in ids):
+                raise RuntimeError("LLM timeout")
+            return {"scores": [{"要員ID": doc_id, "マッチ度": 90 - i} for i, doc_id in enumerate(ids)]}
+
+    class Scheduler:
+        async def acall(self, provider, fn, **kwargs):
+            return await fn()
+
+    monkeypatch.setattr(job_matching_flow, "MATCH_GROUP_SIZE", 2)
+    monkeypatch.setattr(job_matching_flow, "fit_matching_context",
+                        lambda anken_data, docs, notes, route: (docs, "", {"prompt_tokens": 0, "dropped": 0}))
+    monkeypatch.setattr(job_matching_flow, "get_token_counter", lambda *route: len)
+    monkeypatch.setattr(job_matching_flow, "observe_prompt", lambda report, mode: None)
+    monkeypatch.setattr(job_matching_flow, "group_scoring_chain", lambda provider, model: Chain())
+    monkeypatch.setattr(job_matching_flow, "get_scheduler", lambda: Scheduler())
+    return calls
+
+
+def run_stream(docs):
+    async def collect():
+        return [event async for event in matching_yoin_parallel_stream({}, docs, routes=[("openai", "a"), ("openai", "b")])]
+    return asyncio.run(collect())
+
+
+def test_partial_failure_lists_failed_groups_next_to_candidates(scoring):
+    events = run_stream(make_docs("Y1", "Y2", "x3", "Y4"))
+    assert [event["type"] for event in events if event["type"] == "group_result"] == ["group_result"] * 2
+    final = events[-1]
+    assert final["type"] == "final_result"
+    result = final["result"]
+    assert list(result)[:2] == ["candidates", "failed_groups"]
+    assert [c["要員ID"] for c in result["candidates"]] == ["Y1", "Y2"]
+    assert result["failed_groups"] == [{"group": 2, "yoin_ids": ["x3", "Y4"], "error": "LLM timeout"}]
+    # 失敗したグループは次のモデルでも採点し直す
+    assert scoring.count(["x3", "Y4"]) == 2
+
+
+def test_all_groups_failed_is_an_error(scoring):
+    events = run_stream(make_docs("x1", "x2", "x3"))
+    assert events[-1]["type"] == "error"
+    assert "LLM timeout" in events[-1]["message"]
+    with pytest.raises(RuntimeError):
+        asyncio.run(amatching_yoin_parallel({}, make_docs("x1"), routes=[("openai", "a")]))
+
+
+def test_no_failures_has_empty_failed_groups(scoring):
+    result = asyncio.run(amatching_yoin_parallel({}, make_docs("Y1", "Y2", "Y3"), routes=[("openai", "a")]))
+    assert result["failed_groups"] == []
+    assert [c["要員ID"] for c in result["candidates"]] == ["Y1", "Y3", "Y2"]
+    assert [group["group"] for group in result["timings"]["groups"]] == [1, 2]
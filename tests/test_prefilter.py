@@ -0,0 +1,115 @@
+import pytest
+
+from metadata_filter import matches_filter
+from prefilter import (
+    FULL_REMOTE, HYBRID, METADATA_VERSION, ONSITE, REMOTE,
+    anken_conditions, build_metadata_filter, infer_prefecture, judge_candidate,
+    normalize_work_style, parse_price, region_of, yoin_conditions, yoin_metadata,
+)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("60万", (60, 60)),
+    ("60万円", (60, 60)),
+    ("650,000円", (65, 65)),
+    ("55〜65万円", (55, 65)),
+    ("55万~65万", (55, 65)),
+    ("〜80万", (None, 80)),
+    ("80万以下", (None, 80)),
+    ("60万〜", (60, None)),
+    ("60万以上", (60, None)),
+    ("スキル見合い", None),
+    ("", None),
+])
+def test_parse_price(text, expected):
+    assert parse_price(text) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("常駐", ONSITE),
+    ("客先常駐", ONSITE),
+    ("週3出社", HYBRID),
+    ("在宅のみ", FULL_REMOTE),
+    ("リモート（現場次第）", REMOTE),
+    # 出社・常駐の否定は出社ありと読まない
+    ("リモート（出社なし）", FULL_REMOTE),
+    ("出社不要", REMOTE),
+    ("常駐なし", REMOTE),
+    # 常駐・出社と並んだ「リモート可」は併用
+    ("常駐（リモート可）", HYBRID),
+    ("リモート可（初日のみ出社）", HYBRID),
+    ("", None),
+])
+def test_normalize_work_style(text, expected):
+    assert normalize_work_style(text) == expected
+
+
+@pytest.mark.parametrize("text, prefecture", [
+    ("柏駅", "千葉県"),
+    ("栄", "愛知県"),
+    ("津", "三重県"),
+    ("蕨駅徒歩5分", "埼玉県"),
+    ("木更津", "千葉県"),
+    # 1文字の駅名は語の途中に現れたものを採らない
+    ("柏木", None),
+    ("栄町", None),
+])
+def test_infer_prefecture_one_character_stations(text, prefecture):
+    assert infer_prefecture(text) == prefecture
+
+
+def anken(work_style="常駐", place="東京都 港区", price="60万"):
+    return anken_conditions({"勤務形態": work_style, "作業場所": place, "単価": price})
+
+
+def yoin(work_style="常駐", station="新宿", price="60万", remarks=""):
+    return yoin_conditions({"勤務形態（希望）": work_style, "最寄駅": station, "単価（希望）": price, "備考": remarks})
+
+
+def test_judge_candidate_keeps_matching_yoin():
+    assert judge_candidate(anken(), yoin(), 0.15) == (None, [])
+
+
+def test_judge_candidate_work_style():
+    assert judge_candidate(anken(), yoin("フルリモート"), 0.15)[0] == "work_style"
+    # 「出社なし」のリモート案件はフルリモート希望の要員を落とさない
+    assert judge_candidate(anken("リモート（出社なし）"), yoin("フルリモート"), 0.15) == (None, [])
+    rule, notes = judge_candidate(anken("常駐（リモート可）"), yoin("リモート希望"), 0.15)
+    assert rule is None
+    assert notes == ["リモート希望だが案件は出社あり"]
+
+
+def test_judge_candidate_region_and_relocatable_override():
+    assert judge_candidate(anken(), yoin(station="梅田"), 0.15)[0] == "region"
+    rule, notes = judge_candidate(anken(), yoin(station="梅田", remarks="転居可"), 0.15)
+    assert rule is None
+    assert notes == [f"地域が異なる（{region_of('大阪府')}）が移動・転居可の記載あり"]
+    # フルリモート案件は地域を見ない
+    assert judge_candidate(anken("フルリモート"), yoin("フルリモート", station="梅田"), 0.15) == (None, [])
+
+
+def test_judge_candidate_price_tolerance():
+    assert judge_candidate(anken(), yoin(price="75万"), 0.15)[0] == "price"
+    rule, notes = judge_candidate(anken(), yoin(price="65万"), 0.15)
+    assert rule is None
+    assert notes == ["希望単価65万が案件単価60万を上回る（+15%以内）"]
+
+
+def test_metadata_filter_matches_judge_candidate():
+    condition = build_metadata_filter(anken(), 0.15)
+    record = {"勤務形態（希望）": "リモート（出社なし）", "最寄駅": "新宿", "単価（希望）": "60万"}
+    metadata = yoin_metadata(record)
+    assert metadata["metadata_version"] == METADATA_VERSION
+    assert metadata["work_style"] == FULL_REMOTE
+    assert not matches_filter(metadata, condition)
+    assert matches_filter(yoin_metadata(dict(record, **{"勤務形態（希望）": "常駐（リモート可）"})), condition)
+
+
+def test_metadata_filter_passes_stale_work_style():
+    # 古い版で「出社なし」を onsite と誤分類していても、勤務形態では落とさない
+    condition = build_metadata_filter(anken(), 0.15)
+    stale = dict(yoin_metadata({"最寄駅": "新宿", "単価（希望）": "60万"}), work_style=FULL_REMOTE)
+    del stale["metadata_version"]
+    assert matches_filter(stale, condition)
+    assert matches_filter(dict(stale, metadata_version=METADATA_VERSION - 1), condition)
+    assert not matches_filter(dict(stale, metadata_version=METADATA_VERSION), condition)
@@ -0,0 +1,42 @@
+from prompt_budget import TokenCounter, compact_candidate, fit_to_budget
+
+RAG_TEXT = """【要員ID】 Y1
+【氏名】 山田  太郎
+【スキル】 - Java
+・Python、Java, AWS
+Go
+【勤務形態（希望）】  リモート
+【備考】 長期希望。週5稼働可能。面談はオンライン希望です。
+【メールタイトル】 【要員】Java 5年"""
+
+
+def test_compact_candidate_one_line_per_field():
+    assert compact_candidate(RAG_TEXT, max_skills=2, max_chars=10) == "\n".join([
+        "【氏名】 山田 太郎",
+        "【スキル】 Java / Python ほか2件",
+        "【勤務形態（希望）】 リモート",
+        "【備考】 長期希望。週5稼働可…",
+        "【メールタイトル】 【要員】Java 5…",
+    ])
+
+
+def test_compact_candidate_is_deterministic_and_keeps_plain_text():
+    assert compact_candidate(RAG_TEXT, 12, 120) == compact_candidate(RAG_TEXT, 12, 120)
+    assert "Java / Python / AWS / Go" in compact_candidate(RAG_TEXT, 12, 120)
+    assert compact_candidate("項目のない  テキスト\n2行目", 12, 120) == "項目のない テキスト 2行目"
+
+
+def test_fit_to_budget_keeps_search_order_and_skips_what_does_not_fit():
+    assert fit_to_budget([40, 30, 50, 20], budget=100) == ([0, 1, 3], 90)
+
+
+def test_fit_to_budget_keeps_first_candidate_over_budget():
+    assert fit_to_budget([150, 30], budget=100) == ([0], 150)
+    assert fit_to_budget([60, 60, 10], budget=50, min_items=2) == ([0, 1], 120)
+    assert fit_to_budget([], budget=100) == ([], 0)
+
+
+def test_token_counter_estimates_without_tiktoken():
+    counter = TokenCounter("bedrock", "claude")
+    assert counter.name == "estimate"
+    assert counter("abcd" * 10) == 10
@@ -0,0 +1,139 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from ratelimit import BATCH, INTERACTIVE, Scheduler, TokenBucket, is_rate_limited, priority, retry_after
+
+
+class RateLimitError(Exception):
+    def __init__(self, headers=None):
+        super().__init__("429 Too Many Requests")
+        self.status_code = 429
+        self.response = type("Response", (), {"headers": headers or {}, "status_code": 429})()
+
+
+def stats_for(scheduler, provider, name):
+    return next(row for row in scheduler.stats() if row["provider"] == provider and row["priority"] == name)
+
+
+def test_is_rate_limited():
+    assert is_rate_limited(RateLimitError())
+    assert is_rate_limited(type("ThrottlingException", (Exception,), {})())
+    assert not is_rate_limited(ValueError("bad request"))
+
+
+def test_retry_after_headers():
+    assert retry_after(RateLimitError({"retry-after-ms": "1500"})) == 1.5
+    assert retry_after(RateLimitError({"retry-after": "2"})) == 2.0
+    assert retry_after(RateLimitError({"retry-after": "Thu, 01 Jan 1970 00:00:00 GMT"})) == 0.0
+    assert retry_after(RateLimitError()) is None
+
+
+def test_token_bucket_wait_time():
+    bucket = TokenBucket(per_minute=60)
+    assert bucket.capacity == 10
+    assert bucket.wait_time(5) == 0
+    bucket.level = 2
+    assert bucket.wait_time(5) == pytest.approx(3)
+    # 容量を超える量は容量まで待てば通す
+    bucket.level = 0
+    assert bucket.wait_time(100) == pytest.approx(10)
+
+
+def test_unknown_provider_is_not_limited():
+    scheduler = Scheduler({})
+    started = time.monotonic()
+    scheduler.acquire("openai", tokens=10 ** 9)
+    assert time.monotonic() - started < 0.05
+
+
+def test_acquire_takes_from_both_buckets():
+    scheduler = Scheduler({"openai": {"rpm": 600, "tpm": 60000}})
+    scheduler.acquire("openai", tokens=1000)
+    row = stats_for(scheduler, "openai", "interactive")
+    assert row["granted"] == 1
+    assert row["requests_available"] == pytest.approx(99, abs=0.1)
+    assert row["tokens_available"] == pytest.approx(9000, abs=10)
+
+
+def test_debit_can_overdraw_tokens():
+    scheduler = Scheduler({"openai": {"tpm": 6000}})
+    scheduler.debit("openai", 1500)
+    assert stats_for(scheduler, "openai", "batch")["tokens_available"] < 0
+
+
+def test_interactive_calls_overtake_waiting_batch_calls():
+    scheduler = Scheduler({"openai": {"rpm": 6000}})
+    scheduler._lanes["openai"].blocked_until = time.monotonic() + 0.3
+    order = []
+
+    def run(level, name):
+        with priority(level):
+            scheduler.acquire("openai")
+        order.append(name)
+
+    batch = threading.Thread(target=run, args=(BATCH, "batch"))
+    batch.start()
+    time.sleep(0.05)
+    interactive = threading.Thread(target=run, args=(INTERACTIVE, "interactive"))
+    interactive.start()
+    batch.join(2)
+    interactive.join(2)
+    assert order == ["interactive", "batch"]
+
+
+def test_call_retries_rate_limited_calls():
+    scheduler = Scheduler({"openai": {"rpm": 6000}}, backoff_base=0.01)
+    attempts = []
+
+    def fn():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise RateLimitError({"retry-after-ms": "10"})
+        return "ok"
+
+    assert scheduler.call("openai", fn) == "ok"
+    assert len(attempts) == 3
+    row = stats_for(scheduler, "openai", "interactive")
+    assert row["rate_limited"] == 2
+    assert row["retries"] == 2
+
+
+def test_call_gives_up_after_max_retries_and_on_other_errors():
+    scheduler = Scheduler({}, backoff_base=0.001)
+    with pytest.raises(RateLimitError):
+        scheduler.call("openai", lambda: (_ for _ in ()).throw(RateLimitError()), max_retries=1)
+    calls = []
+
+    def fail():
+        calls.append(1)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        scheduler.call("openai", fail)
+    assert len(calls) == 1
+
+
+def test_penalize_blocks_the_provider():
+    scheduler = Scheduler({"openai": {"rpm": 6000}})
+    assert scheduler.penalize("openai", RateLimitError({"retry-after": "0.2"})) == 0.2
+    assert stats_for(scheduler, "openai", "interactive")["blocked_sec"] > 0.1
+    started = time.monotonic()
+    scheduler.acquire("openai")
+    assert time.monotonic() - started >= 0.15
+
+
+def test_acall_retries_rate_limited_calls():
+    scheduler = Scheduler({"openai": {"rpm": 6000}}, backoff_base=0.01)
+    attempts = []
+
+    async def fn():
+        attempts.append(1)
+        if len(attempts) < 2:
+            raise RateLimitError({"retry-after-ms": "10"})
+        return "ok"
+
+    assert asyncio.run(scheduler.acall("openai", fn)) == "ok"
+    assert len(attempts) == 2
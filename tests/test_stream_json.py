@@ -0,0 +1,66 @@
+import json
+
+import pytest
+
+from stream_json import IncrementalJsonParser, lenient_loads
+
+WATCH = {("candidates", "*"): "candidate", ("推奨アクション",): "actions"}
+
+RESPONSE = json.dumps({
+    "candidates": [
+        {"要員ID": "Y1", "要員情報": {"スキル": "Java {Spring} [5年]"}, "マッチ度": 90},
+        {"要員ID": "Y2", "理由コメント": "引用符 \" とバックスラッシュ \\ を含む", "マッチ度": 80},
+    ],
+    "推奨アクション": ["面談を設定", "単価を確認"],
+}, ensure_ascii=False)
+
+
+def feed_in_pieces(parser, text, size):
+    events = []
+    for start in range(0, len(text), size):
+        events.extend(parser.feed(text[start:start + size]))
+    return events
+
+
+@pytest.mark.parametrize("size", [1, 3, 7, 1000])
+def test_emits_each_watched_value_when_it_closes(size):
+    events = feed_in_pieces(IncrementalJsonParser(WATCH), RESPONSE, size)
+    expected = json.loads(RESPONSE)
+    assert events == [
+        ("candidate", 0, expected["candidates"][0]),
+        ("candidate", 1, expected["candidates"][1]),
+        ("actions", None, expected["推奨アクション"]),
+    ]
+
+
+def test_candidate_is_emitted_before_the_response_ends():
+    parser = IncrementalJsonParser(WATCH)
+    first_end = RESPONSE.index("}, {") + 1
+    events = parser.feed(RESPONSE[:first_end])
+    assert [(name, index) for name, index, _ in events] == [("candidate", 0)]
+    assert not parser.done
+
+
+def test_skips_code_fence_and_stops_after_top_level_object():
+    parser = IncrementalJsonParser(WATCH)
+    events = parser.feed("```json\n" + RESPONSE + "\n```\n{\"candidates\": [{}]}")
+    assert parser.done
+    assert [index for name, index, _ in events if name == "candidate"] == [0, 1]
+
+
+def test_repairs_trailing_and_missing_commas():
+    parser = IncrementalJsonParser({("candidates", "*"): "candidate"})
+    events = parser.feed('{"candidates": [{"要員ID": "Y1",\n "マッチ度": 90,}, {"要員ID": "Y2"\n "マッチ度": 70}]}')
+    assert [value for _, _, value in events] == [{"要員ID": "Y1", "マッチ度": 90}, {"要員ID": "Y2", "マッチ度": 70}]
+
+
+def test_unreadable_value_is_skipped():
+    parser = IncrementalJsonParser({("candidates", "*"): "candidate"})
+    events = parser.feed('{"candidates": [{"要員ID": Y1}, {"要員ID": "Y2"}]}')
+    assert events == [("candidate", 1, {"要員ID": "Y2"})]
+
+
+def test_lenient_loads_raises_when_repair_is_not_enough():
+    assert lenient_loads('{"a": 1,}') == {"a": 1}
+    with pytest.raises(json.JSONDecodeError):
+        lenient_loads('{"a": }')
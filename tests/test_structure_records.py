@@ -0,0 +1,55 @@
+import threading
+import time
+
+import pytest
+
+import job_matching_flow
+from job_matching_flow import structure_records
+
+
+@pytest.fixture(autouse=True)
+def no_llm(monkeypatch):
+    monkeypatch.setattr(job_matching_flow, "get_llm", lambda *args, **kwargs: None)
+
+
+def test_keeps_input_order_under_concurrency():
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    def structure(text, record):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        # 後のレコードほど早く終わる
+        time.sleep(0.002 * (20 - record["id"]))
+        with lock:
+            active[0] -= 1
+        return {"id": record["id"], "text": text}
+
+    records = ({"id": i} for i in range(20))
+    results = list(structure_records(records, lambda record: f"R{record['id']}", structure, concurrency=4, label="test"))
+    assert [record["id"] for record, _ in results] == list(range(20))
+    assert [structured["text"] for _, structured in results] == [f"R{i}" for i in range(20)]
+    assert 1 < peak[0] <= 4
+
+
+def test_one_failure_becomes_error_and_the_rest_continue():
+    def structure(text, record):
+        if record["id"] == 2:
+            raise ValueError("invalid JSON")
+        return {"id": record["id"]}
+
+    stats = {}
+    results = list(structure_records([{"id": i} for i in range(5)], str, structure, concurrency=2, label="test",
+                                     stats=stats))
+    assert [structured for _, structured in results] == [
+        {"id": 0}, {"id": 1}, {"error": "Structuring failed: invalid JSON", "raw_response": ""}, {"id": 3}, {"id": 4}
+    ]
+    assert (stats["processed"], stats["succeeded"], stats["failed"]) == (5, 4, 1)
+    assert stats["concurrency"] == 2
+
+
+def test_empty_input_reports_zero_stats():
+    stats = {}
+    assert list(structure_records([], str, lambda text, record: {}, concurrency=3, label="test", stats=stats)) == []
+    assert (stats["processed"], stats["succeeded"], stats["failed"]) == (0, 0, 0)
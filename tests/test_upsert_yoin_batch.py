@@ -0,0 +1,44 @@
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import job_matching_flow
+import timing
+from job_matching_flow import upsert_yoin_batch
+
+
+class FakeIndex:
+    def __init__(self):
+        self.calls = []
+
+    def upsert(self, vectors, namespace=None):
+        self.calls.append((list(vectors), namespace))
+
+
+class FakePinecone:
+    """PineconeVectorStore のうち upsert_yoin_batch が使う属性だけを持つ"""
+
+    def __init__(self):
+        self.index = FakeIndex()
+        self.embeddings = DeterministicFakeEmbedding(size=4)
+
+
+def documents(count):
+    return [{"id": f"Y{i}", "text": f"要員{i}", "metadata": {"work_style": "常駐"}} for i in range(count)]
+
+
+def test_upserts_in_chunks_with_text_metadata(monkeypatch):
+    monkeypatch.setattr(job_matching_flow, "INDEX_UPSERT_CHUNK", 2)
+    monkeypatch.setattr(job_matching_flow, "PINECONE_NAMESPACE", "yoin")
+    store = FakePinecone()
+    assert upsert_yoin_batch(store, documents(5)) == 5
+    assert [len(vectors) for vectors, _ in store.index.calls] == [2, 2, 1]
+    assert all(namespace == "yoin" for _, namespace in store.index.calls)
+    doc_id, vector, metadata = store.index.calls[0][0][0]
+    assert doc_id == "Y0" and len(vector) == 4
+    assert metadata == {"work_style": "常駐", "text": "要員0"}
+
+
+def test_embedding_and_upsert_are_timed_separately():
+    timings = timing.start()
+    upsert_yoin_batch(FakePinecone(), documents(3))
+    names = [span["name"] for span in timings.report()["spans"]]
+    assert names == ["index_embedding", "index_upsert", "index_batch"]
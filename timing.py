@@ -0,0 +1,120 @@
+"""
+処理段階ごとの所要時間の計測（リクエスト・フロー単位）
+
+    timings = timing.start()          # 以降の span はこの Timings に記録される
+    with timing.span("vector_search"):
+        ...
+    timings.report()                  # [{"name", "ms", "count"}] と合計
+    timings.server_timing()           # Server-Timing ヘッダの値
+
+計測対象は contextvars で受け渡すため、関数の引数を増やさずに深い階層からも記録できる。
+スレッドプールで実行する処理は submit_with_context でコンテキストを引き継ぐ。
+start() していない場合の span は add_observer で登録した関数（メトリクス）にだけ渡す。
+"""
+
+import contextvars
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+_current: contextvars.ContextVar = contextvars.ContextVar("timings", default=None)
+
+
+class Timings:
+    """段階名ごとの合計時間（ms）と回数。同じ名前を複数回計測した場合は合算する"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._spans: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, name: str, ms: float):
+        with self._lock:
+            entry = self._spans.setdefault(name, [0.0, 0])
+            entry[0] += ms
+            entry[1] += 1
+
+    @contextmanager
+    def span(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - started) * 1000)
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def get(self, name: str) -> Optional[float]:
+        with self._lock:
+            entry = self._spans.get(name)
+            return round(entry[0], 1) if entry else None
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = [{"name": name, "ms": round(ms, 1), "count": count} for name, (ms, count) in self._spans.items()]
+        return {"spans": spans, "total_ms": round(self.elapsed_ms(), 1)}
+
+    def server_timing(self) -> str:
+        """Server-Timing ヘッダの値（例: "query_embedding;dur=120.5, vector_search;dur=80.1, total;dur=2300.0"）"""
+        report = self.report()
+        entries = [f"{_token(span['name'])};dur={span['ms']}" for span in report["spans"]]
+        entries.append(f"total;dur={report['total_ms']}")
+        return ", ".join(entries)
+
+
+def _token(name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", name)
+
+
+def start() -> Timings:
+    """現在のコンテキストで新しい計測を始める"""
+    timings = Timings()
+    _current.set(timings)
+    return timings
+
+
+def current() -> Optional[Timings]:
+    return _current.get()
+
+
+_observers: List[Callable[[str, float], None]] = []
+
+
+def add_observer(observer: Callable[[str, float], None]):
+    """すべての段階の所要時間（計測中かどうかに関係なく）を受け取る関数を登録する（メトリクス用）"""
+    _observers.append(observer)
+
+
+def _notify(name: str, ms: float):
+    for observer in _observers:
+        observer(name, ms)
+
+
+@contextmanager
+def span(name: str):
+    """現在の計測に段階の所要時間を記録する（計測中でなく、observer もなければ何もしない）"""
+    timings = _current.get()
+    if timings is None and not _observers:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, (time.perf_counter() - started) * 1000)
+
+
+def record(name: str, ms: float):
+    timings = _current.get()
+    if timings is not None:
+        timings.add(name, ms)
+    _notify(name, ms)
+
+
+def submit_with_context(executor, fn, *args, **kwargs):
+    """executor.submit と同じだが、現在の計測コンテキストを引き継いで実行する"""
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)